@@ -69,6 +69,12 @@ class VirtTestOptionsProcess(object):
         # common section
         set_opt_from_settings(self.config, "vt.common", "data_dir", default=None)
         set_opt_from_settings(self.config, "vt.common", "tmp_dir", default="")
+        set_opt_from_settings(
+            self.config, "vt.common", "cartesian_cache_dir", default=""
+        )
+        set_opt_from_settings(
+            self.config, "vt.common", "cartesian_jobs", key_type=int, default=1
+        )
         set_opt_from_settings(
             self.config, "vt.common", "type_specific", key_type=bool, default=False
         )
@@ -545,7 +551,11 @@ class VirtTestOptionsProcess(object):
                     % (vt_type_setting, vt_type, " ".join(SUPPORTED_TEST_TYPES))
                 )
 
-        self.cartesian_parser = cartesian_config.Parser(debug=False)
+        self.cartesian_parser = cartesian_config.Parser(
+            debug=False,
+            cache_dir=get_opt(self.config, "vt.common.cartesian_cache_dir") or None,
+            jobs=get_opt(self.config, "vt.common.cartesian_jobs") or 1,
+        )
 
         if vt_config:
             cfg = os.path.abspath(vt_config)
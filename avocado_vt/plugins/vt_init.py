@@ -185,6 +185,27 @@ if hasattr(plugin_interfaces, "Init"):
             )
             settings.register_option(section, "tmp_dir", help_msg=help_msg, default="")
 
+            help_msg = (
+                "Directory where the parsed cartesian config trees are "
+                "cached. Cached trees are invalidated when any of the "
+                "included files changes. By default the cache is disabled."
+            )
+            settings.register_option(
+                section, "cartesian_cache_dir", help_msg=help_msg, default=""
+            )
+
+            help_msg = (
+                "Number of processes used to expand the cartesian config "
+                "variants. By default the variants are expanded serially."
+            )
+            settings.register_option(
+                section,
+                "cartesian_jobs",
+                help_msg=help_msg,
+                key_type=int,
+                default=1,
+            )
+
             help_msg = (
                 "Enable only type specific tests. Shared tests will " "not be tested"
             )
@@ -310,6 +331,16 @@ if hasattr(plugin_interfaces, "Init"):
                 section, "malloc_perturb", help_msg=help_msg, default="yes"
             )
 
+            help_msg = (
+                "Directory where the capabilities probed from the qemu "
+                "binaries are cached. Cached capabilities are invalidated "
+                "when the binary changes. By default they are only reused "
+                "within the same process."
+            )
+            settings.register_option(
+                section, "capabilities_cache_dir", help_msg=help_msg, default=""
+            )
+
             # [vt.libvirt] section
             section = "vt.libvirt"
 
@@ -12,33 +12,64 @@ except ImportError:
     from avocado.core.nrunner.runnable import Runnable
 
 
+# Cartesian attributes that are not scalars, and will not be used in the
+# context of nrunner
+_NON_RUNNABLE_PARAMS = frozenset(("_name_map_file", "_short_name_map_file", "dep"))
+
+
 class VTResolverUtils(DiscoveryMixIn):
+    # Parser of the cartesian config, shared by all the references
+    _cartesian_parser = None
+
     def __init__(self, config):
         self.config = config or settings.as_dict()
 
     def _parameters_to_runnable(self, params):
+        """
+        Build the runnable of a cartesian config dict.
+
+        The dict is flattened straight into the runnable kwargs, so the
+        parameters are copied only once and the (possibly shared) dict
+        given is left untouched, apart from its "id".
+
+        :param params: cartesian config parameters
+        :type params: dict
+        """
         params = self.convert_parameters(params)
         uri = params.get("name")
         vt_params = params.get("vt_params")
+        return Runnable(
+            "avocado-vt",
+            uri,
+            **{
+                key: value
+                for key, value in vt_params.items()
+                if key not in _NON_RUNNABLE_PARAMS
+            },
+        )
+
+    def _iter_runnables(self, reference):
+        """
+        Generate the runnables matching a reference.
 
-        # Flatten the vt_params, discarding the attributes that are not
-        # scalars, and will not be used in the context of nrunner
-        for key in ("_name_map_file", "_short_name_map_file", "dep"):
-            if key in vt_params:
-                del vt_params[key]
-
-        return Runnable("avocado-vt", uri, **vt_params)
-
-    def _get_reference_resolution(self, reference):
-        cartesian_parser = self._get_parser()
-        self._save_parser_cartesian_config(cartesian_parser)
-
+        The cartesian config is parsed only once per resolver. Each
+        reference is applied as an 'only' filter to a copy of that parser,
+        so the variants it doesn't match are pruned while expanding, and
+        every dict is converted as soon as the parser expands it.
+        """
+        if self._cartesian_parser is None:
+            self._cartesian_parser = self._get_parser()
+            self._save_parser_cartesian_config(self._cartesian_parser)
+        cartesian_parser = self._cartesian_parser.copy()
         if reference != "":
             cartesian_parser.only_filter(reference)
+        for params in cartesian_parser.get_dicts():
+            yield self._parameters_to_runnable(params)
 
-        runnables = [
-            self._parameters_to_runnable(d) for d in cartesian_parser.get_dicts()
-        ]
+    def _get_reference_resolution(self, reference):
+        # Avocado iterates the resolutions more than once, so they are
+        # collected in a list; only the runnables are kept, not the dicts
+        runnables = list(self._iter_runnables(reference))
         if runnables:
             if (
                 self.config.get(
@@ -2,7 +2,9 @@
 
 import gzip
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 # simple magic for using scripts within a source tree
@@ -1374,6 +1376,194 @@ class CartesianConfigTest(unittest.TestCase):
             "testcfg.huge/test1.cfg", "testcfg.huge/test1.cfg.repr.gz"
         )
 
+    def testParseCache(self):
+        cachedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cachedir)
+        cfgdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cfgdir)
+        main_cfg = os.path.join(cfgdir, "main.cfg")
+        included_cfg = os.path.join(cfgdir, "included.cfg")
+        with open(main_cfg, "w") as f:
+            f.write("include included.cfg\nvariants:\n    - a:\n    - b:\n")
+        with open(included_cfg, "w") as f:
+            f.write("x = 1\n")
+
+        parser = cartesian_config.Parser(main_cfg, cache_dir=cachedir)
+        reference = list(parser.get_dicts())
+        self.assertEqual(len(os.listdir(cachedir)), 1)
+
+        # Cached tree produces the same dicts
+        parser = cartesian_config.Parser(main_cfg, cache_dir=cachedir)
+        self.assertEqual(list(parser.get_dicts()), reference)
+
+        # Changing an included file invalidates the cached tree
+        with open(included_cfg, "w") as f:
+            f.write("x = 22\n")
+        parser = cartesian_config.Parser(main_cfg, cache_dir=cachedir)
+        self.assertEqual([d["x"] for d in parser.get_dicts()], ["22", "22"])
+        parser = cartesian_config.Parser(main_cfg, cache_dir=cachedir)
+        self.assertEqual([d["x"] for d in parser.get_dicts()], ["22", "22"])
+
+        # Trees parsed on top of previous statements are not cached
+        parser = cartesian_config.Parser(cache_dir=cachedir)
+        parser.parse_string("y = 2")
+        parser.parse_file(main_cfg)
+        self.assertEqual([d["y"] for d in parser.get_dicts()], ["2", "2"])
+
+    def testSharedLeafContent(self):
+        p = cartesian_config.Parser()
+        p.parse_string(
+            """
+            x = 1
+            x += ${x}
+            variants:
+                - a:
+                    y = ${x}a
+                - b:
+                    y = ${x}b
+            variants:
+                - c:
+                    z = ${shortname}
+                - d:
+                    z = ${y}
+            """
+        )
+        dicts = list(p.get_dicts())
+        self.assertEqual(
+            [(d["name"], d["x"], d["y"], d["z"]) for d in dicts],
+            [
+                ("c.a", "11", "11a", "c.a"),
+                ("c.b", "11", "11b", "c.b"),
+                ("d.a", "11", "11a", "11a"),
+                ("d.b", "11", "11b", "11b"),
+            ],
+        )
+        # Values modified in place must not be shared between dicts
+        self.assertEqual(
+            [d["_name_map_file"]["<string>"] for d in dicts],
+            ["c.a", "c.b", "d.a", "d.b"],
+        )
+
+    def testParserCopy(self):
+        config = """
+            variants guest_os:
+                - Fedora:
+                    variants:
+                        - 17:
+                        - 18:
+                - RHEL:
+            variants:
+                - qcow2:
+                - raw:
+            variants:
+                - boot:
+                - migrate:
+            """
+        for defaults, extra in ((False, ""), (True, ""), (False, "join qcow2 raw")):
+            base = cartesian_config.Parser(defaults=defaults)
+            base.parse_string(config + extra)
+            for variant in (
+                "(guest_os=Fedora).17",
+                "Fedora.18..raw",
+                "RHEL..migrate, qcow2.boot",
+                "(guest_os=RHEL).17",
+            ):
+                p = cartesian_config.Parser(defaults=defaults)
+                p.parse_string(config + extra)
+                p.only_filter(variant)
+                copy = base.copy()
+                copy.only_filter(variant)
+                self.assertEqual(list(copy.get_dicts()), list(p.get_dicts()))
+                self.assertEqual(copy.only_filters, ["only %s" % variant])
+            # The filters applied to the copies don't change the parser
+            p = cartesian_config.Parser(defaults=defaults)
+            p.parse_string(config + extra)
+            self.assertEqual(list(base.get_dicts()), list(p.get_dicts()))
+            self.assertEqual(base.only_filters, [])
+
+    def testIndexedFilter(self):
+        config = """
+            variants:
+                - qcow2:
+                - raw:
+            variants:
+                - virtio_blk:
+                - ide:
+            variants:
+                - boot:
+                    raw:
+                        only ide
+                - migrate:
+                - reboot:
+            """
+        for lfilter, names in (
+            ("only boot.virtio_blk.qcow2", ["boot.virtio_blk.qcow2"]),
+            (
+                "only raw..boot, migrate.ide",
+                ["boot.ide.raw", "migrate.ide.qcow2", "migrate.ide.raw"],
+            ),
+            ("only raw.nonexist", []),
+            ("no boot, migrate\nonly ide", ["reboot.ide.qcow2", "reboot.ide.raw"]),
+        ):
+            p = cartesian_config.Parser()
+            p.parse_string(config)
+            p.parse_string(lfilter)
+            self.assertEqual([d["name"] for d in p.get_dicts()], names)
+
+    def testIndexSharedByCopies(self):
+        config = """
+            variants:
+                - qcow2:
+                - raw:
+            variants:
+                - virtio_blk:
+                - ide:
+            variants:
+                - boot:
+                - migrate:
+            join qcow2 raw
+            only boot
+            """
+        p = cartesian_config.Parser()
+        p.parse_string(config)
+        index = p._get_children_index(p.node)
+        copy = cartesian_config._copy_node(p.node)
+        self.assertIs(p._get_children_index(copy), index)
+        names = [d["name"] for d in p.get_dicts()]
+        indexed = len(p._children_index)
+        # Expanding the joins again reuses the indexes of the copied nodes
+        self.assertEqual([d["name"] for d in p.get_dicts()], names)
+        self.assertEqual(len(p._children_index), indexed)
+
+    def testParallelExpansion(self):
+        configpath = os.path.join(testdatadir, "testcfg.huge/test1.cfg")
+        for defaults in (False, True):
+            serial = cartesian_config.Parser(configpath, defaults=defaults)
+            parallel = cartesian_config.Parser(configpath, defaults=defaults, jobs=3)
+            self._checkDictionaries(parallel, list(serial.get_dicts()))
+
+        config = """
+            variants:
+                - a1:
+                    x = 1
+                - a2:
+                    x = 2
+            variants tests:
+                - t1:
+                    join a1 a2
+                - @t2:
+                    only a1
+            variants:
+                - b1:
+                - b2:
+            join b1 b2
+            """
+        serial = cartesian_config.Parser()
+        serial.parse_string(config)
+        parallel = cartesian_config.Parser(jobs=2)
+        parallel.parse_string(config)
+        self._checkDictionaries(parallel, list(serial.get_dicts()))
+
 
 if __name__ == "__main__":
     unittest.main()
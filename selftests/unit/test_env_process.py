@@ -1,11 +1,18 @@
+import os
 import re
+import shutil
 import sys
+import tempfile
+import threading
 
 if sys.version_info[:2] == (2, 6):
     import unittest2 as unittest
 else:
     import unittest
 
+from six.moves import queue
+
+from virttest import env_process, ppm_utils, utils_params
 from virttest.env_process import QEMU_VERSION_RE
 
 
@@ -34,3 +41,176 @@ class QEMUVersion(unittest.TestCase):
         for version, expected in list(versions_expected.items()):
             match = re.match(QEMU_VERSION_RE, version)
             self.assertEqual(match.groups(), expected)
+
+
+class ProcessImages(unittest.TestCase):
+    def setUp(self):
+        self.params = utils_params.Params(
+            {
+                "images": "image1 sn1 stg1 stg2 stg3",
+                "image_name": "images/os",
+                "image_name_sn1": "images/sn1",
+                "image_name_stg1": "images/stg1",
+                "image_name_stg2": "images/stg2",
+                "image_name_stg3": "images/stg1",
+                "image_chain_sn1": "image1 sn1",
+                "image_size": "20G",
+                "image_size_stg2": "100G",
+            }
+        )
+
+    def test_group_images(self):
+        self.assertEqual(
+            env_process._group_images(self.params.objects("images"), self.params),
+            [["image1", "sn1"], ["stg1", "stg3"], ["stg2"]],
+        )
+
+    def test_parallel(self):
+        processed = []
+        lock = threading.Lock()
+
+        def image_func(test, params, image_name, vm_process_status):
+            with lock:
+                processed.append(image_name)
+
+        self.params["image_process_workers"] = "0"
+        env_process.process_images(image_func, None, self.params)
+        self.assertEqual(sorted(processed), sorted(self.params.objects("images")))
+        self.assertLess(processed.index("image1"), processed.index("sn1"))
+        self.assertLess(processed.index("stg1"), processed.index("stg3"))
+
+    def test_default(self):
+        threads = {}
+
+        def image_func(test, params, image_name, vm_process_status):
+            threads[image_name] = threading.current_thread()
+
+        # Few images are processed one by one when the workers are not set
+        env_process.process_images(image_func, None, self.params)
+        self.assertEqual(sorted(threads), sorted(self.params.objects("images")))
+        self.assertEqual(set(threads.values()), {threading.current_thread()})
+
+        # Many images are processed in parallel, chains still in one thread
+        threads.clear()
+        images = self.params.objects("images")
+        for index in range(2, 22):
+            images.append("image%d" % index)
+            self.params["image_name_image%d" % index] = "images/os%d" % index
+        self.params["images"] = " ".join(images)
+        env_process.process_images(image_func, None, self.params)
+        self.assertEqual(len(threads), 25)
+        self.assertNotIn(threading.current_thread(), threads.values())
+        self.assertIs(threads["image1"], threads["sn1"])
+        self.assertIs(threads["stg1"], threads["stg3"])
+
+    def test_failure(self):
+        def image_func(test, params, image_name, vm_process_status):
+            if image_name == "stg2":
+                raise ValueError(image_name)
+
+        self.params["image_process_workers"] = "2"
+        self.assertRaises(
+            ValueError, env_process.process_images, image_func, None, self.params
+        )
+
+
+class FakeScreendumpVM(object):
+    def __init__(self, name):
+        self.name = name
+        self.instance = "instance-%s" % name
+        self.params = utils_params.Params()
+        self.bsod_checks = []
+
+    def is_alive(self):
+        return True
+
+    def verify_bsod(self, scrdump_file, scrdump_hash=None):
+        self.bsod_checks.append(scrdump_hash)
+
+    def get_pid(self):
+        return 1234
+
+    def screendump(self, filename, debug=True):
+        with open(filename, "wb") as ppm:
+            ppm.write(b"P6\n2 2\n255\n" + b"\x00" * 12)
+
+
+class FakeScreendumpEnv(object):
+    def __init__(self, vms):
+        self.vms = vms
+
+    def get_all_vms(self):
+        return self.vms
+
+
+class FakeScreendumpTest(object):
+    def __init__(self, debugdir):
+        self.debugdir = debugdir
+        self.bindir = debugdir
+        self.iteration = 1
+        self.background_errors = queue.Queue()
+
+
+class TakeScreendumps(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="screendumps_")
+        self.temp_dir = os.path.join(self.tmpdir, "temp")
+        self.params = utils_params.Params(
+            {
+                "screendump_temp_dir": self.temp_dir,
+                "screendump_workers": "2",
+                "screendump_queue_size": "1",
+            }
+        )
+        self.env = FakeScreendumpEnv(
+            [FakeScreendumpVM("vm%d" % index) for index in range(5)]
+        )
+
+    def tearDown(self):
+        env_process._screendump_thread_termination_event = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_single_pass(self):
+        # A set termination event stops the capture loop after one pass
+        event = threading.Event()
+        event.set()
+        env_process._screendump_thread_termination_event = event
+        with self.assertLogs("avocado.virttest.env_process", "INFO") as logs:
+            env_process._take_screendumps(
+                FakeScreendumpTest(self.tmpdir), self.params, self.env
+            )
+        self.assertIsNone(env_process._screendump_thread_termination_event)
+        # Processed and dropped frames are all removed
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        summaries = [
+            record.getMessage()
+            for record in logs.records
+            if record.getMessage().startswith("Screendumps of VM")
+        ]
+        self.assertEqual(len(summaries), 5)
+        for summary in summaries:
+            self.assertIn(": 1 captured", summary)
+
+    def _hash_indexes(self):
+        return [
+            os.path.join(path, name)
+            for path, _, names in os.walk(self.tmpdir)
+            for name in names
+            if name == ".image_hashes"
+        ]
+
+    @unittest.skipIf(ppm_utils.Image is None, "PIL is not installed")
+    def test_bsod_hashes(self):
+        # Screendumps are only hashed for the VMs checked for a BSOD
+        self.env.vms[0].params["check_guest_bsod"] = "yes"
+        event = threading.Event()
+        event.set()
+        env_process._screendump_thread_termination_event = event
+        env_process._take_screendumps(
+            FakeScreendumpTest(self.tmpdir), self.params, self.env
+        )
+        self.assertEqual(len(self.env.vms[0].bsod_checks), 1)
+        self.assertIsNotNone(self.env.vms[0].bsod_checks[0])
+        for vm in self.env.vms[1:]:
+            self.assertEqual(vm.bsod_checks, [])
+        self.assertEqual(len(self._hash_indexes()), 1)
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+import os
+import pickle
+import socket
+import struct
+import sys
+import unittest
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import ip_sniffing
+
+
+class TestAddrCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ip_sniffing.AddrCache()
+        self.cache["52:54:00:12:34:56"] = "192.168.122.10"
+
+    def test_verified(self):
+        self.assertFalse(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.10"))
+        self.cache.mark_verified("52:54:00:12:34:56", "192.168.122.10")
+        self.assertTrue(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.10"))
+        self.assertTrue(
+            self.cache.is_verified("52:54:00:12:34:56".upper(), "192.168.122.10")
+        )
+        self.assertFalse(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.11"))
+
+    def test_expired(self):
+        self.cache.mark_verified("52:54:00:12:34:56", "192.168.122.10", ttl=-1)
+        self.assertFalse(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.10"))
+
+    def test_invalidated(self):
+        self.cache.mark_verified("52:54:00:12:34:56", "192.168.122.10")
+        self.cache["52:54:00:12:34:56"] = "192.168.122.11"
+        self.assertFalse(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.10"))
+        self.cache.mark_verified("52:54:00:12:34:56", "192.168.122.11")
+        self.cache.drop("52:54:00:12:34:56")
+        self.assertFalse(self.cache.is_verified("52:54:00:12:34:56", "192.168.122.11"))
+
+    def test_pickle(self):
+        self.cache.mark_verified("52:54:00:12:34:56", "192.168.122.10")
+        cache = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(cache.get("52:54:00:12:34:56"), "192.168.122.10")
+        self.assertFalse(cache.is_verified("52:54:00:12:34:56", "192.168.122.10"))
+
+
+def _ipv4_udp(dport, payload):
+    header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        28 + len(payload),
+        0,
+        0,
+        64,
+        17,
+        0,
+        socket.inet_aton("192.168.122.1"),
+        socket.inet_aton("255.255.255.255"),
+    )
+    return header + struct.pack("!HHHH", 67, dport, 8 + len(payload), 0) + payload
+
+
+def _ipv6_udp(dport, payload):
+    header = struct.pack(
+        "!IHBB16s16s",
+        0x60000000,
+        8 + len(payload),
+        17,
+        64,
+        socket.inet_pton(socket.AF_INET6, "fe80::1"),
+        socket.inet_pton(socket.AF_INET6, "fe80::5054:ff:fe12:3456"),
+    )
+    return header + struct.pack("!HHHH", 547, dport, 8 + len(payload), 0) + payload
+
+
+def _dhcp(m_type, mac, yiaddr, options=b""):
+    payload = bytearray(240)
+    payload[0:3] = b"\x02\x01\x06"
+    payload[16:20] = socket.inet_aton(yiaddr)
+    payload[28:34] = bytearray(int(byte, 16) for byte in mac.split(":"))
+    payload[236:240] = b"\x63\x82\x53\x63"
+    return bytes(payload) + options + struct.pack("BBB", 53, 1, m_type) + b"\xff"
+
+
+def _dhcp6(m_type, mac, ip):
+    duid = struct.pack("!HH", 3, 1) + bytes(
+        bytearray(int(byte, 16) for byte in mac.split(":"))
+    )
+    iaaddr = socket.inet_pton(socket.AF_INET6, ip) + struct.pack("!II", 100, 200)
+    ia_na = struct.pack("!IIIHH", 1, 0, 0, 5, len(iaaddr)) + iaaddr
+    return (
+        struct.pack("!BBH", m_type, 0, 1)
+        + struct.pack("!HH", 1, len(duid))
+        + duid
+        + struct.pack("!HH", 3, len(ia_na))
+        + ia_na
+    )
+
+
+class TestPacketSniffer(unittest.TestCase):
+    def setUp(self):
+        self.cache = ip_sniffing.AddrCache()
+        self.sniffer = ip_sniffing.PacketSniffer(self.cache, "ip-sniffer.log")
+        self.sniffer._log = lambda line: None
+
+    def test_dhcp_ack(self):
+        packet = _ipv4_udp(68, _dhcp(5, "52:54:00:12:34:56", "192.168.122.10"))
+        self.sniffer._handle_packet(packet)
+        self.assertEqual(self.cache.get("52:54:00:12:34:56"), "192.168.122.10")
+
+    def test_dhcp_pad(self):
+        options = (
+            b"\x00\x00" + struct.pack("!BB4s", 1, 4, b"\xff\xff\xff\x00") + b"\x00"
+        )
+        packet = _ipv4_udp(68, _dhcp(5, "52:54:00:12:34:56", "192.168.122.10", options))
+        self.sniffer._handle_packet(packet)
+        self.assertEqual(self.cache.get("52:54:00:12:34:56"), "192.168.122.10")
+
+    def test_dhcp_end(self):
+        packet = _ipv4_udp(68, _dhcp(5, "52:54:00:12:34:56", "192.168.122.10", b"\xff"))
+        self.sniffer._handle_packet(packet)
+        self.assertIsNone(self.cache.get("52:54:00:12:34:56"))
+
+    def test_dhcp_offer(self):
+        packet = _ipv4_udp(68, _dhcp(2, "52:54:00:12:34:56", "192.168.122.10"))
+        self.sniffer._handle_packet(packet)
+        self.assertIsNone(self.cache.get("52:54:00:12:34:56"))
+
+    def test_dhcp6_reply(self):
+        packet = _ipv6_udp(546, _dhcp6(7, "52:54:00:12:34:56", "fd00::10"))
+        self.sniffer._handle_packet(packet)
+        self.assertEqual(self.cache.get("52:54:00:12:34:56_6"), "fd00::10")
+
+    def test_dhcp6_advertise(self):
+        packet = _ipv6_udp(546, _dhcp6(2, "52:54:00:12:34:56", "fd00::10"))
+        self.sniffer._handle_packet(packet)
+        self.assertIsNone(self.cache.get("52:54:00:12:34:56_6"))
+
+    def test_truncated(self):
+        packet = _ipv4_udp(68, _dhcp(5, "52:54:00:12:34:56", "192.168.122.10"))
+        self.sniffer._handle_packet(packet[:100])
+        self.assertIsNone(self.cache.get("52:54:00:12:34:56"))
+
+
+if __name__ == "__main__":
+    unittest.main()
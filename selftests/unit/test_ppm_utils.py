@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import ppm_utils
+
+
+def _reference_comparison(width, height, data1, data2):
+    newdata = bytearray()
+    for i in range(0, width * height * 3, 3):
+        value1 = sum(bytearray(data1[i : i + 3])) // 3
+        value2 = sum(bytearray(data2[i : i + 3])) // 3
+        value = 128 + (value1 + value2) // 2 // 2
+        if data1[i : i + 3] == data2[i : i + 3]:
+            newdata.extend((0, value, 0))
+        else:
+            newdata.extend((value, 0, 0))
+    return bytes(newdata)
+
+
+class TestPPMOperations(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.width, self.height = 64, 48
+        self.data1 = bytes(
+            bytearray(rand.randint(0, 255) for _ in range(self.width * self.height * 3))
+        )
+        data2 = bytearray(self.data1)
+        # Change one channel of every 7th pixel
+        for pixel in range(0, self.width * self.height, 7):
+            data2[pixel * 3 + pixel % 3] ^= 0xFF
+        self.data2 = bytes(data2)
+        self.equal = self.width * self.height - len(
+            range(0, self.width * self.height, 7)
+        )
+
+    def _both(self, func, *args):
+        """Run func with numpy (if installed) and with the fallback."""
+        numpy = ppm_utils.numpy
+        results = []
+        try:
+            if numpy is not None:
+                results.append(func(*args))
+            ppm_utils.numpy = None
+            results.append(func(*args))
+        finally:
+            ppm_utils.numpy = numpy
+        return results
+
+    def test_crop(self):
+        width, height, data = ppm_utils.image_crop(
+            self.width, self.height, self.data1, 10, 5, 20, 8
+        )
+        self.assertEqual((width, height), (20, 8))
+        expected = b"".join(
+            self.data1[(10 + y * self.width) * 3 : (30 + y * self.width) * 3]
+            for y in range(5, 13)
+        )
+        self.assertEqual(data, expected)
+
+    def test_crop_clipped(self):
+        width, height, data = ppm_utils.image_crop(
+            self.width, self.height, self.data1, 60, 40, 20, 20
+        )
+        self.assertEqual((width, height), (4, 8))
+        self.assertEqual(len(data), 4 * 8 * 3)
+
+    def test_comparison(self):
+        expected = _reference_comparison(
+            self.width, self.height, self.data1, self.data2
+        )
+        for result in self._both(
+            ppm_utils.image_comparison,
+            self.width,
+            self.height,
+            self.data1,
+            self.data2,
+        ):
+            self.assertEqual(result, (self.width, self.height, expected))
+
+    def test_fuzzy_compare(self):
+        expected = self.equal / float(self.width * self.height)
+        for result in self._both(
+            ppm_utils.image_fuzzy_compare,
+            self.width,
+            self.height,
+            self.data1,
+            self.data2,
+        ):
+            self.assertAlmostEqual(result, expected)
+        for result in self._both(
+            ppm_utils.image_fuzzy_compare,
+            self.width,
+            self.height,
+            self.data1,
+            self.data1,
+        ):
+            self.assertEqual(result, 1.0)
+
+
+class TestImageHashIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="ppm_utils_")
+        self.entries = [
+            {"file": "0001.jpg", "size": 1, "mtime": 0, "ahash": 0x0F, "dhash": 0},
+            {"file": "0002.jpg", "size": 1, "mtime": 0, "ahash": 0xFF, "dhash": 0},
+            {"file": "0003.jpg", "size": 1, "mtime": 0, "ahash": 0x0E, "dhash": 0},
+        ]
+        index_path = os.path.join(self.tmpdir, ppm_utils.ImageHashIndex.index_filename)
+        with open(index_path, "w") as index_file:
+            for entry in self.entries:
+                index_file.write(json.dumps(entry) + "\n")
+            # Interrupted append
+            index_file.write('{"file": "0004.jpg", "si')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_similar(self):
+        index = ppm_utils.ImageHashIndex(self.tmpdir)
+        similar = index.find_similar(0x0F, threshold=3)
+        self.assertEqual(
+            similar,
+            [
+                (os.path.join(self.tmpdir, "0001.jpg"), 0),
+                (os.path.join(self.tmpdir, "0003.jpg"), 1),
+            ],
+        )
+        self.assertEqual(index.find_similar(0xF0F0, threshold=3), [])
+
+    def test_refresh_forgets_removed(self):
+        for name in ("0001.jpg", "0002.jpg"):
+            open(os.path.join(self.tmpdir, name), "w").close()
+        index = ppm_utils.ImageHashIndex(self.tmpdir)
+        # Pretend the remaining files were already hashed as they are now
+        for name in ("0001.jpg", "0002.jpg"):
+            stat = os.stat(os.path.join(self.tmpdir, name))
+            index._entries[name].update(size=stat.st_size, mtime=stat.st_mtime)
+        index.refresh()
+        reloaded = ppm_utils.ImageHashIndex(self.tmpdir)
+        self.assertEqual(sorted(reloaded._entries), ["0001.jpg", "0002.jpg"])
+        self.assertEqual(reloaded._entries["0002.jpg"]["ahash"], 0xFF)
+
+    def test_in_memory(self):
+        index_path = os.path.join(self.tmpdir, ppm_utils.ImageHashIndex.index_filename)
+        os.unlink(index_path)
+        index = ppm_utils.ImageHashIndex(
+            self.tmpdir, hash_types=("ahash",), persistent=False
+        )
+        index._entries = dict((entry["file"], entry) for entry in self.entries)
+        index.refresh()
+        self.assertEqual(index._entries, {})
+        self.assertFalse(os.path.exists(index_path))
+
+    def test_have_similar_img_hash(self):
+        refdir = os.path.join(self.tmpdir, "refs")
+        os.mkdir(refdir)
+        with mock.patch.object(ppm_utils, "image_average_hash") as average_hash:
+            self.assertFalse(
+                ppm_utils.have_similar_img("/nonexistent.jpg", refdir, base_img_hash=0)
+            )
+        average_hash.assert_not_called()
+        self.assertEqual(os.listdir(refdir), [])
+
+    def test_have_similar_img_hash_file(self):
+        reference = os.path.join(self.tmpdir, "bsod.jpg")
+        with mock.patch.object(ppm_utils, "image_average_hash") as average_hash:
+            average_hash.return_value = 0xFF
+            self.assertTrue(
+                ppm_utils.have_similar_img(
+                    "/nonexistent.jpg", reference, base_img_hash=0xFE
+                )
+            )
+            self.assertFalse(
+                ppm_utils.have_similar_img(
+                    "/nonexistent.jpg", reference, base_img_hash=0xFF00
+                )
+            )
+        # Only the reference image is hashed
+        self.assertEqual(
+            average_hash.call_args_list, [mock.call(reference), mock.call(reference)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,9 @@ __author__ = """Lukas Doktor (ldoktor@redhat.com)"""
 
 import os
 import re
+import shutil
 import sys
+import tempfile
 import unittest
 
 # simple magic for using scripts within a source tree
@@ -1356,5 +1358,110 @@ fdc
         assert out == exp, (out, exp)
 
 
+class QemuProbesCache(unittest.TestCase):
+    """Tests related to the cache of the probed qemu capabilities"""
+
+    def setUp(self):
+        self.god = mock.mock_god(ut=self)
+        self.tmpdir = tempfile.mkdtemp()
+        self.god.stub_with(
+            qcontainer, "get_settings_value", lambda *args, **kwargs: self.tmpdir
+        )
+        self.god.stub_with(qcontainer, "_qemu_probes_cache", {})
+        self.qemu_binary = os.path.join(self.tmpdir, "qemu-kvm")
+        with open(self.qemu_binary, "w") as qemu_binary:
+            qemu_binary.write("qemu")
+        self.probes = {"qemu_help": QEMU_HELP, "hmp_cmds": ["help", "quit"]}
+
+    def tearDown(self):
+        self.god.unstub_all()
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached_probes(self):
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary))
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes)
+        self.assertEqual(qcontainer._load_qemu_probes(self.qemu_binary), self.probes)
+        # Probes saved by another process are loaded from the disk
+        self.god.stub_with(qcontainer, "_qemu_probes_cache", {})
+        self.assertEqual(qcontainer._load_qemu_probes(self.qemu_binary), self.probes)
+
+    def test_cached_copies(self):
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes)
+        self.probes["hmp_cmds"].append("info")
+        probes = qcontainer._load_qemu_probes(self.qemu_binary)
+        self.assertEqual(probes["hmp_cmds"], ["help", "quit"])
+        probes["hmp_cmds"].append("info")
+        probes = qcontainer._load_qemu_probes(self.qemu_binary)
+        self.assertEqual(probes["hmp_cmds"], ["help", "quit"])
+
+    def test_qmp_crash_workaround(self):
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes, "always")
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary))
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary, "no"))
+        self.assertEqual(
+            qcontainer._load_qemu_probes(self.qemu_binary, "always"), self.probes
+        )
+
+    def test_changed_binary(self):
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes)
+        with open(self.qemu_binary, "a") as qemu_binary:
+            qemu_binary.write(" updated")
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary))
+
+    def test_changed_modules(self):
+        module_dir = os.path.join(self.tmpdir, "modules")
+        os.mkdir(module_dir)
+        self.god.stub_with(os, "environ", {"QEMU_MODULE_DIR": module_dir})
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes)
+        self.assertEqual(qcontainer._load_qemu_probes(self.qemu_binary), self.probes)
+        open(os.path.join(module_dir, "hw-display-virtio-gpu.so"), "w").close()
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary))
+        qcontainer._save_qemu_probes(self.qemu_binary, self.probes)
+        os.unlink(os.path.join(module_dir, "hw-display-virtio-gpu.so"))
+        self.assertIsNone(qcontainer._load_qemu_probes(self.qemu_binary))
+
+    def test_missing_binary(self):
+        qemu_binary = os.path.join(self.tmpdir, "missing")
+        qcontainer._save_qemu_probes(qemu_binary, self.probes)
+        self.assertIsNone(qcontainer._load_qemu_probes(qemu_binary))
+        self.assertEqual(os.listdir(self.tmpdir), ["qemu-kvm"])
+
+
+class QmpIntrospection(unittest.TestCase):
+    """Tests related to the capabilities introspected via QMP"""
+
+    def test_qmp_cmd_args(self):
+        schema = [
+            {"name": "block-stream", "meta-type": "command", "arg-type": "1"},
+            {"name": "query-status", "meta-type": "command", "arg-type": "0"},
+            {"name": "0", "meta-type": "object", "members": []},
+            {"name": "1", "meta-type": "object", "members": [{"name": "device"}]},
+        ]
+        self.assertEqual(
+            qcontainer._get_qmp_cmd_args(schema),
+            {"block-stream": ["device"], "query-status": []},
+        )
+
+    def test_machines_info(self):
+        machines = [
+            {"name": "pc-i440fx-8.2", "alias": "pc", "is-default": True},
+            {"name": "q35"},
+        ]
+        self.assertEqual(
+            qcontainer._get_machines_info(machines),
+            {
+                "pc-i440fx-8.2": "(default)",
+                "pc": "(alias of pc-i440fx-8.2)",
+                "q35": "",
+            },
+        )
+
+    def test_hmp_cmds(self):
+        hmp_cmds = qcontainer._parse_hmp_cmds(QEMU_HMP)
+        self.assertIn("migrate_set_speed", hmp_cmds)
+        self.assertIn("cont", hmp_cmds)
+        self.assertNotIn("The", hmp_cmds)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import qemu_migration, qemu_monitor
+
+
+class FakeMonitor(object):
+    def __init__(self, events, support_events=True):
+        self.events = events
+        self.support_events = support_events
+        self.continued = []
+        self.queries = 0
+
+    def set_migrate_capability(self, state, capability):
+        if not self.support_events:
+            raise qemu_monitor.MonitorNotSupportedMigCapError(capability)
+
+    def clear_event(self, name):
+        pass
+
+    def cmd(self, cmd, args=None, debug=True):
+        self.queries += 1
+        return {
+            "status": "active",
+            "expected-downtime": 300,
+            "ram": {
+                "transferred": self.queries << 20,
+                "remaining": 1 << 30,
+                "total": 2 << 30,
+                "mbps": 800.0,
+                "dirty-pages-rate": 1000,
+                "dirty-sync-count": self.queries,
+            },
+        }
+
+    def migrate_continue(self, state):
+        self.continued.append(state)
+
+    def wait_event(self, name, match=None, timeout=None):
+        for event in self.events:
+            if event["event"] == name and match(event):
+                return event
+
+
+class FakeVM(object):
+    def __init__(self, monitor):
+        self.name = "vm1"
+        self.monitor = monitor
+
+
+def _migration_event(status):
+    return {"event": "MIGRATION", "data": {"status": status}}
+
+
+class TestMigrationTracker(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="qemu_migration_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_wait(self):
+        monitor = FakeMonitor(
+            [
+                _migration_event("setup"),
+                _migration_event("active"),
+                _migration_event("pre-switchover"),
+                _migration_event("completed"),
+            ]
+        )
+        tracker = qemu_migration.MigrationTracker(FakeVM(monitor), interval=0)
+        tracker.start()
+        self.assertTrue(tracker.events_enabled)
+        self.assertEqual(tracker.wait(10), "completed")
+        self.assertEqual(monitor.continued, ["pre-switchover"])
+        tracker.stop()
+        self.assertEqual(tracker.samples, [])
+
+    def test_wait_timeout(self):
+        monitor = FakeMonitor([_migration_event("active")])
+        tracker = qemu_migration.MigrationTracker(FakeVM(monitor), interval=0)
+        tracker.start()
+        self.assertIsNone(tracker.wait(1))
+
+    def test_no_events(self):
+        monitor = FakeMonitor([], support_events=False)
+        tracker = qemu_migration.MigrationTracker(FakeVM(monitor), interval=0)
+        tracker.start()
+        self.assertFalse(tracker.events_enabled)
+
+    def test_samples(self):
+        monitor = FakeMonitor([])
+        tracker = qemu_migration.MigrationTracker(FakeVM(monitor), interval=0.01)
+        tracker.start()
+        tracker.stop()
+        # Stopping again doesn't record anything more
+        samples = len(tracker.samples)
+        tracker.stop()
+        self.assertEqual(len(tracker.samples), samples)
+        self.assertGreaterEqual(samples, 1)
+        self.assertEqual(tracker.samples[-1]["passes"], monitor.queries)
+        csv_path, json_path = tracker.save("migration", self.tmpdir)
+        with open(csv_path) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), samples)
+        self.assertEqual(rows[0]["status"], "active")
+        self.assertEqual(rows[0]["expected_downtime"], "300")
+        with open(json_path) as json_file:
+            data = json.load(json_file)
+        self.assertEqual(data["vm"], "vm1")
+        self.assertEqual(data["samples"], tracker.samples)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
 #!/usr/bin/python
 
+import json
 import os
+import socket
 import sys
+import threading
+import time
 import unittest
+import weakref
 
 # simple magic for using scripts within a source tree
 basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,6 +29,26 @@ class MockMonitor(qemu_monitor.Monitor):
         pass
 
 
+class MockQMPMonitor(qemu_monitor.QMPMonitor):
+    """Dummy QMP monitor reading from one end of a socket pair"""
+
+    def __init__(self, sock):  # pylint: disable=W0231
+        self._socket = sock
+        self._server_closed = False
+        self._pending = []
+        self._events = []
+        self._event_seq = 0
+        self._lock = threading.RLock()
+        self._event_cond = threading.Condition()
+        self._event_reader = None
+
+    def _log_lines(self, log_str):
+        pass
+
+    def __del__(self):
+        pass
+
+
 class InfoNumaTests(unittest.TestCase):
     def testZeroNodes(self):
         d = "0 nodes\n"
@@ -364,5 +389,111 @@ sd0: [not inserted]
                 )
 
 
+class QMPReadObjects(unittest.TestCase):
+    def setUp(self):
+        self.qemu_sock, sock = socket.socketpair()
+        self.monitor = MockQMPMonitor(sock)
+
+    def tearDown(self):
+        self.qemu_sock.close()
+        self.monitor._socket.close()
+
+    def testSplitMessages(self):
+        event = json.dumps({"event": "RESUME"}).encode()
+        response = json.dumps({"return": {}, "id": "abc"}).encode()
+        self.qemu_sock.sendall(event + b"\r\n" + response[:5])
+        # The incomplete response is kept until the rest of it arrives
+        self.assertEqual(self.monitor._read_objects(0), [{"event": "RESUME"}])
+        self.assertEqual(self.monitor._read_objects(0), [])
+        self.qemu_sock.sendall(response[5:] + b"\r\n")
+        self.assertEqual(self.monitor._read_objects(0), [{"return": {}, "id": "abc"}])
+        self.assertEqual(self.monitor._events, [(1, {"event": "RESUME"})])
+        self.assertEqual(self.monitor._pending, [])
+
+    def testBrokenLine(self):
+        self.qemu_sock.sendall(b'{"broken\n{"return": 1}\n')
+        self.assertEqual(self.monitor._read_objects(), [{"return": 1}])
+
+    def testManyMessages(self):
+        events = [{"event": "BLOCK_JOB_READY", "data": {"n": n}} for n in range(5000)]
+        data = b"".join(json.dumps(event).encode() + b"\r\n" for event in events)
+        self.qemu_sock.setblocking(False)
+        received = []
+        while data or len(received) < len(events):
+            try:
+                data = data[self.qemu_sock.send(data) :]
+            except BlockingIOError:
+                pass
+            received += self.monitor._read_objects(0)
+        self.assertEqual(received, events)
+
+
+class QMPWaitEvent(unittest.TestCase):
+    def setUp(self):
+        self.qemu_sock, sock = socket.socketpair()
+        self.monitor = MockQMPMonitor(sock)
+
+    def tearDown(self):
+        self.qemu_sock.close()
+        self.monitor._socket.close()
+
+    def send_event(self, name, delay, **data):
+        event = json.dumps({"event": name, "data": data}).encode() + b"\r\n"
+        timer = threading.Timer(delay, self.qemu_sock.sendall, (event,))
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def testEventReader(self):
+        self.monitor._event_reader = threading.Thread(
+            target=qemu_monitor._read_qmp_events,
+            args=(weakref.ref(self.monitor), 0.1),
+        )
+        self.monitor._event_reader.daemon = True
+        self.monitor._event_reader.start()
+        self.send_event("BLOCK_JOB_COMPLETED", 0.1, device="drive1")
+        self.send_event("BLOCK_JOB_COMPLETED", 0.2, device="drive2")
+        start = time.time()
+        event = self.monitor.wait_event(
+            "BLOCK_JOB_COMPLETED", match={"device": "drive2"}, timeout=10
+        )
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(event["data"], {"device": "drive2"})
+        self.assertEqual(len(self.monitor._events), 2)
+
+    def testWithoutReader(self):
+        self.send_event("RESET", 0.1, guest=True)
+        event = self.monitor.wait_event(
+            "RESET", match=lambda event: event["data"]["guest"], timeout=10
+        )
+        self.assertEqual(event["event"], "RESET")
+
+    def testTimeout(self):
+        self.monitor._events = [(1, {"event": "STOP"})]
+        self.assertIsNone(self.monitor.wait_event("RESUME", timeout=0.1))
+
+    def testClearEvent(self):
+        def clear_and_send():
+            # Removes as many events as arrive, the waiter must see them
+            with self.monitor._lock:
+                self.monitor.clear_event("STOP")
+                self.qemu_sock.sendall(b'{"event": "RESET"}\r\n{"event": "RESUME"}\r\n')
+
+        self.monitor._event_seq = 3
+        self.monitor._events = [
+            (1, {"event": "STOP"}),
+            (2, {"event": "STOP"}),
+            (3, {"event": "RESET"}),
+        ]
+        timer = threading.Timer(0.1, clear_and_send)
+        timer.start()
+        self.addCleanup(timer.join)
+        event = self.monitor.wait_event("RESUME", timeout=5)
+        self.assertEqual(event, {"event": "RESUME"})
+        self.assertEqual(
+            [event["event"] for _, event in self.monitor._events],
+            ["RESET", "RESET", "RESUME"],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+import os
+import sys
+import unittest
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import qemu_vm, utils_params
+
+
+class FakeVM(qemu_vm.VM):
+    """qemu VM building its command line from a couple of params only"""
+
+    def __init__(self, name, params, root_dir):  # pylint: disable=W0231
+        self.name = name
+        self.params = params
+        self.root_dir = root_dir
+        self.devices = None
+
+    def make_create_command(self, name=None, params=None, root_dir=None):
+        if params is None:
+            params = self.params
+        return "qemu -m %s -smp %s" % (params["mem"], params["smp"]), None
+
+    def update_vga_global_default(self, params, migrate=None):
+        pass
+
+    def is_alive(self):
+        return True
+
+
+class NeedsRestart(unittest.TestCase):
+    def setUp(self):
+        self.params = utils_params.Params({"mem": "1024", "smp": "2", "foo": "1"})
+        self.vm = FakeVM("vm1", self.params.copy(), "/tmp")
+        self.vm._make_recorded_create_command()
+
+    def test_fingerprint(self):
+        # Params the command line doesn't read don't matter
+        params = self.params.copy()
+        params["foo"] = "2"
+        self.assertEqual(
+            self.vm.params_record.fingerprint(params), self.vm.params_fingerprint
+        )
+
+    def test_changed_params(self):
+        params = self.params.copy()
+        params["mem"] = "2048"
+        self.assertTrue(self.vm.needs_restart("vm1", params, "/tmp"))
+
+    def test_recreated_with_changed_params(self):
+        # A test changes vm.params in place and calls create() again
+        self.vm.params["mem"] = "4096"
+        self.vm._make_recorded_create_command()
+        self.assertTrue(self.vm.needs_restart("vm1", self.params, "/tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 #!/usr/bin/python
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
+from unittest import mock
 
 # simple magic for using scripts within a source tree
 basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -93,5 +96,105 @@ class RemoteFileTest(unittest.TestCase):
         self.assertEqual(test_data, self.default_data)
 
 
+class SSHMultiplexerTest(unittest.TestCase):
+    def setUp(self):
+        self.control_dir = tempfile.mkdtemp(prefix="mux", dir="/tmp")
+        self.multiplexer = remote.SSHMultiplexer(self.control_dir, "vm1-instance")
+
+    def tearDown(self):
+        shutil.rmtree(self.control_dir)
+
+    def test_control_path(self):
+        path = self.multiplexer.control_path("10.0.0.2", 22, "root")
+        self.assertEqual(path, self.multiplexer.control_path("10.0.0.2", 22, "root"))
+        self.assertNotEqual(path, self.multiplexer.control_path("10.0.0.2", 22, "user"))
+        self.assertEqual(os.path.dirname(path), self.control_dir)
+        options = self.multiplexer.ssh_options("10.0.0.2", 22, "root")
+        self.assertIn("-o ControlMaster=auto", options)
+        self.assertIn("-o ControlPath=%s " % path, options)
+        self.assertIn("-o ControlPersist=600", options)
+
+    def test_control_path_too_long(self):
+        multiplexer = remote.SSHMultiplexer("/tmp/" + "x" * 100, "vm1-instance")
+        self.assertIsNone(multiplexer.control_path("10.0.0.2", 22, "root"))
+        self.assertEqual(multiplexer.ssh_options("10.0.0.2", 22, "root"), "")
+
+    def test_copy(self):
+        path = self.multiplexer.control_path("10.0.0.2", 22, "root")
+        with mock.patch.object(remote, "remote_copy") as remote_copy:
+            self.multiplexer.copy_files_to(
+                "10.0.0.2", "scp", "root", "pass", 22, "/tmp/a b", "/root/", timeout=30
+            )
+            self.multiplexer.copy_files_from(
+                "10.0.0.2", "rsync", "root", "pass", 22, "/root/c", "/tmp/", limit=10
+            )
+        scp, rsync = [c[0][0] for c in remote_copy.call_args_list]
+        self.assertTrue(scp.startswith("scp -r "))
+        self.assertIn("ControlPath=%s " % path, scp)
+        self.assertTrue(scp.endswith(r"'/tmp/a b' root@\[10.0.0.2\]:/root/"))
+        self.assertEqual(remote_copy.call_args_list[0][0][1], ["pass"])
+        self.assertEqual(remote_copy.call_args_list[0][1]["login_timeout"], 30)
+        self.assertIn("-e 'ssh -p 22 -o ControlMaster=auto", rsync)
+        self.assertIn("--bwlimit=10", rsync)
+        self.assertTrue(rsync.endswith("root@10.0.0.2:/root/c /tmp/"))
+        self.assertRaises(
+            remote.TransferBadClientError,
+            self.multiplexer.copy_files_to,
+            "10.0.0.2",
+            "rss",
+            "root",
+            "pass",
+            22,
+            "/tmp/a",
+            "/root/",
+        )
+
+    def test_copy_throughput(self):
+        with mock.patch.object(remote, "remote_copy"):
+            with self.assertLogs(remote.LOG, "INFO") as logs:
+                self.multiplexer.copy_files_to(
+                    "10.0.0.2", "scp", "root", "pass", 22, "/tmp/a", "/root/"
+                )
+                self.multiplexer.copy_files_from(
+                    "10.0.0.2",
+                    "scp",
+                    "root",
+                    "pass",
+                    22,
+                    "/root/b",
+                    "/tmp/",
+                    filesize=10,
+                )
+        self.assertIn(
+            "Copy file from /tmp/a to 10.0.0.2:/root/, elapsed", logs.output[0]
+        )
+        self.assertIn(
+            "Copy file from 10.0.0.2:/root/b to /tmp/, estimated throughput",
+            logs.output[1],
+        )
+
+    def test_close(self):
+        paths = [
+            self.multiplexer.control_path("10.0.0.2", 22, "root"),
+            self.multiplexer.control_path("10.0.0.3", 22, "root"),
+            remote.SSHMultiplexer(self.control_dir, "vm2").control_path(
+                "10.0.0.2", 22, "root"
+            ),
+        ]
+        for path in paths:
+            open(path, "w").close()
+        with mock.patch.object(remote.process, "run") as run:
+            self.assertEqual(self.multiplexer.close("10.0.0.3", 22, "root"), 1)
+            self.assertIn("-O stop", run.call_args[0][0])
+            self.assertEqual(self.multiplexer.close("10.0.0.3", 22, "root"), 0)
+            self.assertEqual(self.multiplexer.close(), 1)
+            self.assertIn("-O stop", run.call_args[0][0])
+        self.assertEqual([os.path.exists(path) for path in paths], [False, False, True])
+        open(paths[0], "w").close()
+        with mock.patch.object(remote.process, "run") as run:
+            self.assertEqual(self.multiplexer.close(keep_sessions=False), 1)
+            self.assertIn("-O exit", run.call_args[0][0])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import storage, utils_params
+
+
+class TestImageBackup(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="vt_storage_")
+        self.src = os.path.join(self.tmpdir, "image.qcow2")
+        with open(self.src, "wb") as f:
+            f.write(b"golden image" * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _image(self, **params):
+        image_params = {
+            "image_name": os.path.join(self.tmpdir, "image"),
+            "image_format": "qcow2",
+        }
+        image_params.update(params)
+        return storage.QemuImg(utils_params.Params(image_params), self.tmpdir, "image1")
+
+    def test_copy_data_file(self):
+        dst = os.path.join(self.tmpdir, "image.qcow2.backup")
+        storage.QemuImg.copy_data_file(self.src, dst)
+        with open(self.src, "rb") as fsrc, open(dst, "rb") as fdst:
+            self.assertEqual(fsrc.read(), fdst.read())
+        self.assertFalse(os.path.exists(dst + ".part"))
+
+    def test_reflink_data_file(self):
+        dst = os.path.join(self.tmpdir, "image.qcow2.backup")
+        try:
+            storage.QemuImg.reflink_data_file(self.src, dst)
+        except OSError:
+            # The filesystem doesn't support reflinks, nothing is left behind
+            self.assertEqual(os.listdir(self.tmpdir), ["image.qcow2"])
+        else:
+            with open(self.src, "rb") as fsrc, open(dst, "rb") as fdst:
+                self.assertEqual(fsrc.read(), fdst.read())
+
+    def test_backup_mode(self):
+        image = self._image()
+        self.assertEqual(image.get_backup_mode(image.params), "copy")
+        image = self._image(image_backup_mode="overlay")
+        self.assertEqual(image.get_backup_mode(image.params), "overlay")
+        image = self._image(image_backup_mode="overlay", image_format="raw")
+        self.assertEqual(image.get_backup_mode(image.params), "copy")
+        image = self._image(image_backup_mode="reflink", image_raw_device="yes")
+        self.assertEqual(image.get_backup_mode(image.params), "copy")
+        image = self._image(image_backup_mode="rsync")
+        self.assertRaises(ValueError, image.get_backup_mode, image.params)
+
+    def test_backup_bad_overlay(self):
+        backup_dir = os.path.join(self.tmpdir, "backup")
+        os.mkdir(backup_dir)
+        backup = os.path.join(backup_dir, "image.qcow2.backup")
+        storage.QemuImg.copy_data_file(self.src, backup)
+        image = self._image(image_backup_mode="overlay", backup_dir=backup_dir)
+        with mock.patch.object(
+            image, "is_overlay_of", return_value=True
+        ) as is_overlay_of, mock.patch.object(image, "_run_qemu_img") as run_qemu_img:
+            image.backup_image(image.params, self.tmpdir, "backup", good=False)
+        names = sorted(os.listdir(backup_dir))
+        self.assertEqual(len(names), 3)
+        bad = os.path.join(backup_dir, [n for n in names if ".bad." in n][0])
+        good = os.path.join(backup_dir, [n for n in names if ".good." in n][0])
+        is_overlay_of.assert_called_once_with(image.params, bad, backup)
+        run_qemu_img.assert_called_once_with(
+            image.params, "rebase -u -f qcow2 -F qcow2 -b %s %s" % (good, bad)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 import logging
 import os
+import pickle
 import sys
 import threading
 import time
@@ -48,6 +49,10 @@ class TestEnv(unittest.TestCase):
     def setUp(self):
         self.envfilename = "/dev/shm/EnvUnittest" + self.id()
 
+    def tearDown(self):
+        if os.path.isfile(self.envfilename):
+            os.unlink(self.envfilename)
+
     def test_save(self):
         """
         1) Verify that calling env.save() with no filename where env doesn't
@@ -214,6 +219,32 @@ class TestEnv(unittest.TestCase):
         finally:
             termination_event.set()
 
+    def test_save_atomic(self):
+        """
+        1) Save an env and verify it is written with the highest pickle
+           protocol and without leftover temporary files.
+        2) Save it again unchanged and verify the file is not rewritten.
+        3) Change the env, save it and verify the file was replaced.
+        """
+        env = utils_env.Env(filename=self.envfilename)
+        env["key"] = "value"
+        env.save()
+        with open(self.envfilename, "rb") as f:
+            pickled = f.read()
+        self.assertEqual(pickled[:2], b"\x80" + bytes([pickle.HIGHEST_PROTOCOL]))
+        dirname, basename = os.path.split(self.envfilename)
+        self.assertEqual(
+            [name for name in os.listdir(dirname) if name.startswith("." + basename)],
+            [],
+        )
+        inode = os.stat(self.envfilename).st_ino
+        env.save()
+        self.assertEqual(os.stat(self.envfilename).st_ino, inode)
+        env["key"] = "other value"
+        env.save()
+        self.assertNotEqual(os.stat(self.envfilename).st_ino, inode)
+        self.assertEqual(utils_env.Env(filename=self.envfilename)["key"], "other value")
+
 
 if __name__ == "__main__":
     unittest.main()
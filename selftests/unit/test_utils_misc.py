@@ -3,6 +3,8 @@
 import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 
 from avocado.utils import process
@@ -265,5 +267,62 @@ class TestNumaNode(unittest.TestCase):
         os.unlink(self.online_nodes_path)
 
 
+class TestWaitUntil(unittest.TestCase):
+    def setUp(self):
+        utils_misc.get_wait_stats(reset=True)
+
+    def test_backoff(self):
+        checks = []
+
+        def _func():
+            checks.append(time.monotonic())
+            return len(checks) == 5
+
+        self.assertTrue(utils_misc.wait_until(_func, 10, step=0.01, factor=2, jitter=0))
+        delays = [b - a for a, b in zip(checks, checks[1:])]
+        # 0.01, 0.02, 0.04, 0.08
+        for previous, delay in zip(delays, delays[1:]):
+            self.assertGreater(delay, previous * 1.5)
+        stats = list(utils_misc.get_wait_stats().values())
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["polls"], 5)
+        self.assertEqual(stats[0]["timeouts"], 0)
+
+    def test_timeout(self):
+        start_time = time.monotonic()
+        self.assertIsNone(utils_misc.wait_until(lambda: False, 0.3, step=0.05))
+        self.assertLess(time.monotonic() - start_time, 1)
+        self.assertIsNone(utils_misc.wait_for(lambda: False, 0.1, step=0.05))
+        stats = utils_misc.get_wait_stats(reset=True)
+        self.assertEqual(len(stats), 2)
+        for site_stats in stats.values():
+            self.assertEqual(site_stats["timeouts"], 1)
+        self.assertEqual(utils_misc.get_wait_stats(), {})
+
+    def test_wakeup_event(self):
+        event = threading.Event()
+        timer = threading.Timer(0.2, event.set)
+        timer.start()
+        start_time = time.monotonic()
+        self.assertTrue(utils_misc.wait_until(event.is_set, 10, step=5, wakeup=event))
+        self.assertLess(time.monotonic() - start_time, 2)
+        timer.join()
+
+    def test_wakeup_fd(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        timer = threading.Timer(0.2, os.write, (write_fd, b"x"))
+        timer.start()
+        start_time = time.monotonic()
+        self.assertTrue(
+            utils_misc.wait_until(
+                lambda: time.monotonic() - start_time > 0.1, 10, step=5, wakeup=read_fd
+            )
+        )
+        self.assertLess(time.monotonic() - start_time, 2)
+        timer.join()
+
+
 if __name__ == "__main__":
     unittest.main()
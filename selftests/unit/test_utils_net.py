@@ -6,7 +6,12 @@ import logging
 import os
 import random
 import shelve
+import shutil
+import socket
+import sqlite3
+import struct
 import sys
+import tempfile
 import time
 import unittest
 
@@ -18,7 +23,14 @@ basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if os.path.isdir(os.path.join(basedir, "virttest")):
     sys.path.append(basedir)
 
-from virttest import cartesian_config, propcan, utils_misc, utils_net, utils_params
+from virttest import (
+    arch,
+    cartesian_config,
+    propcan,
+    utils_misc,
+    utils_net,
+    utils_params,
+)
 from virttest.unittest_utils import mock
 
 # Disable some pylint checks for selftests
@@ -701,5 +713,152 @@ class TestVmNetSubclasses(unittest.TestCase):
             pass
 
 
+class TestDbNetIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="vt_db_net_index_")
+        self.db_filename = os.path.join(self.tmpdir, "address_pool")
+        self.params = utils_params.Params({"nics": "nic1", "vms": "vm1"})
+        db = shelve.open(self.db_filename)
+        db["vm0"] = str([{"nic_name": "nic1", "mac": "02:00:00:00:00:01"}])
+        db["vm2"] = str([{"nic_name": "nic1", "mac": "02:00:00:00:00:02"}])
+        db.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_migrate_from_shelve(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        dbnet.lock_db()
+        try:
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:01"), "vm0")
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:02"), "vm2")
+            self.assertIsNone(dbnet.mac_owner("02:00:00:00:00:03"))
+        finally:
+            dbnet.unlock_db()
+        self.assertTrue(os.path.isfile(self.db_filename + ".index"))
+
+    def test_save_and_free(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        dbnet.append({"nic_name": "nic1", "mac": "02:00:00:00:00:AA"})
+        dbnet.update_db()
+        dbnet.lock_db()
+        try:
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:aa"), "vm1")
+        finally:
+            dbnet.unlock_db()
+        del dbnet[0]
+        dbnet.update_db()
+        dbnet.lock_db()
+        try:
+            self.assertIsNone(dbnet.mac_owner("02:00:00:00:00:aa"))
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:01"), "vm0")
+        finally:
+            dbnet.unlock_db()
+
+    def test_rebuild_on_foreign_write(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        db = shelve.open(self.db_filename)
+        del db["vm0"]
+        db["vm3"] = str([{"nic_name": "nic1", "mac": "02:00:00:00:00:03"}])
+        db.close()
+        dbnet.lock_db()
+        try:
+            self.assertIsNone(dbnet.mac_owner("02:00:00:00:00:01"))
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:03"), "vm3")
+        finally:
+            dbnet.unlock_db()
+
+    def test_index_failure_unlocks(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        # An index that can't be opened
+        os.unlink(self.db_filename + ".index")
+        os.mkdir(self.db_filename + ".index")
+        self.assertRaises(sqlite3.Error, dbnet.lock_db)
+        self.assertFalse(hasattr(dbnet, "lock"))
+        self.assertFalse(hasattr(dbnet, "db"))
+        os.rmdir(self.db_filename + ".index")
+        dbnet.lock_db()
+        try:
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:01"), "vm0")
+        finally:
+            dbnet.unlock_db()
+
+    def test_corrupted_index(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        with open(self.db_filename + ".index", "wb") as index:
+            index.write(b"not a database" * 100)
+        dbnet.lock_db()
+        try:
+            self.assertEqual(dbnet.mac_owner("02:00:00:00:00:01"), "vm0")
+            self.assertEqual(
+                dbnet.index_db.execute("PRAGMA synchronous").fetchone(), (0,)
+            )
+        finally:
+            dbnet.unlock_db()
+
+    def test_no_lock(self):
+        dbnet = utils_net.DbNet(self.params, "vm1", self.db_filename, "vm1")
+        self.assertRaises(utils_net.DbNoLockError, dbnet.mac_owner, "02:00:00:00:00:01")
+
+
+class TestNetlinkNeigh(unittest.TestCase):
+    @staticmethod
+    def _neigh_msg(ifindex, state, ip, lladdr):
+        ndmsg = struct.pack("BBHiHBB", socket.AF_INET, 0, 0, ifindex, state, 0, 0)
+        dst = socket.inet_aton(ip)
+        attrs = struct.pack("HH", 4 + len(dst), arch.NDA_DST) + dst
+        attrs += struct.pack("HH", 4 + len(lladdr), arch.NDA_LLADDR) + lladdr
+        # NDA_LLADDR is 6 bytes long, pad it to the 4 bytes alignment
+        attrs += b"\0\0"
+        return arch.RTM_NEWNEIGH, ndmsg + attrs
+
+    def setUp(self):
+        self.god = mock.mock_god(ut=self)
+        replies = [
+            self._neigh_msg(2, 0x02, "192.168.122.10", b"\x52\x54\x00\x12\x34\x56"),
+            self._neigh_msg(2, 0x01, "192.168.122.11", b"\x52\x54\x00\x12\x34\x57"),
+            self._neigh_msg(3, 0x04, "10.0.0.5", b"\x52\x54\x00\x12\x34\x58"),
+        ]
+        self.god.stub_with(
+            utils_net, "_netlink_request", lambda *args, **kwargs: replies
+        )
+        self.god.stub_with(
+            socket, "if_nametoindex", lambda name: {"virbr0": 2}.get(name, 0)
+        )
+
+    def tearDown(self):
+        self.god.unstub_all()
+
+    def test_neigh_table(self):
+        self.assertEqual(
+            utils_net.netlink_neigh_table(4),
+            {
+                "192.168.122.10": "52:54:00:12:34:56",
+                "10.0.0.5": "52:54:00:12:34:58",
+            },
+        )
+
+    def test_neigh_table_devs(self):
+        self.assertEqual(
+            utils_net.netlink_neigh_table(4, ["virbr0"]),
+            {"192.168.122.10": "52:54:00:12:34:56"},
+        )
+
+    def test_neigh_table_states(self):
+        self.assertEqual(
+            utils_net.netlink_neigh_table(
+                4, states=arch.NUD_REACHABLE | arch.NUD_PERMANENT
+            ),
+            {"192.168.122.10": "52:54:00:12:34:56"},
+        )
+
+    def test_verify_ownership(self):
+        self.assertTrue(
+            utils_net.verify_ip_address_ownership(
+                "192.168.122.10", ["52:54:00:12:34:56"], devs=["virbr0"]
+            )
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -163,5 +163,58 @@ class TestParams(unittest.TestCase):
         self.assertNotIn("_b", pruned.keys())
 
 
+class TestRecordAccess(unittest.TestCase):
+    def setUp(self):
+        self.params = utils_params.Params(BASE_DICT)
+
+    def record(self, params):
+        with utils_params.record_access(params) as record:
+            params.get("image_size")
+            for image in params.objects("images"):
+                params.object_params(image).get("image_format")
+        return record
+
+    def testRecordedParams(self):
+        snapshot = self.params.copy()
+        record = self.record(self.params)
+        self.assertIs(type(self.params), utils_params.Params)
+        self.assertEqual(record.keys, set(["image_size", "images", "image_format"]))
+        self.assertEqual(record.objects, ["image1", "stg"])
+        self.assertFalse(record.iterated)
+        fingerprint = record.fingerprint(snapshot)
+        # Params not read don't change the fingerprint
+        self.params["image_raw_device"] = "yes"
+        self.params["bogus"] = "yes"
+        self.assertEqual(record.fingerprint(self.params), fingerprint)
+        # Params of the objects do
+        self.params["image_format_stg"] = "raw"
+        self.assertNotEqual(record.fingerprint(self.params), fingerprint)
+
+    def testCopiedParams(self):
+        with utils_params.record_access(self.params) as record:
+            copied = self.params.copy()
+            derived = self.params.object_params("image1")
+            derived_copy = derived.copy()
+        # Params taken within the context don't record anymore
+        for params in (copied, derived, derived_copy):
+            self.assertIs(type(params), utils_params.Params)
+            self.assertFalse(hasattr(params, "_record"))
+            params.get("bogus")
+            self.assertIs(type(params.copy()), utils_params.Params)
+        self.assertNotIn("bogus", record.keys)
+
+    def testIteratedParams(self):
+        with utils_params.record_access(self.params) as record:
+            list(self.params.keys())
+        fingerprint = record.fingerprint(self.params)
+        self.assertTrue(record.iterated)
+        self.params["bogus"] = "yes"
+        self.assertNotEqual(record.fingerprint(self.params), fingerprint)
+
+    def testNotParams(self):
+        with utils_params.record_access(dict(BASE_DICT)) as record:
+            self.assertIsNone(record)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+# simple magic for using scripts within a source tree
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(basedir, "virttest")):
+    sys.path.append(basedir)
+
+from virttest import utils_qemu
+
+FAKE_QEMU = """#!%s
+import json
+import os
+import socket
+import sys
+
+directory = os.path.dirname(os.path.abspath(sys.argv[0]))
+with open(os.path.join(directory, "argv"), "w") as argv:
+    json.dump(sys.argv[1:], argv)
+path = sys.argv[sys.argv.index("-qmp") + 1][len("unix:"):].split(",")[0]
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(path)
+server.listen(1)
+conn, _ = server.accept()
+stream = conn.makefile("rw")
+
+
+def send(message):
+    stream.write(json.dumps(message) + "\\n")
+    stream.flush()
+
+
+send({"QMP": {"version": {}, "capabilities": []}})
+requests = []
+for line in stream:
+    request = json.loads(line)
+    requests.append(request)
+    command = request["execute"]
+    if command == "query-version":
+        # Events may come before the answer
+        send({"event": "RESUME", "timestamp": {}})
+        send({"return": {"qemu": {"major": 9, "minor": 0, "micro": 0}},
+              "id": request["id"]})
+    elif command == "query-machines":
+        send({"return": [{"name": "q35"}], "id": request["id"]})
+    elif command in ("qmp_capabilities", "quit"):
+        send({"return": {}, "id": request["id"]})
+    else:
+        send({"error": {"class": "CommandNotFound", "desc": command},
+              "id": request["id"]})
+    if command == "quit":
+        break
+with open(os.path.join(directory, "requests"), "w") as log:
+    json.dump(requests, log)
+""" % (
+    sys.executable
+)
+
+
+class ExecuteQmpCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="fake_qemu_")
+        self.qemu_binary = os.path.join(self.tmpdir, "qemu-kvm")
+        with open(self.qemu_binary, "w") as fake_qemu:
+            fake_qemu.write(FAKE_QEMU)
+        os.chmod(self.qemu_binary, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, name):
+        with open(os.path.join(self.tmpdir, name)) as log:
+            return json.load(log)
+
+    def test_commands(self):
+        results = utils_qemu.execute_qmp_commands(
+            self.qemu_binary,
+            [
+                ("query-version", None),
+                ("query-cpus-fast", None),
+                ("query-machines", None),
+                ("qom-list-types", {"implements": "device"}),
+            ],
+            "-machine none",
+        )
+        self.assertEqual(
+            results,
+            [
+                {"qemu": {"major": 9, "minor": 0, "micro": 0}},
+                None,
+                [{"name": "q35"}],
+                None,
+            ],
+        )
+        self.assertEqual(self._read("argv")[:2], ["-machine", "none"])
+        self.assertIn("-S", self._read("argv"))
+        requests = self._read("requests")
+        self.assertEqual(
+            [request["execute"] for request in requests],
+            [
+                "qmp_capabilities",
+                "query-version",
+                "query-cpus-fast",
+                "query-machines",
+                "qom-list-types",
+                "quit",
+            ],
+        )
+        self.assertNotIn("arguments", requests[1])
+        self.assertEqual(requests[4]["arguments"], {"implements": "device"})
+        # The QMP socket is cleaned up with its directory
+        sock_path = self._read("argv")[-1][len("unix:") :].split(",")[0]
+        self.assertFalse(os.path.exists(os.path.dirname(sock_path)))
+
+    def test_qemu_not_starting(self):
+        start_time = time.time()
+        results = utils_qemu.execute_qmp_commands(
+            "/bin/false", [("query-version", None), ("query-machines", None)]
+        )
+        self.assertEqual(results, [None, None])
+        self.assertLess(time.time() - start_time, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,12 @@
 
 import logging
 import os
+import shutil
+import stat
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
 from avocado.utils import process
@@ -361,5 +366,279 @@ class VirshPersistentClassHasHelpCommandTest(VirshHasHelpCommandTest):
         self.assertFalse(process_is_alive(self.virsh.virsh_exec))
 
 
+FAKE_VIRSH = """#!%s
+import sys
+import time
+
+while True:
+    sys.stdout.write("virsh # ")
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line or line.strip() == "quit":
+        break
+    args = line.split()
+    if not args:
+        continue
+    if args[0] == "list":
+        print(" Id   Name   State")
+        print("--------------------")
+        print(" 1    vm1    running")
+    elif args[0] == "domstate" and args[1] == "vm1":
+        print("running")
+    elif args[0] == "domstate" and args[1] == "slow":
+        time.sleep(30)
+    elif args[0] == "domstate" and args[1] == "gone":
+        print("error: Disconnected from qemu:///system due to end of file")
+        print("error: failed to connect to the hypervisor")
+    else:
+        print("error: failed to get domain '%%s'" %% args[-1])
+""" % (
+    sys.executable
+)
+
+
+class VirshSessionPoolTest(unittest.TestCase):
+    from virttest import virsh
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="virsh_pool_")
+        self.virsh_exec = os.path.join(self.tmpdir, "virsh")
+        with open(self.virsh_exec, "w") as fake_virsh:
+            fake_virsh.write(FAKE_VIRSH)
+        os.chmod(self.virsh_exec, stat.S_IRWXU)
+        self.pool = self.virsh.VirshSessionPool(size=2)
+        self.pool.enabled = True
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_can_run(self):
+        self.assertTrue(self.pool.can_run("domstate vm1", "qemu:///system"))
+        self.assertTrue(self.pool.can_run("list --all"))
+        self.assertFalse(self.pool.can_run("start vm1"))
+        self.assertFalse(self.pool.can_run("dumpxml vm1 > vm1.xml"))
+        self.assertFalse(self.pool.can_run("list", "qemu+ssh://host/system"))
+        self.pool.enabled = False
+        self.assertFalse(self.pool.can_run("list"))
+        self.assertFalse(self.virsh.VirshSessionPool().can_run("list"))
+
+    def test_run(self):
+        result = self.pool.run("domstate vm1", virsh_exec=self.virsh_exec)
+        self.assertEqual(result.exit_status, 0)
+        self.assertEqual(result.stdout_text.strip(), "running")
+        result = self.pool.run("domstate vm2", virsh_exec=self.virsh_exec)
+        self.assertEqual(result.exit_status, 1)
+        self.assertEqual(result.stdout_text, "")
+        self.assertIn("failed to get domain 'vm2'", result.stderr_text)
+        # The same session served both commands
+        key = (self.virsh_exec, None)
+        self.assertEqual(self.pool._spawned[key], 1)
+        self.assertEqual(len(self.pool._idle[key]), 1)
+
+    def test_threads(self):
+        results = []
+
+        def _domstate():
+            for _ in range(5):
+                result = self.pool.run("domstate vm1", virsh_exec=self.virsh_exec)
+                results.append(result.stdout_text.strip())
+
+        threads = [threading.Thread(target=_domstate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["running"] * 20)
+        self.assertLessEqual(self.pool._spawned[(self.virsh_exec, None)], 2)
+
+    def test_disconnected(self):
+        self.assertIsNone(self.pool.run("domstate gone", virsh_exec=self.virsh_exec))
+        key = (self.virsh_exec, None)
+        self.assertEqual(self.pool._spawned[key], 0)
+        # A new session is spawned for the next command
+        result = self.pool.run("domstate vm1", virsh_exec=self.virsh_exec)
+        self.assertEqual(result.stdout_text.strip(), "running")
+
+    def test_timeout(self):
+        start_time = time.time()
+        result = self.pool.run("domstate slow", virsh_exec=self.virsh_exec, timeout=1)
+        self.assertLess(time.time() - start_time, 10)
+        self.assertNotEqual(result.exit_status, 0)
+        self.assertTrue(result.interrupted)
+        # The session still running the command is thrown away
+        self.assertEqual(self.pool._spawned[(self.virsh_exec, None)], 0)
+
+    def test_command(self):
+        pool = self.virsh.VIRSH_SESSION_POOL
+        pool.enabled = True
+        try:
+            result = self.virsh.command(
+                "domstate vm1", virsh_exec=self.virsh_exec, timeout=60
+            )
+            self.assertEqual(result.stdout.strip(), "running")
+            self.assertIsNone(result.from_session_id)
+            self.assertEqual(pool._spawned[(self.virsh_exec, None)], 1)
+            self.assertRaises(
+                process.CmdError,
+                self.virsh.command,
+                "domstate vm2",
+                virsh_exec=self.virsh_exec,
+                ignore_status=False,
+                timeout=60,
+            )
+            # Commands without timeout get the default one of the pool
+            self.assertEqual(
+                self.virsh.domstate("vm1", virsh_exec=self.virsh_exec).stdout.strip(),
+                "running",
+            )
+            self.assertTrue(self.virsh.is_dead("vm2", virsh_exec=self.virsh_exec))
+            self.assertEqual(pool._spawned[(self.virsh_exec, None)], 1)
+            # Other commands keep running in their own virsh process
+            result = self.virsh.command("start vm1", virsh_exec="/bin/echo")
+            self.assertEqual(result.stdout.strip(), "start vm1")
+            self.assertNotIn(("/bin/echo", None), pool._spawned)
+        finally:
+            pool.enabled = False
+            pool.close()
+
+    def test_spawn_failure(self):
+        self.assertIsNone(self.pool.run("list", virsh_exec="/bin/false"))
+        self.assertEqual(self.pool._spawned[("/bin/false", None)], 0)
+
+
+FAKE_VIRSH_EVENTS = """#!%s
+import os
+import sys
+import time
+
+directory = os.path.dirname(os.path.abspath(sys.argv[0]))
+if sys.argv[1:2] == ["-c"]:
+    del sys.argv[1:3]
+
+
+def domstate(name):
+    try:
+        with open(os.path.join(directory, "state_" + name)) as state:
+            return 0, state.read()
+    except IOError:
+        return 1, "error: failed to get domain '%%s'" %% name
+
+
+if len(sys.argv) == 1:
+    while True:
+        sys.stdout.write("virsh # ")
+        sys.stdout.flush()
+        args = sys.stdin.readline().split()
+        if not args or args[0] == "quit":
+            break
+        if args[0] == "domstate":
+            print(domstate(args[1])[1])
+elif sys.argv[1] == "domstate":
+    status, output = domstate(sys.argv[2])
+    print(output)
+    sys.exit(status)
+elif sys.argv[1] == "event":
+    offset = 0
+    while True:
+        with open(os.path.join(directory, "events")) as events:
+            events.seek(offset)
+            for line in events:
+                print(line.strip())
+                sys.stdout.flush()
+            offset = events.tell()
+        time.sleep(0.05)
+""" % (
+    sys.executable
+)
+
+
+class DomainStateCacheTest(unittest.TestCase):
+    from virttest import virsh
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="virsh_events_")
+        virsh_exec = os.path.join(self.tmpdir, "virsh")
+        with open(virsh_exec, "w") as fake_virsh:
+            fake_virsh.write(FAKE_VIRSH_EVENTS)
+        os.chmod(virsh_exec, stat.S_IRWXU)
+        open(os.path.join(self.tmpdir, "events"), "w").close()
+        self.virsh_exec = self.virsh.VIRSH_EXEC
+        self.virsh.VIRSH_EXEC = virsh_exec
+        self.cache = self.virsh.DomainStateCache()
+        self.cache.READY_DELAY = 0
+        self.cache.start()
+
+    def tearDown(self):
+        self.cache.stop()
+        self.virsh.VIRSH_SESSION_POOL.close()
+        self.virsh.VIRSH_EXEC = self.virsh_exec
+        shutil.rmtree(self.tmpdir)
+
+    def _set_state(self, name, state, event=None):
+        with open(os.path.join(self.tmpdir, "state_" + name), "w") as state_file:
+            state_file.write(state)
+        if event:
+            with open(os.path.join(self.tmpdir, "events"), "a") as events:
+                events.write(
+                    "event 'lifecycle' for domain '%s': %s Booted\n" % (name, event)
+                )
+
+    def test_get_state(self):
+        self.assertEqual(self.cache.get_state("vm1"), "")
+        self.assertTrue(self.cache.is_dead("vm1"))
+        seq = self.cache._seq
+        self._set_state("vm1", "running", "Started")
+        self.assertTrue(self.cache.wait(lambda: self.cache._seq > seq, 10))
+        self.assertEqual(self.cache.get_state("vm1"), "running")
+        # Without event, the kept state is returned
+        self._set_state("vm1", "paused")
+        self.assertEqual(self.cache.get_state("vm1"), "running")
+        self.assertFalse(self.cache.is_dead("vm1"))
+        self._set_state("vm1", "shut off", "Stopped")
+        self.assertTrue(self.cache.wait(lambda: self.cache.is_dead("vm1"), 10))
+
+    def test_wait(self):
+        self._set_state("vm1", "shut off")
+        self.assertTrue(self.cache.is_dead("vm1"))
+        timer = threading.Timer(0.5, self._set_state, ("vm1", "running", "Started"))
+        timer.start()
+        start_time = time.time()
+        self.assertTrue(self.cache.wait(lambda: not self.cache.is_dead("vm1"), 10))
+        self.assertLess(time.time() - start_time, 5)
+        timer.join()
+        self.assertIsNone(self.cache.wait(lambda: self.cache.is_dead("vm1"), 0.2))
+
+    def test_command_run(self):
+        self._set_state("vm1", "running", "Started")
+        self.assertTrue(self.cache.wait(lambda: not self.cache.is_dead("vm1"), 10))
+        cache = self.virsh.DomainStateCache.get()
+        self.addCleanup(cache.stop)
+        cache.READY_DELAY = 0
+        cache._states["vm1"] = ("running", time.time())
+        # The state is kept until the event, unless virsh changed it
+        self._set_state("vm1", "paused")
+        self.virsh.DomainStateCache.command_run("domstate vm1")
+        self.assertEqual(cache.get_state("vm1"), "running")
+        self.virsh.DomainStateCache.command_run("suspend vm1")
+        self.assertEqual(cache.get_state("vm1"), "paused")
+
+    def test_command_run_default_uri(self):
+        self._set_state("vm1", "running")
+        cache = self.virsh.DomainStateCache.get("qemu:///system")
+        self.addCleanup(cache.stop)
+        cache.READY_DELAY = 0
+        cache._states["vm1"] = ("running", time.time())
+        self._set_state("vm1", "paused")
+        self.virsh.DomainStateCache.command_run("suspend vm1", "qemu:///session")
+        self.assertEqual(cache.get_state("vm1"), "running")
+        # Commands without URI may have run on any of the cached ones
+        self.virsh.DomainStateCache.command_run("suspend vm1")
+        self.assertEqual(cache.get_state("vm1"), "paused")
+
+    def test_remote_uri(self):
+        self.assertIsNone(self.virsh.DomainStateCache.get("qemu+ssh://host/system"))
+
+
 if __name__ == "__main__":
     unittest.main()
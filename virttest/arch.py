@@ -37,8 +37,24 @@ if ARCH in ("ppc64", "ppc64le"):
     NETLINK_ROUTE = 0
     NLM_F_REQUEST = 1
     NLM_F_ACK = 4
+    NLM_F_DUMP = 0x300
     RTM_DELLINK = 17
+    RTM_NEWROUTE = 24
+    RTM_GETROUTE = 26
+    RTM_NEWNEIGH = 28
+    RTM_GETNEIGH = 30
     NLMSG_ERROR = 2
+    NLMSG_DONE = 3
+    # From linux/rtnetlink.h
+    RTA_DST = 1
+    RTA_OIF = 4
+    # From linux/neighbour.h
+    NDA_DST = 1
+    NDA_LLADDR = 2
+    NUD_INCOMPLETE = 0x01
+    NUD_REACHABLE = 0x02
+    NUD_FAILED = 0x20
+    NUD_PERMANENT = 0x80
     # From linux/socket.h
     AF_PACKET = 17
     # From linux/vhost.h
@@ -76,8 +92,24 @@ else:
     NETLINK_ROUTE = 0
     NLM_F_REQUEST = 1
     NLM_F_ACK = 4
+    NLM_F_DUMP = 0x300
     RTM_DELLINK = 17
+    RTM_NEWROUTE = 24
+    RTM_GETROUTE = 26
+    RTM_NEWNEIGH = 28
+    RTM_GETNEIGH = 30
     NLMSG_ERROR = 2
+    NLMSG_DONE = 3
+    # From linux/rtnetlink.h
+    RTA_DST = 1
+    RTA_OIF = 4
+    # From linux/neighbour.h
+    NDA_DST = 1
+    NDA_LLADDR = 2
+    NUD_INCOMPLETE = 0x01
+    NUD_REACHABLE = 0x02
+    NUD_FAILED = 0x20
+    NUD_PERMANENT = 0x80
     # From linux/socket.h
     AF_PACKET = 17
     # From linux/vhost.h
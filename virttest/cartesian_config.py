@@ -133,17 +133,26 @@ The base of the definitions come verbatim as follows:
 """
 
 import collections
+import copy
+import hashlib
+import itertools
 import logging
+import multiprocessing
 import optparse
 import os
+import pickle
 import re
 import sys
+import tempfile
 
 _reserved_keys = set(
     ("name", "shortname", "dep", "_short_name_map_file", "_name_map_file")
 )
 options = None
 num_failed_cases = 5
+# Bump whenever the layout of the parsed tree changes, so that trees pickled
+# by an older parser are never loaded from the cache.
+_tree_cache_version = 1
 
 
 LOG = logging.getLogger("avocado." + __name__)
@@ -1477,14 +1486,152 @@ def parse_filter(lexer, tokens):
     return or_filters
 
 
+class _LeafContentCache(object):
+    """
+    Share the operators applied to consecutive leaves of the tree.
+
+    The content of a leaf starts with the operators of the deepest nodes,
+    which are usually the same for many leaves (e.g. base.cfg, guest-hw.cfg
+    and guest-os.cfg operators for all the subtests). The dict produced by
+    the operators shared with the previous leaf is kept as a checkpoint, so
+    the next leaf only applies the operators that differ.
+    """
+
+    __slots__ = ["ops", "checkpoints"]
+
+    # Keys which are different for each leaf
+    leaf_keys = ("name", "dep", "shortname")
+    # Values which are modified in place by the operators
+    map_keys = ("_name_map_file", "_short_name_map_file")
+
+    def __init__(self):
+        self.ops = []
+        # List of (position in ops, dict), sorted by position
+        self.checkpoints = []
+
+    def _copy(self, d, exclude=()):
+        copy = dict((k, v) for k, v in d.items() if k not in exclude)
+        for key in self.map_keys:
+            if key in copy:
+                copy[key] = dict(copy[key])
+        return copy
+
+    def _depends_on_leaf(self, op):
+        value = getattr(op, "value", None)
+        if isinstance(value, str) and "$" in value:
+            for key in match_substitute.findall(value):
+                if key in self.leaf_keys:
+                    return True
+        return False
+
+    def apply(self, d, ops):
+        """
+        Apply the operators to the dict of a leaf.
+
+        :param d: Dict of the leaf, containing only the leaf keys.
+        :param ops: List of operators of the leaf.
+        """
+        prefix = 0
+        for op, prev_op in zip(ops, self.ops):
+            if op is not prev_op or self._depends_on_leaf(op):
+                break
+            prefix += 1
+        while self.checkpoints and self.checkpoints[-1][0] > prefix:
+            self.checkpoints.pop()
+
+        pos = 0
+        if self.checkpoints:
+            pos, checkpoint = self.checkpoints[-1]
+            d.update(self._copy(checkpoint))
+        for op in ops[pos:prefix]:
+            op.apply_to_dict(d)
+        if prefix > pos:
+            self.checkpoints.append((prefix, self._copy(d, self.leaf_keys)))
+        for op in ops[prefix:]:
+            op.apply_to_dict(d)
+        self.ops = ops
+
+
+def _file_digest(filename):
+    """
+    Compute the digest of a file content.
+
+    :param filename: Path of the file.
+    :return: Hex digest of the file content.
+    """
+    hsh = hashlib.sha1()
+    with open(filename, "rb") as f:
+        hsh.update(f.read())
+    return hsh.hexdigest()
+
+
+def _file_signature(filename):
+    """
+    Get the signature used to detect changes of a parsed file.
+
+    :param filename: Path of the file.
+    :return: Tuple (filename, size, mtime, digest).
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    return (filename, st.st_size, st.st_mtime_ns, _file_digest(filename))
+
+
+def _signature_is_valid(signature):
+    """
+    Check if a file still matches the signature it had when it was parsed.
+
+    The size and modification time are checked first, the content digest is
+    only computed when those differ (e.g. after a fresh checkout).
+
+    :param signature: Tuple returned by :func:`_file_signature`.
+    """
+    filename, size, mtime, digest = signature
+    try:
+        st = os.stat(filename)
+        if st.st_size != size:
+            return False
+        if st.st_mtime_ns == mtime:
+            return True
+        return _file_digest(filename) == digest
+    except (IOError, OSError):
+        return False
+
+
 class Parser(object):
     # pylint: disable=W0102
 
-    def __init__(self, filename=None, defaults=False, expand_defaults=[], debug=False):
+    def __init__(
+        self,
+        filename=None,
+        defaults=False,
+        expand_defaults=[],
+        debug=False,
+        cache_dir=None,
+        jobs=1,
+    ):
+        """
+        :param filename: Configuration file to parse.
+        :param defaults: Use only the default variant of variants.
+        :param expand_defaults: Variants to be expanded even with defaults.
+        :param debug: Log the parser progress.
+        :param cache_dir: Directory where the parsed trees of files are
+                          cached, ``None`` disables the cache.
+        :param jobs: Number of worker processes used by :meth:`get_dicts`
+                     to expand the variants, 1 expands them serially.
+        """
         self.node = Node()
         self.debug = debug
         self.defaults = defaults
         self.expand_defaults = [LIdentifier(x) for x in expand_defaults]
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self._leaf_cache = _LeafContentCache()
+        # id(node.children) -> (children, index of the labels under each of
+        # them), shared by the copies of a node
+        self._children_index = {}
+        # Files read by the parser, needed to invalidate the cached trees.
+        self._parsed_files = []
 
         self.filename = filename
         if self.filename:
@@ -1515,9 +1662,96 @@ class Parser(object):
 
         :param filename: Path of the configuration file.
         """
+        # Only trees parsed from scratch can be cached, otherwise the result
+        # depends on what was parsed before.
+        use_cache = bool(self.cache_dir) and not (
+            self.node.content or self.node.children
+        )
+        if use_cache:
+            node = self._load_cached_tree(filename)
+            if node is not None:
+                self.node = node
+                self.filename = filename
+                return
+
         self.node.filename = filename
+        self._parsed_files = [filename]
         self.node = self._parse(Lexer(FileReader(filename)), self.node)
         self.filename = filename
+        if use_cache:
+            self._save_cached_tree(filename)
+
+    def _get_cache_path(self, filename):
+        """
+        Get the path of the cached tree of a file.
+
+        The parser options changing the shape of the tree are part of the key.
+
+        :param filename: Path of the configuration file.
+        """
+        key = repr(
+            (
+                _tree_cache_version,
+                sys.version_info[:2],
+                os.path.abspath(filename),
+                bool(self.defaults),
+                [str(x) for x in self.expand_defaults],
+            )
+        )
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "cartesian-%s.pickle" % name)
+
+    def _load_cached_tree(self, filename):
+        """
+        Load the parsed tree of a file from the cache.
+
+        :param filename: Path of the configuration file.
+        :return: The root :class:`Node` or ``None`` when there is no valid
+                 tree cached for the file.
+        """
+        path = self._get_cache_path(filename)
+        try:
+            with open(path, "rb") as f:
+                signatures, node = pickle.load(f)
+        except Exception as details:
+            if os.path.exists(path):
+                self._warn("Ignoring unusable cartesian cache %s: %s", path, details)
+            return None
+        for signature in signatures:
+            if not _signature_is_valid(signature):
+                self._debug("Cartesian cache %s is outdated by %s", path, signature[0])
+                return None
+        self._debug("Loaded parsed tree of %s from %s", filename, path)
+        return node
+
+    def _save_cached_tree(self, filename):
+        """
+        Store the parsed tree of a file in the cache.
+
+        The cache is written atomically, so concurrent parsers never read
+        a partially written file.
+
+        :param filename: Path of the configuration file.
+        """
+        path = self._get_cache_path(filename)
+        try:
+            signatures = [
+                _file_signature(f) for f in set(self._parsed_files + [__file__])
+            ]
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(
+                        (signatures, self.node), f, protocol=pickle.HIGHEST_PROTOCOL
+                    )
+                os.rename(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        except Exception as details:
+            self._warn("Unable to cache parsed tree of %s: %s", filename, details)
 
     def parse_string(self, s):
         """
@@ -1564,6 +1798,27 @@ class Parser(object):
         self.assignments.append(string)
         self.parse_string(string)
 
+    def copy(self):
+        """
+        Copy the parser, to apply filters and assignments to the copy
+        without changing this parser.
+
+        The parsed tree is shared, only its root node (where the new
+        filters and assignments go) is copied, so copying is cheap even
+        for big configs.
+
+        :return: A new :class:`Parser`.
+        """
+        parser = copy.copy(self)
+        parser.node = _copy_node(self.node)
+        parser.node.content = list(self.node.content)
+        parser._leaf_cache = _LeafContentCache()
+        parser.only_filters = list(self.only_filters)
+        parser.no_filters = list(self.no_filters)
+        parser.assignments = list(self.assignments)
+        parser.parent_generator = True
+        return parser
+
     def _parse(self, lexer, node=None, prev_indent=-1):
         if not node:
             node = self.node
@@ -1959,6 +2214,7 @@ class Parser(object):
                             lexer.line, lexer.filename, lexer.linenum
                         )
                     pre_dict = apply_predict(lexer, node, pre_dict)
+                    self._parsed_files.append(filename)
                     lch = Lexer(FileReader(filename))
                     node = self._parse(lch, node, -1)
                     lexer.set_prev_indent(prev_indent)
@@ -2021,8 +2277,6 @@ class Parser(object):
             Transforms into:
                 join a a
         """
-        node = node or self.node
-
         # Keep track to know who is a parent generator
         parent = False
         if self.parent_generator:
@@ -2030,6 +2284,12 @@ class Parser(object):
             parent = True
             # No one else is
             self.parent_generator = False
+            if self.jobs > 1 and node in (None, self.node) and not ctx:
+                for d in self._get_dicts_parallel():
+                    yield d
+                return
+
+        node = node or self.node
 
         # Node is a current block. It has content, its contents: node.content
         # Content without joins
@@ -2061,11 +2321,189 @@ class Parser(object):
                     f = OnlyFilter([word], str(word))
                     onlys += [(filename, linenum, f)]
 
-            old_content = node.content[:]
+            # Multiply a copy of the node, the node itself can be expanded
+            # again by another join while this generator is suspended.
+            node = _copy_node(node)
             node.content = new_content
             for d in self.multiply_join(onlys, node, ctx, content, shortname, dep):
                 yield _drop_suffixes(d) if parent else d
-            node.content = old_content[:]
+
+    def _get_dicts_parallel(self):
+        """
+        Generate the dictionaries of the whole tree using worker processes.
+
+        The variant subtrees are expanded by a pool of :attr:`jobs` processes
+        and the results are merged back in the order produced by the serial
+        :meth:`get_dicts`. Joins of the top-level node are expanded in
+        parallel one by one and multiplied in this process.
+        """
+        node = self.node
+        content = []
+        onlys = []
+        for t in node.content:
+            filename, linenum, obj = t
+            if not isinstance(obj, JoinFilter):
+                content.append(t)
+                continue
+            # Rewrite all separate joins in one node as many `only'
+            for word in obj.filter:
+                onlys.append((filename, linenum, OnlyFilter([word], str(word))))
+
+        tasks = self._split_tree(node, self.jobs * 4)
+        self._debug("Expanding %s variant subtrees in parallel", len(tasks))
+        with multiprocessing.Pool(
+            self.jobs, initializer=_init_expand_worker, initargs=(self,)
+        ) as pool:
+            if not onlys:
+                results = pool.imap(_expand_subtree, [(p, content) for p in tasks])
+                for d in self._merge_subtrees(node, (), set(tasks), results):
+                    yield _drop_suffixes(d)
+                return
+
+            factors = []
+            for only in onlys:
+                results = pool.imap(
+                    _expand_subtree, [(p, content + [only]) for p in tasks]
+                )
+                factors.append(
+                    list(self._merge_subtrees(node, (), set(tasks), results))
+                )
+        for dicts in itertools.product(*factors):
+            # Multiply the same way as multiply_join does, from the last one
+            d = dicts[-1]
+            for d1 in reversed(dicts[:-1]):
+                d2 = d
+                d = d1.copy()
+                d.update(d2)
+                d["name"] = self.mk_name(d1["name"], d2["name"])
+                d["shortname"] = self.mk_name(d1["shortname"], d2["shortname"])
+            yield _drop_suffixes(d)
+
+    def _split_tree(self, node, count):
+        """
+        Split the tree into subtrees which can be expanded independently.
+
+        Nodes are split breadth first until there is at least `count`
+        subtrees. Leaves and nodes with joins are never split.
+
+        :param node: Root of the tree.
+        :param count: Desired number of subtrees.
+        :return: List of paths (tuples of children indexes) to the subtrees,
+                 in the order in which they are expanded.
+        """
+        paths = [()]
+        while len(paths) < count:
+            new_paths = []
+            for path in paths:
+                subtree = _get_subtree(node, path)
+                if not subtree.children or (
+                    path and any(isinstance(t[2], JoinFilter) for t in subtree.content)
+                ):
+                    new_paths.append(path)
+                else:
+                    new_paths += [path + (i,) for i in range(len(subtree.children))]
+            if new_paths == paths:
+                break
+            paths = new_paths
+        return paths
+
+    def _merge_subtrees(self, node, path, tasks, results):
+        """
+        Merge the dictionaries of the expanded subtrees in serial order.
+
+        :param node: Node at `path`.
+        :param path: Path of the node from the root.
+        :param tasks: Set of paths of the expanded subtrees.
+        :param results: Iterator of dict lists, one for each of `tasks`.
+        """
+        if path in tasks:
+            for d in next(results):
+                yield d
+            return
+        count = 0
+        skip = False
+        use_defaults = self.defaults and node.var_name not in self.expand_defaults
+        for i, child in enumerate(node.children):
+            subtree_dicts = self._merge_subtrees(child, path + (i,), tasks, results)
+            if skip:
+                # Consume results of subtrees skipped due to defaults
+                for _ in subtree_dicts:
+                    pass
+                continue
+            for d in subtree_dicts:
+                count += 1
+                yield d
+            if use_defaults and child.default and count:
+                skip = True
+
+    def _get_children_index(self, node):
+        """
+        Get the index of the labels under each of the children of a node.
+
+        The index is built on the first use and kept for the whole life of
+        the parser, the children of a parsed node never change. It is kept
+        per children list, which the copies of a node (eg. by joins) share.
+        The single child lists of restricted trees are not worth keeping.
+
+        :param node: Node whose children are indexed.
+        :return: Dict mapping label names to sets of children indexes.
+        """
+        entry = self._children_index.get(id(node.children))
+        if entry is None:
+            index = {}
+            for i, child in enumerate(node.children):
+                for label in itertools.chain(child.name, child.labels):
+                    index.setdefault(label.name, set()).add(i)
+            if len(node.children) < 2:
+                return index
+            entry = self._children_index[id(node.children)] = (node.children, index)
+        return entry[1]
+
+    def _filter_children(self, node, ctx, content):
+        """
+        Get the children of a node which might pass the filters of content.
+
+        The 'only' filters are looked up in the children index, so only
+        children with all the labels of a filter under them are checked,
+        instead of processing the content of every child just to find out
+        the filter fails there.
+
+        :param node: Node whose children are filtered.
+        :param ctx: Context of the node (including its name).
+        :param content: Content the children inherit from the node.
+        :return: List of the children to be expanded.
+        """
+        filters = [obj for _, _, obj in content if type(obj) in (OnlyFilter, NoFilter)]
+        if not filters or not node.children:
+            return node.children
+
+        ctx_set = set(ctx)
+        index = self._get_children_index(node)
+        candidates = set(range(len(node.children)))
+        for lfilter in filters:
+            if type(lfilter) is not OnlyFilter:
+                continue
+            matching = set()
+            for word in lfilter.filter:
+                word_matching = candidates
+                for block in word:
+                    for label in block:
+                        if label not in ctx_set:
+                            word_matching = word_matching & index.get(label.name, set())
+                matching |= word_matching
+            candidates &= matching
+
+        children = []
+        for i in sorted(candidates):
+            child = node.children[i]
+            child_ctx = ctx + child.name
+            child_ctx_set = set(child_ctx)
+            for lfilter in filters:
+                if lfilter.requires_action(child_ctx, child_ctx_set, child.labels):
+                    break
+            else:
+                children.append(child)
+        return children
 
     def mk_name(self, n1, n2):
         """Make name for test. Case: two dics were merged"""
@@ -2255,15 +2693,16 @@ class Parser(object):
 
         # Recurse into children
         count = 0
+        children = self._filter_children(node, ctx, new_content)
         if self.defaults and node.var_name not in self.expand_defaults:
-            for n in node.children:
+            for n in children:
                 for d in self.get_dicts(n, ctx, new_content, shortname, dep):
                     count += 1
                     yield d
                 if n.default and count:
                     break
         else:
-            for n in node.children:
+            for n in children:
                 for d in self.get_dicts(n, ctx, new_content, shortname, dep):
                     count += 1
                     yield d
@@ -2275,12 +2714,78 @@ class Parser(object):
                 "dep": dep,
                 "shortname": ".".join([str(sn.name) for sn in shortname]),
             }
-            for _, _, op in new_content:
-                op.apply_to_dict(d)
+            self._leaf_cache.apply(d, [op for _, _, op in new_content])
             postfix_parse(d)
             yield d
 
 
+def _get_subtree(node, path):
+    """
+    Get the node at the end of `path`.
+
+    :param node: Root of the tree.
+    :param path: Tuple of children indexes.
+    """
+    for index in path:
+        node = node.children[index]
+    return node
+
+
+def _copy_node(node):
+    """
+    Make a shallow copy of a node with its own failed cases.
+
+    :param node: Node to be copied.
+    """
+    copy = Node()
+    for attr in Node.__slots__:
+        if hasattr(node, attr):
+            setattr(copy, attr, getattr(node, attr))
+    copy.failed_cases = collections.deque()
+    return copy
+
+
+def _restrict_tree(node, path):
+    """
+    Copy the nodes along `path`, keeping only the children on the path.
+
+    :param node: Root of the tree.
+    :param path: Tuple of children indexes.
+    :return: Root of the restricted tree.
+    """
+    restricted = _copy_node(node)
+    if path:
+        restricted.children = [_restrict_tree(node.children[path[0]], path[1:])]
+    return restricted
+
+
+_expand_parser = None
+
+
+def _init_expand_worker(parser):
+    """
+    Initialize a worker process of :meth:`Parser._get_dicts_parallel`.
+    """
+    global _expand_parser
+    _expand_parser = parser
+    # Dicts are only post-processed by the top-level generator
+    _expand_parser.parent_generator = False
+
+
+def _expand_subtree(args):
+    """
+    Expand the subtree at `path` in a worker process.
+
+    :param args: Tuple (path, content) where content replaces the content
+                 of the root node.
+    :return: List of the (not post-processed) dicts of the subtree.
+    """
+    path, content = args
+    root = _restrict_tree(_expand_parser.node, path)
+    root.content = content
+    return list(_expand_parser.get_dicts_plain(root))
+
+
 def print_dicts_default(options, dicts):
     """Print dictionaries in the default mode"""
     for count, dic in enumerate(dicts):
@@ -2434,6 +2939,14 @@ if __name__ == "__main__":
         help="list of vartiant which should be expanded when"
         ' defaults is enabled.  "name, name, name"',
     )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type="int",
+        default=1,
+        help="number of processes used to expand the variants",
+    )
     parser.add_option(
         "-s",
         "--skip-dups",
@@ -2454,7 +2967,11 @@ if __name__ == "__main__":
     if options.expand:
         expand = [x.strip() for x in options.expand.split(",")]
     c = Parser(
-        args[0], defaults=options.defaults, expand_defaults=expand, debug=options.debug
+        args[0],
+        defaults=options.defaults,
+        expand_defaults=expand,
+        debug=options.debug,
+        jobs=options.jobs,
     )
     for s in args[1:]:
         c.parse_string(s)
@@ -1,7 +1,11 @@
 from __future__ import division
 
+import collections
 import copy
 import glob
+import hashlib
+import io
+import json
 import logging
 import multiprocessing
 import os
@@ -17,9 +21,8 @@ from aexpect import remote
 from avocado.core import exceptions
 from avocado.utils import archive
 from avocado.utils import cpu as cpu_utils
-from avocado.utils import crypto
 from avocado.utils import process as a_process
-from six.moves import xrange
+from six.moves import queue, xrange
 
 from virttest import (
     cpu,
@@ -34,6 +37,7 @@ from virttest import (
     utils_logfile,
     utils_misc,
     utils_net,
+    utils_numeric,
     utils_package,
     utils_qemu,
     utils_test,
@@ -734,15 +738,17 @@ def process_command(test, params, env, command, command_timeout, command_noncrit
 
 class _CreateImages(threading.Thread):
     """
-    Thread which creates images. In case of failure it stores the exception
-    in self.exc_info
+    Thread which processes groups of images taken from a queue. In case of
+    failure it stores the exception in self.exc_info
     """
 
-    def __init__(self, image_func, test, images, params, exit_event, vm_process_status):
+    def __init__(
+        self, image_func, test, image_groups, params, exit_event, vm_process_status
+    ):
         threading.Thread.__init__(self)
         self.image_func = image_func
         self.test = test
-        self.images = images
+        self.image_groups = image_groups
         self.params = params
         self.exit_event = exit_event
         self.exc_info = None
@@ -750,23 +756,89 @@ class _CreateImages(threading.Thread):
 
     def run(self):
         try:
-            _process_images_serial(
-                self.image_func,
-                self.test,
-                self.images,
-                self.params,
-                self.exit_event,
-                self.vm_process_status,
-            )
+            while not self.exit_event.is_set():
+                try:
+                    images = self.image_groups.get_nowait()
+                except queue.Empty:
+                    break
+                _process_images_serial(
+                    self.image_func,
+                    self.test,
+                    images,
+                    self.params,
+                    self.exit_event,
+                    self.vm_process_status,
+                )
         except Exception:
             self.exc_info = sys.exc_info()
             self.exit_event.set()
 
 
+def _group_images(images, params):
+    """
+    Split images into groups which can be processed independently.
+
+    Images of the same image_chain or sharing the same image_name depend on
+    each other, they end up in the same group in their original order.
+
+    :param images: List of images (usually params.objects("images"))
+    :param params: A dict containing all VM and image parameters.
+    :return: List of image name lists
+    """
+    owner = dict((image_name, image_name) for image_name in images)
+
+    def _find(image_name):
+        while owner[image_name] != image_name:
+            owner[image_name] = owner[owner[image_name]]
+            image_name = owner[image_name]
+        return image_name
+
+    files = {}
+    for image_name in images:
+        image_params = params.object_params(image_name)
+        related = [img for img in image_params.objects("image_chain") if img in owner]
+        filename = image_params.get("image_name")
+        if filename:
+            related.append(files.setdefault(filename, image_name))
+        for img in related:
+            owner[_find(img)] = _find(image_name)
+
+    groups = collections.OrderedDict()
+    for image_name in images:
+        groups.setdefault(_find(image_name), []).append(image_name)
+    return list(groups.values())
+
+
+def _estimate_images_size(images, params):
+    """
+    Estimate the amount of data behind images from their image_size.
+
+    :param images: List of images
+    :param params: A dict containing all VM and image parameters.
+    :return: Estimated size in bytes
+    """
+    size = 0
+    for image_name in images:
+        image_size = params.object_params(image_name).get("image_size", "0")
+        try:
+            size += float(
+                utils_numeric.normalize_data_size(image_size, order_magnitude="B")
+            )
+        except ValueError:
+            continue
+    return size
+
+
 def process_images(image_func, test, params, vm_process_status=None):
     """
     Wrapper which chooses the best way to process images.
 
+    Independent images are processed in parallel by up to
+    image_process_workers threads (1 disables it and 0 chooses
+    automatically), the images of a chain or sharing a file stay in the
+    same thread. This is opt-in: when it is not set, only more than 20
+    images are processed in parallel, as before.
+
     :param image_func: Process function
     :param test: An Autotest test object.
     :param params: A dict containing all VM and image parameters.
@@ -774,9 +846,26 @@ def process_images(image_func, test, params, vm_process_status=None):
                               or None for no vm exist.
     """
     images = params.objects("images")
-    if len(images) > 20:  # Lets do it in parallel
+    workers = params.get("image_process_workers")
+    if not workers:
+        workers = 1
+        if len(images) > 20:
+            workers = min(len(images) // 5, 2 * multiprocessing.cpu_count())
+    else:
+        workers = int(workers)
+        if workers <= 0:
+            workers = 2 * multiprocessing.cpu_count()
+    if workers > 1:
+        image_groups = _group_images(images, params)
+        workers = min(workers, len(image_groups))
+    if workers > 1:  # Lets do it in parallel
         _process_images_parallel(
-            image_func, test, params, vm_process_status=vm_process_status
+            image_func,
+            test,
+            params,
+            vm_process_status=vm_process_status,
+            image_groups=image_groups,
+            workers=workers,
         )
     else:
         _process_images_serial(
@@ -814,13 +903,22 @@ def _process_images_serial(
     """
     for image_name in images:
         image_params = params.object_params(image_name)
+        start_time = time.time()
         image_func(test, image_params, image_name, vm_process_status)
+        LOG.info(
+            "%s of image %s took %.2f seconds",
+            getattr(image_func, "__name__", image_func),
+            image_name,
+            time.time() - start_time,
+        )
         if exit_event and exit_event.is_set():
             LOG.error("Received exit_event, stop processing of images.")
             break
 
 
-def _process_images_parallel(image_func, test, params, vm_process_status=None):
+def _process_images_parallel(
+    image_func, test, params, vm_process_status=None, image_groups=None, workers=None
+):
     """
     The same as _process_images but in parallel.
     :param image_func: Process function
@@ -828,15 +926,29 @@ def _process_images_parallel(image_func, test, params, vm_process_status=None):
     :param params: A dict containing all VM and image parameters.
     :param vm_process_status: (optional) vm process status like running, dead
                               or None for no vm exist.
+    :param image_groups: (optional) groups of images to process in parallel,
+                         the images of a group are processed in order
+    :param workers: (optional) number of threads processing the groups
     """
-    images = params.objects("images")
-    no_threads = min(len(images) // 5, 2 * multiprocessing.cpu_count())
+    if image_groups is None:
+        image_groups = _group_images(params.objects("images"), params)
+    if workers is None:
+        workers = min(len(image_groups), 2 * multiprocessing.cpu_count())
+    # Start with the biggest groups so they don't end up running alone
+    pending = queue.Queue()
+    for images in sorted(
+        image_groups,
+        key=lambda images: _estimate_images_size(images, params),
+        reverse=True,
+    ):
+        pending.put(images)
     exit_event = threading.Event()
     threads = []
-    for i in xrange(no_threads):
-        imgs = images[i::no_threads]
+    for i in xrange(workers):
         threads.append(
-            _CreateImages(image_func, test, imgs, params, exit_event, vm_process_status)
+            _CreateImages(
+                image_func, test, pending, params, exit_event, vm_process_status
+            )
         )
         threads[-1].start()
 
@@ -847,7 +959,7 @@ def _process_images_parallel(image_func, test, params, vm_process_status=None):
         LOG.error("Image processing failed:")
         for thread in threads:
             if thread.exc_info:  # Throw the first failure
-                six.reraise(thread.exc_info[1], None, thread.exc_info[2])
+                six.reraise(*thread.exc_info)
     del exit_event
     del threads[:]
 
@@ -986,6 +1098,8 @@ def preprocess(test, params, env):
     :param env: The environment (a dict-like object).
     """
     error_context.context("preprocessing")
+    # Only account the waits of this test
+    utils_misc.get_wait_stats(reset=True)
 
     # Add migrate_vms to vms
     migrate_vms = params.objects("migrate_vms")
@@ -1043,6 +1157,8 @@ def preprocess(test, params, env):
         # Set the LIBVIRT_DEFAULT_URI to make virsh command
         # work on connect_uri as default behavior.
         os.environ["LIBVIRT_DEFAULT_URI"] = connect_uri
+        # Run the virsh state queries in long-lived sessions, if requested
+        virsh.VIRSH_SESSION_POOL.enabled = params.get("virsh_session_pool") == "yes"
         if params.get("setup_libvirt_polkit") == "yes":
             pol = test_setup.LibvirtPolkitConfig(params)
             try:
@@ -1558,6 +1674,15 @@ def postprocess(test, params, env):
 
     err += "\n".join(_setup_manager.do_cleanup())
 
+    # Report the call sites that spent the most time waiting
+    wait_stats = utils_misc.log_wait_stats()
+    if wait_stats:
+        try:
+            with open(os.path.join(test.debugdir, "wait_stats.json"), "w") as f:
+                json.dump(wait_stats, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as details:
+            LOG.debug("Failed to save the wait statistics: %s", details)
+
     if err:
         raise RuntimeError("Failures occurred while postprocess:\n%s" % err)
 
@@ -1574,6 +1699,15 @@ def postprocess_on_error(test, params, env):
 
 
 def _take_screendumps(test, params, env):
+    """
+    Capture screendumps of the VMs until the termination event is set.
+
+    This thread only asks the monitors for screendumps, the frames are
+    queued to a small pool of workers that verify, hash and convert them.
+    The frames of a VM always go to the same worker, so they are processed
+    in order. When the queue of a worker is full, new frames of its VMs are
+    dropped rather than delaying the captures of the other VMs.
+    """
     global _screendump_thread_termination_event
     temp_dir = test.debugdir
     if params.get("screendump_temp_dir"):
@@ -1583,17 +1717,125 @@ def _take_screendumps(test, params, env):
         except OSError:
             pass
     random_id = utils_misc.generate_random_string(6)
-    temp_filename = "scrdump-%s-iter%s.ppm" % (random_id, test.iteration)
-    temp_filename = os.path.join(temp_dir, temp_filename)
     delay = float(params.get("screendump_delay", 5))
     quality = int(params.get("screendump_quality", 30))
     inactivity_treshold = float(params.get("inactivity_treshold", 1800))
     inactivity_watcher = params.get("inactivity_watcher", "log")
+    workers = max(1, int(params.get("screendump_workers", 2)))
+    queue_size = max(1, int(params.get("screendump_queue_size", 4)))
 
     cache = {}
     counter = {}
     inactivity = {}
+    hash_indexes = {}
+    stats = collections.defaultdict(collections.Counter)
+    frame_queues = [queue.Queue(queue_size) for _ in xrange(workers)]
 
+    def _process_screendump(vm, screendump_dir, temp_filename, capture_time):
+        if not ppm_utils.image_verify_ppm_file(temp_filename):
+            LOG.warning("VM '%s' produced an invalid screendump", vm.name)
+            return
+        try:
+            os.makedirs(screendump_dir)
+        except OSError:
+            pass
+        counter[vm.instance] += 1
+        filename = "%04d.jpg" % counter[vm.instance]
+        screendump_filename = os.path.join(screendump_dir, filename)
+        with open(temp_filename, "rb") as temp_file:
+            screendump_data = temp_file.read()
+        image_hash = hashlib.md5(screendump_data).hexdigest()
+        if image_hash in cache:
+            time_inactive = capture_time - inactivity[vm.instance]
+            if time_inactive > inactivity_treshold:
+                msg = "%s screen is inactive for more than %d s (%d min)" % (
+                    vm.name,
+                    time_inactive,
+                    time_inactive // 60,
+                )
+                if inactivity_watcher == "error":
+                    try:
+                        raise virt_vm.VMScreenInactiveError(vm, time_inactive)
+                    except virt_vm.VMScreenInactiveError:
+                        LOG.error(msg)
+                        # Let's reset the counter
+                        inactivity[vm.instance] = time.time()
+                        test.background_errors.put(sys.exc_info())
+                elif inactivity_watcher == "log":
+                    LOG.debug(msg)
+        else:
+            inactivity[vm.instance] = capture_time
+        cache[image_hash] = screendump_filename
+        try:
+            try:
+                image = PIL.Image.open(io.BytesIO(screendump_data))
+                stamped_image = ppm_utils.add_timestamp(image, capture_time)
+                stamped_image.save(screendump_filename, format="JPEG", quality=quality)
+            except (IOError, OSError) as error_detail:
+                LOG.warning(
+                    "VM '%s' failed to produce a " "screendump: %s",
+                    vm.name,
+                    error_detail,
+                )
+                # Decrement the counter as we in fact failed to
+                # produce a converted screendump
+                counter[vm.instance] -= 1
+                return
+        except NameError:
+            return
+        stats[vm.name]["saved"] += 1
+        if vm.params.get("check_guest_bsod", "no") != "yes":
+            return
+        # Index the screen content, the timestamp bar aside, and check it
+        # for a BSOD with the same hash
+        if screendump_dir not in hash_indexes:
+            hash_indexes[screendump_dir] = ppm_utils.ImageHashIndex(
+                screendump_dir, hash_types=("ahash",)
+            )
+        scrdump_hash = None
+        try:
+            entry = hash_indexes[screendump_dir].add(screendump_filename, image)
+            scrdump_hash = entry["ahash"]
+        except (IOError, OSError) as error_detail:
+            LOG.debug("Failed to index %s: %s", screendump_filename, error_detail)
+        try:
+            vm.verify_bsod(screendump_filename, scrdump_hash)
+        except virt_vm.VMDeadKernelCrashError as details:
+            LOG.error(details)
+            test.background_errors.put(sys.exc_info())
+
+    def _process_screendumps(frame_queue):
+        while True:
+            frame = frame_queue.get()
+            if frame is None:
+                break
+            vm, screendump_dir, temp_filename, capture_time = frame
+            if time.time() - capture_time > delay:
+                stats[vm.name]["late"] += 1
+            try:
+                _process_screendump(vm, screendump_dir, temp_filename, capture_time)
+            except Exception as details:
+                LOG.error(
+                    "Failed to process a screendump of VM '%s': %s", vm.name, details
+                )
+            finally:
+                try:
+                    os.unlink(temp_filename)
+                except OSError:
+                    pass
+
+    worker_threads = []
+    for index, frame_queue in enumerate(frame_queues):
+        thread = threading.Thread(
+            target=_process_screendumps,
+            name="ScreenDumpWorker-%d" % index,
+            args=(frame_queue,),
+        )
+        thread.daemon = True
+        thread.start()
+        worker_threads.append(thread)
+
+    frame_id = 0
     while True:
         for vm in env.get_all_vms():
             if vm.instance not in list(counter.keys()):
@@ -1603,6 +1845,13 @@ def _take_screendumps(test, params, env):
             if not vm.is_alive():
                 continue
             vm_pid = vm.get_pid()
+            frame_id += 1
+            temp_filename = "scrdump-%s-%s-iter%s.ppm" % (
+                random_id,
+                frame_id,
+                test.iteration,
+            )
+            temp_filename = os.path.join(temp_dir, temp_filename)
             try:
                 vm.screendump(filename=temp_filename, debug=False)
             except qemu_monitor.MonitorError as e:
@@ -1611,67 +1860,25 @@ def _take_screendumps(test, params, env):
             except AttributeError as e:
                 LOG.warning(e)
                 continue
+            capture_time = time.time()
             if not os.path.exists(temp_filename):
                 LOG.warning("VM '%s' failed to produce a screendump", vm.name)
                 continue
-            if not ppm_utils.image_verify_ppm_file(temp_filename):
-                LOG.warning("VM '%s' produced an invalid screendump", vm.name)
-                os.unlink(temp_filename)
-                continue
+            stats[vm.name]["captured"] += 1
             screendump_dir = "screendumps_%s_%s_iter%s" % (
                 vm.name,
                 vm_pid,
                 test.iteration,
             )
             screendump_dir = os.path.join(test.debugdir, screendump_dir)
+            frame_queue = frame_queues[hash(vm.instance) % workers]
             try:
-                os.makedirs(screendump_dir)
-            except OSError:
-                pass
-            counter[vm.instance] += 1
-            filename = "%04d.jpg" % counter[vm.instance]
-            screendump_filename = os.path.join(screendump_dir, filename)
-            vm.verify_bsod(screendump_filename)
-            image_hash = crypto.hash_file(temp_filename)
-            if image_hash in cache:
-                time_inactive = time.time() - inactivity[vm.instance]
-                if time_inactive > inactivity_treshold:
-                    msg = "%s screen is inactive for more than %d s (%d min)" % (
-                        vm.name,
-                        time_inactive,
-                        time_inactive // 60,
-                    )
-                    if inactivity_watcher == "error":
-                        try:
-                            raise virt_vm.VMScreenInactiveError(vm, time_inactive)
-                        except virt_vm.VMScreenInactiveError:
-                            LOG.error(msg)
-                            # Let's reset the counter
-                            inactivity[vm.instance] = time.time()
-                            test.background_errors.put(sys.exc_info())
-                    elif inactivity_watcher == "log":
-                        LOG.debug(msg)
-            else:
-                inactivity[vm.instance] = time.time()
-            cache[image_hash] = screendump_filename
-            try:
-                try:
-                    timestamp = os.stat(temp_filename).st_ctime
-                    image = PIL.Image.open(temp_filename)
-                    image = ppm_utils.add_timestamp(image, timestamp)
-                    image.save(screendump_filename, format="JPEG", quality=quality)
-                except (IOError, OSError) as error_detail:
-                    LOG.warning(
-                        "VM '%s' failed to produce a " "screendump: %s",
-                        vm.name,
-                        error_detail,
-                    )
-                    # Decrement the counter as we in fact failed to
-                    # produce a converted screendump
-                    counter[vm.instance] -= 1
-            except NameError:
-                pass
-            os.unlink(temp_filename)
+                frame_queue.put_nowait(
+                    (vm, screendump_dir, temp_filename, capture_time)
+                )
+            except queue.Full:
+                stats[vm.name]["dropped"] += 1
+                os.unlink(temp_filename)
 
         if _screendump_thread_termination_event is not None:
             if _screendump_thread_termination_event.is_set():
@@ -1682,6 +1889,20 @@ def _take_screendumps(test, params, env):
             # Exit event was deleted, exit this thread
             break
 
+    for frame_queue in frame_queues:
+        frame_queue.put(None)
+    for thread in worker_threads:
+        thread.join()
+    for vm_name, vm_stats in sorted(stats.items()):
+        LOG.info(
+            "Screendumps of VM '%s': %d captured, %d saved, %d dropped, %d late",
+            vm_name,
+            vm_stats["captured"],
+            vm_stats["saved"],
+            vm_stats["dropped"],
+            vm_stats["late"],
+        )
+
 
 def store_vm_info(vm, log_filename, info_cmd="registers", append=False, vmtype="qemu"):
     """
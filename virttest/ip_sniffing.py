@@ -2,9 +2,15 @@
 IP sniffing facilities
 """
 
+import ctypes
+import ipaddress
 import logging
 import re
+import select
+import socket
+import struct
 import threading
+import time
 
 try:
     from collections import Iterable
@@ -28,9 +34,13 @@ class AddrCache(object):
     Address cache implementation.
     """
 
+    #: Seconds a verified (hwaddr, ipaddr) pair is trusted without re-checking
+    VERIFIED_TTL = 10.0
+
     def __init__(self):
         """Initializes the address cache."""
         self._data = {}
+        self._verified = {}
         self._lock = threading.RLock()
 
     def __repr__(self):
@@ -39,9 +49,12 @@ class AddrCache(object):
     def __getstate__(self):
         state = self.__dict__.copy()
         del state["_lock"]
+        # Expiry times are monotonic clock values of this process only
+        state["_verified"] = {}
         return state
 
     def __setstate__(self, state):
+        state.setdefault("_verified", {})
         self.__dict__.update(state)
         self._lock = threading.RLock()
 
@@ -55,6 +68,7 @@ class AddrCache(object):
             if self._data.get(hwaddr) == ipaddr:
                 return
             self._data[hwaddr] = ipaddr
+            self._verified.pop(hwaddr, None)
         LOG.debug(
             "Updated HWADDR (%s)<->(%s) IP pair " "into address cache", hwaddr, ipaddr
         )
@@ -69,6 +83,7 @@ class AddrCache(object):
     def __delitem__(self, hwaddr):
         hwaddr = self._format_hwaddr(hwaddr)
         with self._lock:
+            self._verified.pop(hwaddr, None)
             if hwaddr not in self._data:
                 return
             del self._data[hwaddr]
@@ -113,8 +128,41 @@ class AddrCache(object):
         """Clear all the address caches."""
         with self._lock:
             self._data.clear()
+            self._verified.clear()
         LOG.debug("Clean out all the address caches")
 
+    def mark_verified(self, hwaddr, ipaddr, ttl=None):
+        """
+        Remember that ipaddr was verified to belong to hwaddr.
+
+        :param hwaddr: Hardware address.
+        :param ipaddr: IP address verified for hwaddr.
+        :param ttl: Seconds to trust the verification, VERIFIED_TTL if None.
+        """
+        if ttl is None:
+            ttl = self.VERIFIED_TTL
+        hwaddr = self._format_hwaddr(hwaddr)
+        with self._lock:
+            self._verified[hwaddr] = (ipaddr, time.monotonic() + ttl)
+
+    def is_verified(self, hwaddr, ipaddr):
+        """
+        Check whether ipaddr was recently verified to belong to hwaddr.
+
+        :param hwaddr: Hardware address.
+        :param ipaddr: IP address to check.
+        :return: True if a verification of the pair has not expired yet.
+        """
+        hwaddr = self._format_hwaddr(hwaddr)
+        with self._lock:
+            verified = self._verified.get(hwaddr)
+            if verified is None:
+                return False
+            if verified[1] < time.monotonic():
+                del self._verified[hwaddr]
+                return False
+            return verified[0] == ipaddr
+
 
 class Sniffer(object):
     """
@@ -387,5 +435,203 @@ class TShark3ToLatest(TSharkSniffer):
     supported_versions = VersionInterval("[3.0.0,)")
 
 
+class PacketSniffer(Sniffer):
+    """
+    In-process sniffer decoding DHCP/DHCPv6 replies from an AF_PACKET socket.
+    """
+
+    command = "af_packet"
+    # From linux/if_ether.h
+    ETH_P_ALL = 0x0003
+    # From asm-generic/socket.h
+    SO_ATTACH_FILTER = 26
+    # Classic BPF program accepting UDP to port 68 (IPv4, non fragmented)
+    # or port 546 (IPv6 without extension headers), network header first
+    _bpf_filter = (
+        (0x30, 0, 0, 0x00000000),  # ldb [0]
+        (0x54, 0, 0, 0x000000F0),  # and #0xf0
+        (0x15, 0, 7, 0x00000040),  # jeq #0x40, ipv4, ipv6
+        (0x30, 0, 0, 0x00000009),  # ldb [9]
+        (0x15, 0, 11, 0x00000011),  # jeq #17 (udp), next, drop
+        (0x28, 0, 0, 0x00000006),  # ldh [6]
+        (0x45, 9, 0, 0x00001FFF),  # jset #0x1fff (fragment), drop, next
+        (0xB1, 0, 0, 0x00000000),  # ldxb 4*([0]&0xf)
+        (0x48, 0, 0, 0x00000002),  # ldh [x + 2]
+        (0x15, 5, 6, 0x00000044),  # jeq #68, accept, drop
+        (0x15, 0, 5, 0x00000060),  # ipv6: jeq #0x60, next, drop
+        (0x30, 0, 0, 0x00000006),  # ldb [6]
+        (0x15, 0, 3, 0x00000011),  # jeq #17 (udp), next, drop
+        (0x28, 0, 0, 0x0000002A),  # ldh [42]
+        (0x15, 0, 1, 0x00000222),  # jeq #546, accept, drop
+        (0x06, 0, 0, 0x0000FFFF),  # accept: ret #65535
+        (0x06, 0, 0, 0x00000000),  # drop: ret #0
+    )
+    # Seconds between checks of the stop request while no packet arrives
+    _poll_interval = 0.5
+
+    def __init__(self, addr_cache, log_file, remote_opts=None):
+        super(PacketSniffer, self).__init__(addr_cache, log_file, remote_opts)
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def _open_socket(cls):
+        return socket.socket(
+            socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(cls.ETH_P_ALL)
+        )
+
+    @classmethod
+    def is_supported(cls, session=None):
+        # The socket lives in this process, it can't sniff on a remote host
+        if session:
+            return False
+        try:
+            cls._open_socket().close()
+        except (AttributeError, OSError):
+            return False
+        return True
+
+    def _attach_filter(self, sock):
+        program = b"".join(struct.pack("HBBI", *insn) for insn in self._bpf_filter)
+        buf = ctypes.create_string_buffer(program, len(program))
+        fprog = struct.pack("HL", len(self._bpf_filter), ctypes.addressof(buf))
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, self.SO_ATTACH_FILTER, fprog)
+        except OSError as e:
+            # Every packet is still checked by the decoders, just slower
+            LOG.warning("Can't attach BPF filter to the ip sniffer: '%s'", e)
+
+    def _log(self, line):
+        try:
+            log_line(self._logfile, line)
+        except Exception as e:
+            LOG.warning("Can't log ip sniffer output: '%s'", e)
+
+    @staticmethod
+    def _iter_options(data, offset, code_fmt, pad_end=False):
+        """
+        Iterate over the TLV encoded options in data.
+
+        :param data: Packet payload.
+        :param offset: Offset of the first option in data.
+        :param code_fmt: struct format of the (code, length) option header.
+        :param pad_end: Whether the single byte Pad (0) and End (255) options
+                        of BootP/DHCP are used: Pads are skipped and the
+                        iteration stops at End.
+        """
+        header_len = struct.calcsize(code_fmt)
+        while offset < len(data):
+            if pad_end:
+                code = bytearray(data[offset : offset + 1])[0]
+                if code == 0:
+                    offset += 1
+                    continue
+                if code == 255:
+                    break
+            if offset + header_len > len(data):
+                break
+            code, length = struct.unpack_from(code_fmt, data, offset)
+            offset += header_len
+            yield code, data[offset : offset + length]
+            offset += length
+
+    def _handle_dhcp(self, payload):
+        # BootP/DHCP (RFC 951/2131)
+        if len(payload) < 240 or payload[236:240] != b"\x63\x82\x53\x63":
+            return
+        m_type = None
+        for code, value in self._iter_options(payload, 240, "!BB", pad_end=True):
+            if code == 53 and value:
+                m_type = bytearray(value)[0]
+                break
+        yiaddr = socket.inet_ntoa(payload[16:20])
+        hlen = bytearray(payload[2:3])[0]
+        # Update cache only if get the ACK reply
+        # and the previous request is not INFORM
+        if m_type != 5 or yiaddr == "0.0.0.0" or hlen != 6:
+            return
+        mac = ":".join("%02x" % byte for byte in bytearray(payload[28:34]))
+        self._log("DHCP ACK %s %s" % (mac, yiaddr))
+        self._cache[mac] = yiaddr
+
+    def _handle_dhcp6(self, payload):
+        # DHCPv6 (RFC 3315)
+        if len(payload) < 4 or bytearray(payload[0:1])[0] != 7:
+            return
+        mac = None
+        addrs = []
+        for code, value in self._iter_options(payload, 4, "!HH"):
+            if code == 1 and len(value) >= 6:
+                # Link-layer address ends DUID-LL and DUID-LLT client IDs
+                mac = ":".join("%02x" % byte for byte in bytearray(value[-6:]))
+            elif code in (3, 4):
+                # IA_NA carries IAID, T1 and T2 before its options, IA_TA only IAID
+                start = 12 if code == 3 else 4
+                for sub_code, sub_value in self._iter_options(value, start, "!HH"):
+                    if sub_code == 5 and len(sub_value) >= 16:
+                        addrs.append(str(ipaddress.IPv6Address(sub_value[:16])))
+        if not mac:
+            return
+        for ip in addrs:
+            self._log("DHCP6 REPLY %s %s" % (mac, ip))
+            self._cache["%s_6" % mac] = ip
+
+    def _handle_packet(self, packet):
+        """
+        Decode a network layer packet and update the address cache.
+
+        :param packet: Packet data starting at the IPv4/IPv6 header.
+        """
+        if not packet:
+            return
+        version = bytearray(packet[0:1])[0] >> 4
+        if version == 4:
+            ihl = (bytearray(packet[0:1])[0] & 0x0F) * 4
+            if len(packet) < ihl + 8 or bytearray(packet[9:10])[0] != 17:
+                return
+            (dport,) = struct.unpack_from("!H", packet, ihl + 2)
+            if dport == 68:
+                self._handle_dhcp(packet[ihl + 8 :])
+        elif version == 6:
+            if len(packet) < 48 or bytearray(packet[6:7])[0] != 17:
+                return
+            (dport,) = struct.unpack_from("!H", packet, 42)
+            if dport == 546:
+                self._handle_dhcp6(packet[48:])
+
+    def _sniff(self, sock):
+        try:
+            while not self._stop_event.is_set():
+                readable = select.select([sock], [], [], self._poll_interval)[0]
+                if not readable:
+                    continue
+                packet = sock.recv(65535)
+                try:
+                    self._handle_packet(packet)
+                except (struct.error, ValueError) as e:
+                    # Ignore problematical packets
+                    LOG.debug("Ignored malformed packet in ip sniffer: %s", e)
+        except (OSError, select.error) as e:
+            LOG.error("IP sniffer (%s) terminated unexpectedly: '%s'", self.command, e)
+        finally:
+            sock.close()
+
+    def _start(self):
+        sock = self._open_socket()
+        self._attach_filter(sock)
+        self._stop_event.clear()
+        self._process = threading.Thread(
+            target=self._sniff, args=(sock,), name="ip-sniffer"
+        )
+        self._process.daemon = True
+        self._process.start()
+
+    def stop(self):
+        """Stop sniffing."""
+        if self._process:
+            self._stop_event.set()
+            self._process.join(self._poll_interval * 4)
+            self._process = None
+
+
 #: All the defined sniffers
-Sniffers = (TShark3ToLatest, TShark1To2, TcpdumpSniffer)
+Sniffers = (PacketSniffer, TShark3ToLatest, TShark1To2, TcpdumpSniffer)
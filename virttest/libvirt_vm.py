@@ -252,17 +252,44 @@ class VM(virt_vm.BaseVM):
         if not self.is_alive():
             raise virt_vm.VMDeadError("Domain %s is inactive" % self.name, self.state())
 
+    def _get_state_cache(self):
+        """
+        Return the DomainStateCache of the VM's URI, None if it isn't used.
+        """
+        if self.params.get("virsh_state_cache", "no") != "yes":
+            return None
+        return virsh.DomainStateCache.get(self.connect_uri)
+
+    def _wait_for_state(self, func, timeout, text=None):
+        """
+        Wait until func() evaluates to True, checking it again after every
+        lifecycle event of the domains when the state cache is used.
+
+        :param func: Function checking the domain state.
+        :param timeout: Timeout in seconds.
+        :param text: Text to log before waiting.
+        """
+        cache = self._get_state_cache()
+        if cache is None:
+            return utils_misc.wait_until(func, timeout, text=text)
+        if text:
+            LOG.debug(text)
+        return cache.wait(func, timeout)
+
     def is_alive(self):
         """
         Return True if VM is alive.
         """
-        return virsh.is_alive(self.name, uri=self.connect_uri)
+        return not self.is_dead()
 
     def is_dead(self):
         """
         Return True if VM is dead.
         """
-        return virsh.is_dead(self.name, uri=self.connect_uri)
+        cache = self._get_state_cache()
+        if cache is None:
+            return virsh.is_dead(self.name, uri=self.connect_uri)
+        return cache.is_dead(self.name)
 
     def is_paused(self):
         """
@@ -337,6 +364,9 @@ class VM(virt_vm.BaseVM):
         """
         Return domain state.
         """
+        cache = self._get_state_cache()
+        if cache is not None:
+            return cache.get_state(self.name)
         result = virsh.domstate(self.name, uri=self.connect_uri)
         return result.stdout_text.strip()
 
@@ -2215,7 +2245,7 @@ class VM(virt_vm.BaseVM):
                 # some other problem happened, raise normally
                 raise
             # Wait for the domain to be created
-            utils_misc.wait_for(
+            self._wait_for_state(
                 func=self.is_alive,
                 timeout=60,
                 text=("waiting for domain %s to start" % self.name),
@@ -2248,8 +2278,10 @@ class VM(virt_vm.BaseVM):
         )
         # On successful migration, point to guests new hypervisor.
         # Since dest_uri could be None, checking it is necessary.
-        if result.exit_status == 0 and dest_uri:
-            self.connect_uri = dest_uri
+        if result.exit_status == 0:
+            self.close_ssh_multiplexer()
+            if dest_uri:
+                self.connect_uri = dest_uri
 
         # Set vm name in case --dname is specified.
         migrate_options = ""
@@ -2382,7 +2414,7 @@ class VM(virt_vm.BaseVM):
                             LOG.debug(
                                 "Shutdown command sent; waiting for VM " "to go down..."
                             )
-                            if utils_misc.wait_for(self.is_dead, 60, 1, 1):
+                            if self._wait_for_state(self.is_dead, 60):
                                 LOG.debug("VM is down")
                                 return
                         finally:
@@ -2396,6 +2428,7 @@ class VM(virt_vm.BaseVM):
 
         finally:
             self.cleanup_serial_console()
+            self.close_ssh_multiplexer()
         if free_mac_addresses:
             if self.is_persistent():
                 LOG.warning(
@@ -2719,7 +2752,7 @@ class VM(virt_vm.BaseVM):
         result = virsh.start(self.name, uri=self.connect_uri)
         if not result.exit_status:
             # Wait for the domain to be created
-            has_started = utils_misc.wait_for(
+            has_started = self._wait_for_state(
                 func=self.is_alive,
                 timeout=60,
                 text=("waiting for domain %s " "to start" % self.name),
@@ -2773,6 +2806,13 @@ class VM(virt_vm.BaseVM):
         :param name: Optional timeout value
         """
         timeout = count
+        cache = self._get_state_cache()
+        if cache is not None:
+            start_time = time.time()
+            if cache.wait(self.is_dead, timeout):
+                LOG.debug("Shutdown took %d seconds", time.time() - start_time)
+                return True
+            return False
         while count > 0:
             # check every 5 seconds
             if count % 5 == 0:
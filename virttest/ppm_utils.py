@@ -6,14 +6,21 @@ Utility functions to deal with ppm (qemu screendump format) files.
 
 from __future__ import division
 
-import glob
+import json
 import logging
+import operator
 import os
 import re
-import struct
+import tempfile
+import threading
 import time
 from functools import reduce
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 try:
     from PIL import Image, ImageDraw, ImageFont, ImageOps
 except ImportError:
@@ -158,11 +165,13 @@ def image_crop(width, height, data, x1, y1, dx, dy):
         dx = width - x1
     if dy > height - y1:
         dy = height - y1
-    newdata = b""
-    index = (x1 + y1 * width) * 3
-    for _ in range(dy):
-        newdata += data[index : (index + dx * 3)]
-        index += width * 3
+    view = memoryview(data)
+    start = (x1 + y1 * width) * 3
+    stride = width * 3
+    newdata = b"".join(
+        view[index : index + dx * 3]
+        for index in range(start, start + dy * stride, stride)
+    )
     return (dx, dy, newdata)
 
 
@@ -224,6 +233,39 @@ def image_verify_ppm_file(filename):
         return False
 
 
+#: bytes.translate() table mapping zero to 0 and anything else to 1
+_NONZERO_TABLE = bytes(bytearray([0] + [1] * 255))
+#: bytes.translate() table mapping zero to 1 and anything else to 0
+_ZERO_TABLE = bytes(bytearray([1] + [0] * 255))
+
+
+def _pixel_diff_mask(pixels, data1, data2):
+    """
+    Return one byte per pixel, 1 if the pixel differs in data1 and data2.
+
+    Pure Python fallback working on whole buffers at once through integer
+    xor and byte translation instead of looping over the pixels.
+    """
+    size = pixels * 3
+    diff = int.from_bytes(memoryview(data1)[:size], "big") ^ int.from_bytes(
+        memoryview(data2)[:size], "big"
+    )
+    diff = diff.to_bytes(size, "big").translate(_NONZERO_TABLE)
+    mask = (
+        int.from_bytes(diff[0::3], "big")
+        | int.from_bytes(diff[1::3], "big")
+        | int.from_bytes(diff[2::3], "big")
+    )
+    return mask.to_bytes(pixels, "big")
+
+
+def _pixel_array(pixels, data):
+    """Return a zero-copy (pixels, 3) numpy view of the image data."""
+    return numpy.frombuffer(data, dtype=numpy.uint8, count=pixels * 3).reshape(
+        pixels, 3
+    )
+
+
 def image_comparison(width, height, data1, data2):
     """
     Generate a green-red comparison image from two given images.
@@ -237,31 +279,44 @@ def image_comparison(width, height, data1, data2):
 
     :note: Input images must be the same size.
     """
-    newdata = ""
-    i = 0
-    while i < width * height * 3:
-        # Compute monochromatic value of current pixel in data1
-        pixel1_str = data1[i : i + 3]
-        temp = struct.unpack("BBB", pixel1_str)
-        value1 = int((temp[0] + temp[1] + temp[2]) / 3)
-        # Compute monochromatic value of current pixel in data2
-        pixel2_str = data2[i : i + 3]
-        temp = struct.unpack("BBB", pixel2_str)
-        value2 = int((temp[0] + temp[1] + temp[2]) / 3)
-        # Compute average of the two values
-        value = int((value1 + value2) / 2)
-        # Scale value to the upper half of the range [0, 255]
-        value = 128 + value // 2
-        # Compare pixels
-        if pixel1_str == pixel2_str:
-            # Equal -- give the pixel a greenish hue
-            newpixel = [0, value, 0]
-        else:
-            # Not equal -- give the pixel a reddish hue
-            newpixel = [value, 0, 0]
-        newdata += struct.pack("BBB", newpixel[0], newpixel[1], newpixel[2])
-        i += 3
-    return (width, height, newdata)
+    pixels = width * height
+    if numpy is not None:
+        pixels1 = _pixel_array(pixels, data1)
+        pixels2 = _pixel_array(pixels, data2)
+        # Average of the monochromatic values of both pixels, scaled to the
+        # upper half of the range [0, 255]
+        value1 = pixels1.sum(axis=1, dtype=numpy.uint16) // 3
+        value2 = pixels2.sum(axis=1, dtype=numpy.uint16) // 3
+        value = (128 + (value1 + value2) // 4).astype(numpy.uint8)
+        equal = (pixels1 == pixels2).all(axis=1)
+        newdata = numpy.zeros((pixels, 3), dtype=numpy.uint8)
+        # Equal -- give the pixel a greenish hue
+        newdata[:, 1] = numpy.where(equal, value, 0)
+        # Not equal -- give the pixel a reddish hue
+        newdata[:, 0] = numpy.where(equal, 0, value)
+        return (width, height, newdata.tobytes())
+
+    data1 = memoryview(data1)[: pixels * 3].tobytes()
+    data2 = memoryview(data2)[: pixels * 3].tobytes()
+    value = bytes(
+        bytearray(
+            128 + ((r1 + g1 + b1) // 3 + (r2 + g2 + b2) // 3) // 4
+            for r1, g1, b1, r2, g2, b2 in zip(
+                data1[0::3],
+                data1[1::3],
+                data1[2::3],
+                data2[0::3],
+                data2[1::3],
+                data2[2::3],
+            )
+        )
+    )
+    different = _pixel_diff_mask(pixels, data1, data2)
+    equal = different.translate(_ZERO_TABLE)
+    newdata = bytearray(pixels * 3)
+    newdata[0::3] = bytearray(map(operator.mul, value, different))
+    newdata[1::3] = bytearray(map(operator.mul, value, equal))
+    return (width, height, bytes(newdata))
 
 
 def image_fuzzy_compare(width, height, data1, data2):
@@ -276,19 +331,11 @@ def image_fuzzy_compare(width, height, data1, data2):
 
     :note: Input images must be the same size.
     """
-    equal = 0.0
-    different = 0.0
-    i = 0
-    while i < width * height * 3:
-        pixel1_str = data1[i : i + 3]
-        pixel2_str = data2[i : i + 3]
-        # Compare pixels
-        if pixel1_str == pixel2_str:
-            equal += 1.0
-        else:
-            different += 1.0
-        i += 3
-    return equal / (equal + different)
+    pixels = width * height
+    if numpy is not None:
+        equal = (_pixel_array(pixels, data1) == _pixel_array(pixels, data2)).all(axis=1)
+        return float(numpy.count_nonzero(equal)) / pixels
+    return _pixel_diff_mask(pixels, data1, data2).count(0) / float(pixels)
 
 
 def image_average_hash(image, img_wd=8, img_ht=8):
@@ -299,7 +346,7 @@ def image_average_hash(image, img_wd=8, img_ht=8):
     """
     if not isinstance(image, Image.Image):
         image = Image.open(image)
-    image = image.resize((img_wd, img_ht), Image.ANTIALIAS).convert("L")
+    image = image.resize((img_wd, img_ht), Image.LANCZOS).convert("L")
     avg = reduce(lambda x, y: x + y, image.getdata()) / (img_wd * img_ht)
 
     def _hta(i):
@@ -313,6 +360,25 @@ def image_average_hash(image, img_wd=8, img_ht=8):
     )
 
 
+def image_difference_hash(image, img_wd=8, img_ht=8):
+    """
+    Resize and convert the image, then calculate the difference hash from
+    the gradient between horizontally adjacent pixels.
+
+    :param image: an image path or an opened image object
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image = image.resize((img_wd + 1, img_ht), Image.LANCZOS).convert("L")
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(img_ht):
+        offset = row * (img_wd + 1)
+        for col in range(offset, offset + img_wd):
+            value = (value << 1) | (pixels[col] > pixels[col + 1])
+    return value
+
+
 def cal_hamming_distance(h1, h2):
     """
     Calculate the hamming distance
@@ -348,27 +414,207 @@ def img_similar(base_img, comp_img, threshold=10):
         return False
 
 
-def have_similar_img(base_img, comp_img_path, threshold=10):
+class ImageHashIndex(object):
+    """
+    Persistent perceptual hashes of the images in a directory.
+
+    The perceptual hashes of every image are appended as JSON lines to an
+    index file in the directory, together with the size and modification
+    time of the image, so images are hashed only once and similarity
+    lookups just compare integers. A directory that must not be written
+    to gets an index kept in memory only.
+    """
+
+    #: Name of the index file inside the directory
+    index_filename = ".image_hashes"
+    #: Extensions of the images refresh() indexes
+    image_extensions = ("jpg", "jpeg", "gif", "png", "pmp", "ppm")
+    #: Functions computing the hashes of the entries
+    hash_functions = {
+        "ahash": image_average_hash,
+        "dhash": image_difference_hash,
+    }
+
+    def __init__(
+        self,
+        directory,
+        image_extensions=None,
+        hash_types=("ahash", "dhash"),
+        persistent=True,
+    ):
+        """
+        Load the index of directory, if there is one.
+
+        :param directory: Directory holding the images.
+        :param image_extensions: Extensions of the images to index.
+        :param hash_types: Hashes computed for every image ("ahash" and/or
+                           "dhash").
+        :param persistent: Whether the index is kept in a file of the
+                           directory, or in memory only.
+        """
+        self.directory = directory
+        if image_extensions is not None:
+            self.image_extensions = tuple(image_extensions)
+        self.hash_types = tuple(hash_types)
+        self.persistent = persistent
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, self.index_filename)
+
+    def _load(self):
+        if not self.persistent:
+            return
+        try:
+            with open(self.index_path) as index_file:
+                lines = index_file.readlines()
+        except (IOError, OSError):
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                self._entries[entry["file"]] = entry
+            except (ValueError, KeyError, TypeError):
+                # Ignore a line cut short by an interrupted append
+                continue
+
+    def _append(self, entry):
+        if not self.persistent:
+            return
+        try:
+            with open(self.index_path, "a") as index_file:
+                index_file.write(json.dumps(entry) + "\n")
+        except (IOError, OSError) as e:
+            LOG.debug("Can't update image hash index %s: %s", self.index_path, e)
+
+    def _rewrite(self):
+        if not self.persistent:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=self.index_filename + ".", dir=self.directory
+            )
+            with os.fdopen(fd, "w") as index_file:
+                for entry in self._entries.values():
+                    index_file.write(json.dumps(entry) + "\n")
+            os.rename(tmp_path, self.index_path)
+        except (IOError, OSError) as e:
+            LOG.debug("Can't rewrite image hash index %s: %s", self.index_path, e)
+
+    def add(self, filename, image=None):
+        """
+        Hash an image of the directory and record it in the index.
+
+        :param filename: Image file name, relative to the directory or not.
+        :param image: Opened image object to hash instead of the file.
+        :return: The index entry of the image.
+        """
+        name = os.path.basename(filename)
+        stat = os.stat(os.path.join(self.directory, name))
+        if image is None:
+            image = Image.open(os.path.join(self.directory, name))
+        entry = {"file": name, "size": stat.st_size, "mtime": stat.st_mtime}
+        for hash_type in self.hash_types:
+            entry[hash_type] = self.hash_functions[hash_type](image)
+        with self._lock:
+            self._entries[name] = entry
+            self._append(entry)
+        return entry
+
+    def refresh(self):
+        """
+        Hash the new and modified images, forget about the removed ones.
+        """
+        with self._lock:
+            present = set()
+            for name in os.listdir(self.directory):
+                if name.rsplit(".", 1)[-1].lower() not in self.image_extensions:
+                    continue
+                present.add(name)
+                entry = self._entries.get(name)
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                    if (
+                        entry
+                        and entry["size"] == stat.st_size
+                        and entry["mtime"] == stat.st_mtime
+                        and all(hash_type in entry for hash_type in self.hash_types)
+                    ):
+                        continue
+                    self.add(name)
+                except (IOError, OSError) as e:
+                    LOG.debug("Can't hash image %s: %s", name, e)
+            removed = set(self._entries) - present
+            if removed:
+                for name in removed:
+                    del self._entries[name]
+                self._rewrite()
+
+    def find_similar(self, image_hash, threshold=10, hash_type="ahash"):
+        """
+        Find the indexed images close to image_hash.
+
+        :param image_hash: Perceptual hash of the image to look for.
+        :param threshold: Hamming distance below which images are similar.
+        :param hash_type: "ahash" (average) or "dhash" (difference hash).
+        :return: List of (image path, distance), closest first.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        similar = []
+        for entry in entries:
+            if hash_type not in entry:
+                continue
+            distance = cal_hamming_distance(image_hash, entry[hash_type])
+            if distance < threshold:
+                similar.append((os.path.join(self.directory, entry["file"]), distance))
+        return sorted(similar, key=lambda item: item[1])
+
+
+# Indexes of the reference image directories used by have_similar_img
+_image_hash_indexes = {}
+
+
+def have_similar_img(base_img, comp_img_path, threshold=10, base_img_hash=None):
     """
     Check whether comp_img_path have a image looks like base_img.
-    """
-    support_img_format = ["jpg", "jpeg", "gif", "png", "pmp"]
-    comp_images = []
-    if os.path.isdir(comp_img_path):
-        for ext in support_img_format:
-            comp_images.extend(
-                [
-                    os.path.join(comp_img_path, x)
-                    for x in glob.glob1(comp_img_path, "*.%s" % ext)
-                ]
-            )
-    else:
-        comp_images.append(comp_img_path)
 
-    for img in comp_images:
-        if img_similar(base_img, img, threshold):
-            return True
-    return False
+    The hashes of the images of a comp_img_path directory are kept in
+    memory, the reference directories may be read-only.
+
+    :param base_img: Path of the image to look for.
+    :param comp_img_path: Reference image, or directory of reference images.
+    :param threshold: Hamming distance below which images are similar.
+    :param base_img_hash: Average hash of base_img, when already computed.
+    """
+    if not os.path.isdir(comp_img_path):
+        if base_img_hash is None:
+            return img_similar(base_img, comp_img_path, threshold)
+        try:
+            comp_img_hash = image_average_hash(comp_img_path)
+        except IOError:
+            return False
+        return cal_hamming_distance(comp_img_hash, base_img_hash) < threshold
+
+    index = _image_hash_indexes.get(comp_img_path)
+    if index is None:
+        index = ImageHashIndex(
+            comp_img_path,
+            ["jpg", "jpeg", "gif", "png", "pmp"],
+            hash_types=("ahash",),
+            persistent=False,
+        )
+        _image_hash_indexes[comp_img_path] = index
+    index.refresh()
+    if base_img_hash is None:
+        try:
+            base_img_hash = image_average_hash(base_img)
+        except IOError:
+            return False
+    return bool(index.find_similar(base_img_hash, threshold))
 
 
 def image_crop_save(image, new_image, box=None):
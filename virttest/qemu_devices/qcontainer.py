@@ -10,12 +10,16 @@ interact and verify the qemu qdev structure.
 # Python imports
 from __future__ import division
 
+import copy
+import glob
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
 import stat
+import tempfile
 import uuid
 
 import aexpect
@@ -43,6 +47,7 @@ from virttest import (
     virt_vm,
     vt_iothread,
 )
+from virttest.compat import get_settings_value
 from virttest.qemu_capabilities import Capabilities, Flags, MigrationParams
 from virttest.qemu_devices import qdevices
 from virttest.qemu_devices.qdevices import QThrottleGroup
@@ -60,6 +65,188 @@ from virttest.utils_version import VersionInterval
 
 LOG = logging.getLogger("avocado." + __name__)
 
+# Bump it whenever the probed data stored in the cache changes
+_QEMU_PROBES_CACHE_VERSION = 3
+# Probes of the qemu binaries already used by this process
+_qemu_probes_cache = {}
+
+
+def _parse_hmp_cmds(output):
+    """
+    :param output: output of the human monitor "help" command
+    :return: list of human monitor commands
+    """
+    hmp_cmds = []
+    for cmd in re.findall(r"^([^()\|\[\sA-Z]+\|?\w+)", output, re.M):
+        if "|" not in cmd:
+            if cmd != "The":
+                hmp_cmds.append(cmd)
+        else:
+            hmp_cmds.extend(cmd.split("|"))
+    return hmp_cmds
+
+
+def _get_qmp_cmd_args(schema):
+    """
+    :param schema: return of the QMP "query-qmp-schema" command
+    :return: dict mapping every QMP command to the names of its arguments
+    """
+    types = dict((entry["name"], entry) for entry in schema)
+    cmd_args = {}
+    for entry in schema:
+        if entry.get("meta-type") == "command":
+            arg_type = types.get(entry.get("arg-type"), {})
+            members = arg_type.get("members", [])
+            cmd_args[entry["name"]] = [member["name"] for member in members]
+    return cmd_args
+
+
+def _get_machines_info(machines):
+    """
+    :param machines: return of the QMP "query-machines" command
+    :return: dict mapping the machines (and aliases) to their description,
+             in the same way as utils_qemu.get_machines_info
+    """
+    machines_info = {}
+    for machine in machines:
+        machines_info[machine["name"]] = (
+            "(default)" if machine.get("is-default") else ""
+        )
+        if "alias" in machine:
+            machines_info[machine["alias"]] = "(alias of %s)" % machine["name"]
+    return machines_info
+
+
+def _get_qemu_module_dirs(path):
+    """
+    Get the directories qemu may load its modules from.
+
+    :param path: real path of the qemu binary
+    :return: list of the existing module directories
+    """
+    prefix = os.path.dirname(os.path.dirname(path))
+    candidates = [os.environ.get("QEMU_MODULE_DIR", "")]
+    for lib_dir in ("lib64", "lib", os.path.join("lib", "*-linux-gnu")):
+        candidates.extend(sorted(glob.glob(os.path.join(prefix, lib_dir, "qemu"))))
+    module_dirs = []
+    for module_dir in candidates:
+        if os.path.isdir(module_dir) and module_dir not in module_dirs:
+            module_dirs.append(module_dir)
+    return module_dirs
+
+
+def _get_qemu_signature(qemu_binary, workaround_qemu_qmp_crash="no"):
+    """
+    Get the signature identifying the probes of a qemu binary.
+
+    The modules of qemu (devices, block drivers, accelerators) change the
+    probes without touching the binary, so the modules installed are part
+    of the signature.
+
+    :param qemu_binary: qemu binary
+    :param workaround_qemu_qmp_crash: value of the param, which changes how
+                                      the QMP commands are probed
+    :return: signature of the probes, None when the binary can't be inspected
+    """
+    path = os.path.realpath(qemu_binary)
+    try:
+        st = os.stat(path)
+        modules = []
+        for module_dir in _get_qemu_module_dirs(path):
+            mtime = os.stat(module_dir).st_mtime_ns
+            listing = ",".join(sorted(os.listdir(module_dir)))
+            modules.append("%s:%d:%s" % (module_dir, mtime, listing))
+    except OSError:
+        return None
+    return "%s:%d:%d:%d:%d:%s:%s" % (
+        path,
+        st.st_dev,
+        st.st_ino,
+        st.st_size,
+        st.st_mtime_ns,
+        workaround_qemu_qmp_crash == "always",
+        ";".join(modules),
+    )
+
+
+def _get_qemu_probes_path(signature):
+    """
+    :param signature: signature of the qemu binary
+    :return: path of the file caching its probes, None when disabled
+    """
+    cache_dir = get_settings_value("vt.qemu", "capabilities_cache_dir", default="")
+    if not cache_dir:
+        return None
+    digest = hashlib.sha1(signature.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "qemu-probes-%s.json" % digest)
+
+
+def _load_qemu_probes(qemu_binary, workaround_qemu_qmp_crash="no"):
+    """
+    Get the cached probes of a qemu binary.
+
+    :param qemu_binary: qemu binary
+    :param workaround_qemu_qmp_crash: value of the param the probes used
+    :return: dict of the probes, a copy of the cached one that the caller
+             may change, None when they are not cached
+    """
+    signature = _get_qemu_signature(qemu_binary, workaround_qemu_qmp_crash)
+    if signature is None:
+        return None
+    if signature in _qemu_probes_cache:
+        return copy.deepcopy(_qemu_probes_cache[signature])
+    path = _get_qemu_probes_path(signature)
+    if path is None or not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as cache_file:
+            cached = json.load(cache_file)
+    except (IOError, OSError, ValueError) as details:
+        LOG.debug("Ignoring the qemu probes cache %s: %s", path, details)
+        return None
+    if (
+        cached.get("version") != _QEMU_PROBES_CACHE_VERSION
+        or cached.get("signature") != signature
+    ):
+        return None
+    _qemu_probes_cache[signature] = cached["probes"]
+    return copy.deepcopy(cached["probes"])
+
+
+def _save_qemu_probes(qemu_binary, probes, workaround_qemu_qmp_crash="no"):
+    """
+    Cache the probes of a qemu binary.
+
+    :param qemu_binary: qemu binary
+    :param probes: dict of the probes, copied into the cache
+    :param workaround_qemu_qmp_crash: value of the param the probes used
+    """
+    signature = _get_qemu_signature(qemu_binary, workaround_qemu_qmp_crash)
+    if signature is None:
+        return
+    _qemu_probes_cache[signature] = copy.deepcopy(probes)
+    path = _get_qemu_probes_path(signature)
+    if path is None:
+        return
+    cached = {
+        "version": _QEMU_PROBES_CACHE_VERSION,
+        "signature": signature,
+        "probes": probes,
+    }
+    try:
+        cache_dir = os.path.dirname(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write a temporary file first, so concurrent readers never see
+        # partially written probes
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump(cached, cache_file)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as details:
+        LOG.debug("Unable to cache the qemu probes in %s: %s", path, details)
+
+
 #
 # Device container (device representation of VM)
 # This class represents VM by storing all devices and their connections (buses)
@@ -121,23 +308,16 @@ class DevContainer(object):
 
         def get_hmp_cmds(qemu_binary):
             """:return: list of human monitor commands"""
-            _ = process.run(
-                "echo -e 'help\nquit' | %s -monitor "
-                "stdio -vnc none -S" % qemu_binary,
-                timeout=10,
-                ignore_status=True,
-                shell=True,
-                verbose=False,
-            ).stdout_text
-            _ = re.findall(r"^([^()\|\[\sA-Z]+\|?\w+)", _, re.M)
-            hmp_cmds = []
-            for cmd in _:
-                if "|" not in cmd:
-                    if cmd != "The":
-                        hmp_cmds.append(cmd)
-                else:
-                    hmp_cmds.extend(cmd.split("|"))
-            return hmp_cmds
+            return _parse_hmp_cmds(
+                process.run(
+                    "echo -e 'help\nquit' | %s -monitor "
+                    "stdio -vnc none -S" % qemu_binary,
+                    timeout=10,
+                    ignore_status=True,
+                    shell=True,
+                    verbose=False,
+                ).stdout_text
+            )
 
         def get_qmp_cmds(qemu_binary, workaround_qemu_qmp_crash=False):
             """:return: list of qmp commands"""
@@ -178,42 +358,103 @@ class DevContainer(object):
         self.__qemu_binary = qemu_binary
         self.__execute_qemu_last = None
         self.__execute_qemu_out = ""
-        # Check whether we need to add machine_type
-        cmd = (
-            "echo -e 'quit' | %s -monitor stdio -nodefaults -nographic -S" % qemu_binary
-        )
-        result = process.run(
-            cmd, timeout=10, ignore_status=True, shell=True, verbose=False
-        )
-        # Some architectures (arm) require machine type to be always set and some
-        # hardware/firmware restrictions cause we need to set machine type.
-        failed_pattern = (
-            r"(?:kvm_init_vcpu.*failed)|(?:machine specified)"
-            r"|(?:appending -machine)"
-        )
-        output = result.stdout_text + result.stderr_text
-        if result.exit_status and re.search(failed_pattern, output):
-            self.__workaround_machine_type = True
-            basic_qemu_cmd = "%s -machine none" % qemu_binary
-        else:
+        # The probes only depend on the qemu binary (and how its QMP commands
+        # are probed), reuse them as long as the binary is not changed
+        probes = _load_qemu_probes(qemu_binary, workaround_qemu_qmp_crash)
+        if probes is None:
+            # Introspect qemu in a single QMP session, the former probes are
+            # only used for what this qemu failed to answer
+            qmp_commands = [
+                ("query-version", None),
+                ("query-commands", None),
+                ("query-qmp-schema", None),
+                ("qom-list-types", {"implements": "user-creatable"}),
+                ("qom-list-properties", {"typename": "none-machine"}),
+                ("query-machines", None),
+                ("human-monitor-command", {"command-line": "help"}),
+            ]
+            results = utils_qemu.execute_qmp_commands(qemu_binary, qmp_commands)
+            # Some architectures (arm) require machine type to be always set and some
+            # hardware/firmware restrictions cause we need to set machine type:
+            # such qemu doesn't even start without it.
             self.__workaround_machine_type = False
             basic_qemu_cmd = qemu_binary
-        self.__qemu_help = self.execute_qemu("-help", 10)
-        # escape the '?' otherwise it will fail if we have a single-char
-        # filename in cwd
-        self.__device_help = self.execute_qemu("-device \? 2>&1", 10)
-        self.__object_help = self.execute_qemu("-object \? 2>&1", 10)
-        self.__machines_info = utils_qemu.get_machines_info(qemu_binary)
-        self.__hmp_cmds = get_hmp_cmds(basic_qemu_cmd)
-        self.__qmp_cmds = get_qmp_cmds(
-            basic_qemu_cmd, workaround_qemu_qmp_crash == "always"
-        )
+            if all(result is None for result in results):
+                results = utils_qemu.execute_qmp_commands(
+                    "%s -machine none" % qemu_binary, qmp_commands
+                )
+                if any(result is not None for result in results):
+                    self.__workaround_machine_type = True
+                    basic_qemu_cmd = "%s -machine none" % qemu_binary
+            (
+                version,
+                commands,
+                schema,
+                object_types,
+                machine_props,
+                machines,
+                hmp_help,
+            ) = results
+            probes = {
+                "workaround_machine_type": self.__workaround_machine_type,
+                # QMP has neither the command line options with their syntax
+                # (query-command-line-options misses most of them), which
+                # callers search in the help text, nor the device aliases
+                # (e.g. virtio-blk), so these two still run qemu
+                "qemu_help": self.execute_qemu("-help", 10),
+                # escape the '?' otherwise it will fail if we have a single-char
+                # filename in cwd
+                "device_help": self.execute_qemu("-device \? 2>&1", 10),
+                "qmp_cmd_args": _get_qmp_cmd_args(schema or []),
+            }
+            if machine_props is not None:
+                probes["machine_props"] = [prop["name"] for prop in machine_props]
+            else:
+                probes["machine_props"] = None
+                probes["machine_help"] = self.execute_qemu("-machine none,help", 10)
+            if object_types is not None:
+                probes["object_types"] = [obj["name"] for obj in object_types]
+            else:
+                probes["object_types"] = None
+                probes["object_help"] = self.execute_qemu("-object \? 2>&1", 10)
+            if machines is not None:
+                probes["machines_info"] = _get_machines_info(machines)
+            else:
+                probes["machines_info"] = utils_qemu.get_machines_info(qemu_binary)
+            if hmp_help is not None:
+                probes["hmp_cmds"] = _parse_hmp_cmds(hmp_help)
+            else:
+                probes["hmp_cmds"] = get_hmp_cmds(basic_qemu_cmd)
+            if commands is not None:
+                probes["qmp_cmds"] = [command["name"] for command in commands]
+            else:
+                probes["qmp_cmds"] = get_qmp_cmds(
+                    basic_qemu_cmd, workaround_qemu_qmp_crash == "always"
+                )
+            if version is not None:
+                probes["qemu_ver"] = "%(major)d.%(minor)d.%(micro)d" % version["qemu"]
+            else:
+                probes["qemu_ver"] = utils_qemu.get_qemu_version(qemu_binary)[0]
+            # Don't keep the probes of a qemu that failed to answer them
+            if probes["qemu_help"] and probes["qmp_cmds"] is not None:
+                _save_qemu_probes(qemu_binary, probes, workaround_qemu_qmp_crash)
+        self.__workaround_machine_type = probes["workaround_machine_type"]
+        self.__qemu_help = probes["qemu_help"]
+        self.__device_help = probes["device_help"]
+        self.__machine_props = probes["machine_props"]
+        self.__machine_help = probes.get("machine_help", "")
+        self.__object_types = probes["object_types"]
+        self.__object_help = probes.get("object_help", "")
+        self.__machines_info = probes["machines_info"]
+        self.__hmp_cmds = probes["hmp_cmds"]
+        self.__qmp_cmds = probes["qmp_cmds"]
+        self.__qmp_cmd_args = probes["qmp_cmd_args"]
         self.vmname = vmname
         self.strict_mode = strict_mode == "yes"
         self.__devices = []
         self.__buses = []
         self.allow_hotplugged_vm = allow_hotplugged_vm == "yes"
-        self.__qemu_ver = utils_qemu.get_qemu_version(self.__qemu_binary)[0]
+        self.__qemu_ver = probes["qemu_ver"]
         self.caps = Capabilities()
         self.mig_params = Capabilities()
         self._probe_capabilities()
@@ -422,8 +663,10 @@ class DevContainer(object):
         if self.has_option("incoming defer"):
             self.caps.set_flag(Flags.INCOMING_DEFER)
         # -machine memory-backend
-        machine_help = self.execute_qemu("-machine none,help")
-        if re.search(r"memory-backend=", machine_help, re.MULTILINE):
+        if self.__machine_props is not None:
+            if "memory-backend" in self.__machine_props:
+                self.caps.set_flag(Flags.MACHINE_MEMORY_BACKEND)
+        elif re.search(r"memory-backend=", self.__machine_help, re.MULTILINE):
             self.caps.set_flag(Flags.MACHINE_MEMORY_BACKEND)
         # -object sev-guest
         if self.has_object("sev-guest"):
@@ -439,11 +682,15 @@ class DevContainer(object):
             self.caps.set_flag(Flags.FLOPPY_DEVICE)
 
         # QMP: block-stream/block-commit @backing-mask-protocol
-        # TODO: probe cap via using the qmp command `query-qmp-schema`
-        #       instead of hardcoding the version range
-        if self.__qemu_ver in VersionInterval(
-            self.BLOCKJOB_BACKING_MASK_PROTOCOL_VERSION_SCOPE
-        ):
+        if self.__qmp_cmd_args:
+            backing_mask_protocol = self.has_qmp_cmd_arg(
+                "block-stream", "backing-mask-protocol"
+            ) and self.has_qmp_cmd_arg("block-commit", "backing-mask-protocol")
+        else:
+            backing_mask_protocol = self.__qemu_ver in VersionInterval(
+                self.BLOCKJOB_BACKING_MASK_PROTOCOL_VERSION_SCOPE
+            )
+        if backing_mask_protocol:
             self.caps.set_flag(Flags.BLOCKJOB_BACKING_MASK_PROTOCOL)
 
         if self.has_qmp_cmd("migrate-set-parameters") and self.has_hmp_cmd(
@@ -454,13 +701,27 @@ class DevContainer(object):
     def _probe_migration_parameters(self):
         """Probe migration parameters."""
         mig_params_mapping = {
-            MigrationParams.DOWNTIME_LIMIT: self.MIGRATION_DOWNTIME_LIMTT_VERSION_SCOPE,
-            MigrationParams.MAX_BANDWIDTH: self.MIGRATION_MAX_BANDWIDTH_VERSION_SCOPE,
-            MigrationParams.XBZRLE_CACHE_SIZE: self.MIGRATION_XBZRLE_CACHE_SIZE_VERSION_SCOPE,
+            MigrationParams.DOWNTIME_LIMIT: (
+                "downtime-limit",
+                self.MIGRATION_DOWNTIME_LIMTT_VERSION_SCOPE,
+            ),
+            MigrationParams.MAX_BANDWIDTH: (
+                "max-bandwidth",
+                self.MIGRATION_MAX_BANDWIDTH_VERSION_SCOPE,
+            ),
+            MigrationParams.XBZRLE_CACHE_SIZE: (
+                "xbzrle-cache-size",
+                self.MIGRATION_XBZRLE_CACHE_SIZE_VERSION_SCOPE,
+            ),
         }
 
-        for mig_param, ver_scope in mig_params_mapping.items():
-            if self.__qemu_ver in VersionInterval(ver_scope):
+        for mig_param, (name, ver_scope) in mig_params_mapping.items():
+            # Prefer the QMP schema, the version scope is only a fallback
+            if self.__qmp_cmd_args:
+                supported = self.has_qmp_cmd_arg("migrate-set-parameters", name)
+            else:
+                supported = self.__qemu_ver in VersionInterval(ver_scope)
+            if supported:
                 self.mig_params.set_flag(mig_param)
 
     def __getitem__(self, item):
@@ -778,6 +1039,8 @@ class DevContainer(object):
         :param obj: Desired object string, e.g. 'sev-guest'
         :return: True if the object is supported by qemu, or False
         """
+        if self.__object_types is not None:
+            return obj in self.__object_types
         return bool(re.search(r"^\s*%s\n" % obj, self.__object_help, re.M))
 
     def get_help_text(self):
@@ -800,6 +1063,14 @@ class DevContainer(object):
         """
         return cmd in self.__qmp_cmds
 
+    def has_qmp_cmd_arg(self, cmd, arg):
+        """
+        :param cmd: Desired QMP command
+        :param arg: Desired argument of the command
+        :return: Does this qemu's QMP schema define the argument of the command?
+        """
+        return arg in self.__qmp_cmd_args.get(cmd, [])
+
     def execute_qemu(self, options, timeout=5):
         """
         Execute this qemu and return the stdout+stderr output.
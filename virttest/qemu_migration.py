@@ -2,9 +2,19 @@
 Interface for QEMU migration.
 """
 
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+from virttest import qemu_monitor, utils_misc
 from virttest.qemu_capabilities import Flags, MigrationParams
 from virttest.utils_numeric import normalize_data_size
 
+LOG = logging.getLogger("avocado." + __name__)
+
 
 def set_downtime(vm, value):
     """
@@ -50,3 +60,170 @@ def set_cache_size(vm, value):
     ):
         return vm.monitor.set_migrate_parameter("xbzrle-cache-size", value)
     return vm.monitor.set_migrate_cache_size(value)
+
+
+class MigrationTracker(object):
+    """
+    Follow the outgoing migration of a VM with a QMP monitor.
+
+    The end of the migration is taken from the MIGRATION events, so it is
+    noticed as soon as it happens, and query-migrate is sampled at a regular
+    interval into a time series that can be saved as CSV and JSON.
+    """
+
+    #: Migration states in which the migration is over
+    FINAL_STATES = ("completed", "failed", "cancelled")
+    #: Fields of a sample, in the order of the CSV columns
+    FIELDS = (
+        "time",
+        "status",
+        "transferred",
+        "remaining",
+        "total",
+        "mbps",
+        "dirty_pages_rate",
+        "expected_downtime",
+        "passes",
+    )
+
+    def __init__(self, vm, interval=1.0):
+        """
+        :param vm: The source VM, its main monitor must be a QMP monitor.
+        :param interval: Seconds between two samples, 0 disables sampling.
+        """
+        self.vm = vm
+        self.monitor = vm.monitor
+        self.interval = interval
+        self.samples = []
+        self.events_enabled = False
+        self._start_time = None
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        """
+        Enable the migration events and start sampling.
+
+        Call it right before starting the migration, the migration events
+        received before are discarded.
+        """
+        try:
+            self.monitor.set_migrate_capability(True, "events")
+            self.events_enabled = True
+        except qemu_monitor.MonitorError as details:
+            LOG.debug("Migration events are not available: %s", details)
+        self.monitor.clear_event("MIGRATION")
+        self.monitor.clear_event("MIGRATION_PASS")
+        self._start_time = time.time()
+        if self.interval > 0:
+            self._sampler = threading.Thread(
+                target=self._sample_loop, name="MigrationTracker-%s" % self.vm.name
+            )
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def sample(self):
+        """
+        Record the current statistics of the migration.
+
+        :return: The recorded sample, a dict with the keys of FIELDS.
+        """
+        info = self.monitor.cmd("query-migrate", debug=False)
+        ram = info.get("ram", {})
+        sample = {
+            "time": round(time.time() - self._start_time, 3),
+            "status": info.get("status"),
+            "transferred": ram.get("transferred"),
+            "remaining": ram.get("remaining"),
+            "total": ram.get("total"),
+            "mbps": ram.get("mbps"),
+            "dirty_pages_rate": ram.get("dirty-pages-rate"),
+            "expected_downtime": info.get("expected-downtime"),
+            "passes": ram.get("dirty-sync-count"),
+        }
+        self.samples.append(sample)
+        return sample
+
+    def _sample_loop(self):
+        while True:
+            try:
+                self.sample()
+            except qemu_monitor.MonitorError as details:
+                LOG.debug("Stop sampling the migration: %s", details)
+                return
+            if self._stop_event.wait(self.interval):
+                return
+
+    def wait(self, timeout):
+        """
+        Wait for the migration to end.
+
+        A migration paused before switchover is continued.
+
+        :param timeout: Time to wait for the migration to end.
+        :return: The final migration status, None if it didn't end in time.
+        """
+
+        def _is_over(event):
+            status = event.get("data", {}).get("status")
+            if status == "pre-switchover":
+                try:
+                    self.monitor.migrate_continue("pre-switchover")
+                except qemu_monitor.MonitorError as details:
+                    LOG.debug("Can't continue the migration: %s", details)
+            return status in self.FINAL_STATES
+
+        event = self.monitor.wait_event("MIGRATION", _is_over, timeout)
+        if event is None:
+            return None
+        return event["data"]["status"]
+
+    def stop(self):
+        """
+        Stop sampling and record the final statistics of the migration.
+        """
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.interval > 0:
+            try:
+                self.sample()
+            except qemu_monitor.MonitorError as details:
+                LOG.debug("Can't sample the migration: %s", details)
+
+    def save(self, basename=None, directory=None):
+        """
+        Save the samples as <basename>.csv and <basename>.json.
+
+        :param basename: File name, without extension, by default
+                         migration-<vm name>-<start time>.
+        :param directory: Directory of the files, the test log dir by default.
+        :return: Paths of the CSV and JSON files.
+        """
+        if basename is None:
+            basename = "migration-%s-%s.%03d" % (
+                self.vm.name,
+                time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time)),
+                self._start_time * 1000 % 1000,
+            )
+        if directory is None:
+            directory = utils_misc.get_log_file_dir()
+        csv_path = os.path.join(directory, basename + ".csv")
+        json_path = os.path.join(directory, basename + ".json")
+        with open(csv_path, "w") as csv_file:
+            writer = csv.DictWriter(csv_file, self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.samples)
+        with open(json_path, "w") as json_file:
+            json.dump(
+                {
+                    "vm": self.vm.name,
+                    "interval": self.interval,
+                    "samples": self.samples,
+                },
+                json_file,
+                indent=2,
+            )
+        return csv_path, json_path
@@ -15,6 +15,7 @@ import select
 import socket
 import threading
 import time
+import weakref
 
 import six
 
@@ -253,6 +254,63 @@ def pick_supported_x_feature(
     return feature
 
 
+def _event_matches(event, match):
+    """
+    Check whether a QMP event matches the expected data.
+
+    :param event: The event object
+    :param match: None to match any event, a dict with the expected items of
+                  the event data, or a callable taking the event and
+                  returning whether it matches
+    :return: True if the event matches
+    """
+    if match is None:
+        return True
+    if callable(match):
+        return match(event)
+    data = event.get("data", {})
+    return all(data.get(key) == value for key, value in match.items())
+
+
+def _read_qmp_events(monitor_ref, interval):
+    """
+    Read the data of a QMP monitor as soon as it arrives, so the events it
+    carries are dispatched to the waiters right away.
+
+    Only a weak reference to the monitor is kept, the reader stops once the
+    monitor is garbage collected or its connection is closed.
+
+    :param monitor_ref: weakref of the QMPMonitor
+    :param interval: Time to wait for data before checking the monitor again
+    """
+    while True:
+        monitor = monitor_ref()
+        if monitor is None or monitor._server_closed:
+            return
+        sock, lock = monitor._socket, monitor._lock
+        del monitor
+        try:
+            if not select.select([sock], [], [], interval)[0]:
+                continue
+        except (ValueError, socket.error):
+            # Socket closed
+            return
+        # Commands read their own responses, don't compete with them
+        if not lock.acquire(timeout=interval):
+            continue
+        try:
+            monitor = monitor_ref()
+            if monitor is None:
+                return
+            monitor._read_objects(0)
+        except MonitorError as details:
+            LOG.debug("Stop reading the QMP events: %s", details)
+            return
+        finally:
+            del monitor
+            lock.release()
+
+
 class VM(object):
     """
     Dummy class to represent "vm.name" for pickling to avoid circular deps
@@ -276,6 +334,7 @@ class Monitor(object):
     ACQUIRE_LOCK_TIMEOUT = 20
     DATA_AVAILABLE_TIMEOUT = 0
     CONNECT_TIMEOUT = 60
+    RECV_SIZE = 65536
 
     def __init__(self, vm, name, monitor_params, suppress_exceptions=False):
         """
@@ -388,14 +447,9 @@ class Monitor(object):
         self._socket.close()
 
     def _acquire_lock(self, timeout=ACQUIRE_LOCK_TIMEOUT, lock=None):
-        end_time = time.time() + timeout
         if not lock:
             lock = self._lock
-        while time.time() < end_time:
-            if lock.acquire(False):
-                return True
-            time.sleep(0.05)
-        return False
+        return lock.acquire(timeout=max(timeout, 0))
 
     def _data_available(self, timeout=DATA_AVAILABLE_TIMEOUT):
         if self._server_closed:
@@ -412,17 +466,17 @@ class Monitor(object):
 
         return s type: bytes
         """
-        s = b""
+        chunks = []
         while self._data_available():
             try:
-                data = self._socket.recv(1024)
+                data = self._socket.recv(self.RECV_SIZE)
             except socket.error as e:
                 raise MonitorSocketError("Could not receive data from monitor", e)
             if not data:
                 self._server_closed = True
                 break
-            s += data
-        return s
+            chunks.append(data)
+        return b"".join(chunks)
 
     def _has_command(self, cmd):
         """
@@ -1779,6 +1833,8 @@ class QMPMonitor(Monitor):
     CMD_TIMEOUT = 900
     RESPONSE_TIMEOUT = 600
     PROMPT_TIMEOUT = 90
+    EVENT_TIMEOUT = 120
+    EVENT_READER_INTERVAL = 1
 
     def __init__(self, vm, name, monitor_params, suppress_exceptions=False):
         """
@@ -1803,7 +1859,15 @@ class QMPMonitor(Monitor):
 
             self.protocol = "qmp"
             self._greeting = None
+            # (sequence number, event) of the events received
             self._events = []
+            # Sequence number of the last event received, never reset
+            self._event_seq = 0
+            # Notified whenever new events are received
+            self._event_cond = threading.Condition()
+            self._event_reader = None
+            # Received data not terminated by a newline yet
+            self._pending = []
             self._supported_hmp_cmds = []
 
             # Make sure json is available
@@ -1837,6 +1901,14 @@ class QMPMonitor(Monitor):
 
             self._get_supported_cmds()
 
+            self._event_reader = threading.Thread(
+                target=_read_qmp_events,
+                args=(weakref.ref(self), self.EVENT_READER_INTERVAL),
+                name="qmp-events-%s-%s" % (self.vm.name, self.name),
+            )
+            self._event_reader.daemon = True
+            self._event_reader.start()
+
         except MonitorError as e:
             self._close_sock()
             if suppress_exceptions:
@@ -1853,43 +1925,62 @@ class QMPMonitor(Monitor):
             obj["id"] = q_id
         return obj
 
+    def _split_lines(self, data):
+        """
+        Split the received data into complete lines.
+
+        The trailing incomplete line is kept until the rest of it is received,
+        so every line is only scanned once no matter how many chunks it
+        arrives in.
+
+        :param data: Data received from the monitor
+        :type data: bytes
+        :return: A list of complete lines
+        """
+        self._pending.append(data)
+        if b"\n" not in data:
+            return []
+        lines = b"".join(self._pending).split(b"\n")
+        tail = lines.pop()
+        self._pending = [tail] if tail else []
+        return lines
+
     def _read_objects(self, timeout=READ_OBJECTS_TIMEOUT):
         """
         Read bytes lines from the monitor and try to "decode" them.
-        Stop when all available lines have been successfully decoded, or when
-        timeout expires.  If any decoded objects are asynchronous events, store
-        them in self._events.  Return all decoded objects.
+        Stop when all available lines have been received, or when timeout
+        expires, keeping any incomplete line for the next read.  If any
+        decoded objects are asynchronous events, store them in self._events.
+        Return all decoded objects.
 
-        :param timeout: Time to wait for all lines to decode successfully
+        :param timeout: Time to wait for all lines to be received
         :return: A list of objects
         """
-        if not self._data_available():
+        if not self._pending and not self._data_available():
             return []
-        s = b""
-        end_time = time.time() + timeout
-        while self._data_available(end_time - time.time()):
-            s += self._recvall()
-            # Make sure all lines are decodable
-            for line in s.splitlines():
-                if line:
-                    try:
-                        json.loads(line)
-                    except Exception:
-                        # Found an incomplete or broken line -- keep reading
-                        break
-            else:
-                # All lines are OK -- stop reading
-                break
-        # Decode all decodable lines
         objs = []
-        for line in s.splitlines():
-            try:
-                objs += [json.loads(line)]
+        end_time = time.time() + timeout
+        while True:
+            for line in self._split_lines(self._recvall()):
+                if not line.strip():
+                    continue
+                try:
+                    objs.append(json.loads(line))
+                except ValueError:
+                    # Broken line, no way to recover it
+                    continue
                 self._log_lines(line.decode(errors="replace"))
-            except Exception:
-                pass
+            # Stop once the last line is complete
+            if not self._pending or not self._data_available(end_time - time.time()):
+                break
         # Keep track of asynchronous events
-        self._events += [obj for obj in objs if "event" in obj]
+        events = [obj for obj in objs if "event" in obj]
+        if events:
+            with self._event_cond:
+                for event in events:
+                    self._event_seq += 1
+                    self._events.append((self._event_seq, event))
+                self._event_cond.notify_all()
         return objs
 
     def _send(self, data, fds=None):
@@ -2211,7 +2302,8 @@ class QMPMonitor(Monitor):
             )
         try:
             self._read_objects()
-            return self._events[:]
+            with self._event_cond:
+                return [event for _, event in self._events]
         finally:
             self._lock.release()
 
@@ -2226,6 +2318,47 @@ class QMPMonitor(Monitor):
             if e.get("event") == name:
                 return e
 
+    def wait_event(self, name, match=None, timeout=EVENT_TIMEOUT):
+        """
+        Wait for an event with the given name.
+
+        The events are dispatched by a background reader as soon as they are
+        received, so the wait ends right when a matching event arrives.  The
+        events received since the last clear_events() call are also
+        considered.
+
+        :param name: The name of the event to wait for (e.g. 'RESET')
+        :param match: A dict with the expected items of the event data, or a
+                      callable taking the event and returning whether it
+                      matches
+        :param timeout: Time duration to wait for the event
+        :return: An event object or None if none is received in time
+        """
+        end_time = time.time() + timeout
+        # Sequence number of the last event looked at
+        seq = 0
+        while True:
+            reader_alive = self._event_reader and self._event_reader.is_alive()
+            if not reader_alive:
+                # Nobody else reads the monitor, read it here
+                self.get_events()
+            with self._event_cond:
+                if not self._events or self._events[-1][0] <= seq:
+                    remaining = end_time - time.time()
+                    if remaining <= 0:
+                        return None
+                    if not reader_alive:
+                        remaining = min(remaining, self.EVENT_READER_INTERVAL)
+                    self._event_cond.wait(remaining)
+                # Events cleared meanwhile are skipped, new ones are not
+                events = [event for event_seq, event in self._events if event_seq > seq]
+                if self._events:
+                    seq = max(seq, self._events[-1][0])
+            # Match out of the lock, the callable might use the monitor
+            for event in events:
+                if event.get("event") == name and _event_matches(event, match):
+                    return event
+
     def human_monitor_cmd(self, cmd="", timeout=CMD_TIMEOUT, debug=True, fd=None):
         """
         Run human monitor command in QMP through human-monitor-command
@@ -2256,8 +2389,11 @@ class QMPMonitor(Monitor):
             raise MonitorLockError(
                 "Could not acquire exclusive lock to clear " "QMP event list"
             )
-        self._events = []
-        self._lock.release()
+        try:
+            with self._event_cond:
+                self._events = []
+        finally:
+            self._lock.release()
 
     def clear_event(self, name):
         """
@@ -2269,13 +2405,16 @@ class QMPMonitor(Monitor):
             raise MonitorLockError(
                 "Could not acquire exclusive lock to clear " "QMP event list"
             )
-        while True:
-            event = self.get_event(name)
-            if event:
-                self._events.remove(event)
-            else:
-                break
-        self._lock.release()
+        try:
+            self._read_objects()
+            with self._event_cond:
+                self._events = [
+                    (seq, event)
+                    for seq, event in self._events
+                    if event.get("event") != name
+                ]
+        finally:
+            self._lock.release()
 
     def get_greeting(self):
         """
@@ -2405,7 +2544,7 @@ class QMPMonitor(Monitor):
         self.verify_supported_cmd(cmd)
         self.clear_event(event)
         ret = self.cmd(cmd=cmd)
-        if not utils_misc.wait_for(lambda: self.get_event(event), timeout=120):
+        if not self.wait_event(event, timeout=120):
             raise QMPEventError(cmd, event, self.vm.name, self.name)
         return ret
 
@@ -2804,7 +2943,7 @@ class QMPMonitor(Monitor):
         # Send a system_wakeup monitor command
         self.cmd(cmd)
         # Look for WAKEUP QMP event
-        if not utils_misc.wait_for(lambda: self.get_event(qmp_event), 120):
+        if not self.wait_event(qmp_event, timeout=120):
             raise QMPEventError(cmd, qmp_event, self.vm.name, self.name)
         LOG.info("%s QMP event received" % qmp_event)
 
@@ -3050,7 +3189,7 @@ class QMPMonitor(Monitor):
         # Send a balloon monitor command
         self.send_args_cmd("%s value=%s" % (cmd, size))
         # Look for BALLOON QMP events
-        if not utils_misc.wait_for(lambda: self.get_event(qmp_event), 120):
+        if not self.wait_event(qmp_event, timeout=120):
             raise QMPEventError(cmd, qmp_event, self.vm.name, self.name)
         LOG.info("%s QMP event received" % qmp_event)
 
@@ -3229,7 +3368,7 @@ class QMPMonitor(Monitor):
         # Send a powerdown monitor command
         self.cmd(cmd)
         # Look for POWERDOWN QMP events
-        if not utils_misc.wait_for(lambda: self.get_event(qmp_event), 120):
+        if not self.wait_event(qmp_event, timeout=120):
             raise QMPEventError(cmd, qmp_event, self.vm.name, self.name)
         LOG.info("%s QMP event received" % qmp_event)
 
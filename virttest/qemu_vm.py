@@ -52,7 +52,7 @@ from virttest.qemu_capabilities import Flags
 from virttest.qemu_devices import qcontainer, qdevices
 from virttest.qemu_devices.qdevice_format import qdevice_format
 from virttest.qemu_devices.utils import DeviceError, set_cmdline_format_by_cfg
-from virttest.utils_params import Params
+from virttest.utils_params import Params, record_access
 from virttest.utils_version import VersionInterval
 
 # Using as lower capital is not the best way to do, but this is just a
@@ -3384,6 +3384,23 @@ class VM(virt_vm.BaseVM):
                         else:
                             dev.set_param(k, v)
 
+    def _make_recorded_create_command(self, params=None, migration_mode=None):
+        """
+        Build the devices of the command line from self.params, recording
+        the params it depends on so needs_restart() can compare them with
+        other params.
+
+        :param params: params given to create(), for the VGA defaults
+        :param migration_mode: migration mode given to create()
+        """
+        params_snapshot = self.params.copy()
+        with record_access(self.params) as params_record:
+            self.devices, self.spice_options = self.make_create_command()
+            self.update_vga_global_default(params, migration_mode)
+        self.params_record = params_record
+        if params_record is not None:
+            self.params_fingerprint = params_record.fingerprint(params_snapshot)
+
     def update_vga_global_default(self, params, migrate=None):
         """
         Update VGA global default settings
@@ -3747,8 +3764,7 @@ class VM(virt_vm.BaseVM):
                 self.update_system_dependent_devs()
             # Make qemu command
             try:
-                self.devices, self.spice_options = self.make_create_command()
-                self.update_vga_global_default(params, migration_mode)
+                self._make_recorded_create_command(params, migration_mode)
                 LOG.debug(self.devices.str_short())
                 LOG.debug(self.devices.str_bus_short())
                 qemu_command = self.devices.cmdline()
@@ -4109,6 +4125,7 @@ class VM(virt_vm.BaseVM):
         if self.process:
             self.process.close()
         self.cleanup_serial_console()
+        self.close_ssh_multiplexer()
         if self.logsessions:
             for key in self.logsessions:
                 self.logsessions[key].close()
@@ -5046,9 +5063,27 @@ class VM(virt_vm.BaseVM):
     def mig_pre_switchover(self):
         return self._mig_pre_switchover(self.monitor.info("migrate"))
 
-    def wait_for_migration(self, timeout):
-        if not utils_misc.wait_for(
-            self.mig_finished, timeout, 2, 2, "Waiting for migration to complete"
+    def wait_for_migration(self, timeout, tracker=None):
+        """
+        Wait for the outgoing migration to finish.
+
+        :param timeout: Time to wait for migration to complete.
+        :param tracker: MigrationTracker following the migration, its events
+                        end the wait as soon as the migration does.
+        """
+        if tracker is not None and tracker.events_enabled:
+            end_time = time.time() + timeout
+            if tracker.wait(timeout) is None:
+                raise virt_vm.VMMigrateTimeoutError(
+                    "Timeout expired while waiting" " for migration to finish"
+                )
+            # The spice session may still be migrating
+            timeout = max(end_time - time.time(), 1)
+        if not utils_misc.wait_until(
+            self.mig_finished,
+            timeout,
+            step=0.2,
+            text="Waiting for migration to complete",
         ):
             raise virt_vm.VMMigrateTimeoutError(
                 "Timeout expired while waiting" " for migration to finish"
@@ -5188,6 +5223,7 @@ class VM(virt_vm.BaseVM):
                     clone.params["tpm_overwrite_%s_copied" % tpm] = "no"
                 clone.params["tpms"] = " ".join(tpms_copy)
 
+        tracker = None
         try:
             if local and not (
                 migration_exec_cmd_src and "gzip" in migration_exec_cmd_src
@@ -5373,6 +5409,16 @@ class VM(virt_vm.BaseVM):
                         )
                         raise exceptions.TestError(msg)
 
+            if (
+                not not_wait_for_migration
+                and not cancel_delay
+                and isinstance(self.monitor, qemu_monitor.QMPMonitor)
+            ):
+                tracker = qemu_migration.MigrationTracker(
+                    self, float(self.params.get("migration_stats_interval", 1))
+                )
+                tracker.start()
+
             LOG.info("Migrating to %s", uri)
             if clone.deferral_incoming:
                 _uri = uri
@@ -5424,7 +5470,17 @@ class VM(virt_vm.BaseVM):
                     raise virt_vm.VMMigrateCancelError("Cannot cancel migration")
                 return
 
-            self.wait_for_migration(timeout)
+            try:
+                self.wait_for_migration(timeout, tracker)
+            finally:
+                if tracker is not None:
+                    tracker.stop()
+                    if tracker.samples:
+                        # Don't hide the outcome of the migration
+                        try:
+                            tracker.save()
+                        except (IOError, OSError) as details:
+                            LOG.debug("Can't save the migration samples: %s", details)
 
             if local and (migration_exec_cmd_src and "gzip" in migration_exec_cmd_src):
                 error_context.context("creating destination VM")
@@ -5487,6 +5543,8 @@ class VM(virt_vm.BaseVM):
             clone = temp  # for cleanup purposes keep clone
 
         finally:
+            if tracker is not None:
+                tracker.stop()
             # If we're doing remote migration and it's completed successfully,
             # self points to a dead VM object
             if not not_wait_for_migration:
@@ -4,9 +4,12 @@ Functions and classes used for logging into guests and transferring files.
 
 from __future__ import division
 
+import glob
+import hashlib
 import logging
 import os
 import re
+import shlex
 import shutil
 import tempfile
 import time
@@ -150,6 +153,272 @@ def run_remote_cmd(cmd, params, remote_runner=None, ignore_status=True):
         raise exceptions.TestFail("Failed to run '%s' on remote: %s" % (cmd, cmderr))
 
 
+class SSHMultiplexer(object):
+    """
+    Share OpenSSH master connections (ControlMaster) between the ssh
+    sessions and the scp/rsync transfers to a guest.
+
+    Every (username, host, port) gets a control socket in ``control_dir``
+    named after ``tag``, the first client connecting to it authenticates and
+    leaves a background master behind, the following ones only open a new
+    channel on it. The masters outlive the process that started them for
+    ``persist`` seconds of inactivity, :meth:`close` stops them.
+    """
+
+    # sun_path is 108 bytes, ssh appends a 17 chars suffix while binding
+    MAX_CONTROL_PATH = 90
+    SAFE_PATH_RE = re.compile(r"^[\w./-]+$")
+
+    def __init__(self, control_dir, tag, persist=600):
+        """
+        :param control_dir: Directory holding the control sockets.
+        :param tag: Identifier of the owner of the masters (eg. VM instance).
+        :param persist: Seconds an idle master is kept in the background.
+        """
+        self.control_dir = control_dir
+        self.tag = tag
+        self.persist = persist
+
+    def _prefix(self):
+        return "ssh-%s-" % hashlib.md5(self.tag.encode()).hexdigest()[:8]
+
+    def control_path(self, host, port, username):
+        """
+        Return the control socket used for a remote login.
+
+        :return: Path of the socket, None when it can't be used by ssh.
+        """
+        key = "%s@%s:%s" % (username, host, port)
+        name = self._prefix() + hashlib.md5(key.encode()).hexdigest()[:8]
+        path = os.path.join(self.control_dir, name)
+        if len(path) > self.MAX_CONTROL_PATH or not self.SAFE_PATH_RE.match(path):
+            LOG.debug("Not multiplexing ssh connections through '%s'", path)
+            return None
+        return path
+
+    def ssh_options(self, host, port, username):
+        """
+        Return the ssh options sharing the master connection of a login.
+
+        :return: Options string, empty when multiplexing isn't possible.
+        """
+        path = self.control_path(host, port, username)
+        if path is None:
+            return ""
+        return (
+            "-o ControlMaster=auto -o ControlPath=%s -o ControlPersist=%s "
+            "-o ServerAliveInterval=5 -o ServerAliveCountMax=3" % (path, self.persist)
+        )
+
+    def _copy(
+        self,
+        client,
+        address,
+        port,
+        username,
+        password,
+        source,
+        destination,
+        upload,
+        directory,
+        limit,
+        log_filename,
+        log_function,
+        timeout,
+        interface,
+    ):
+        options = self.ssh_options(address, port, username)
+        if address and address.lower().startswith("fe80"):
+            if not interface:
+                raise SCPError(
+                    "When using ipv6 linklocal address must assign",
+                    "the interface the neighbour attache",
+                )
+            address = "%s%%%s" % (address, interface)
+        if client == "scp":
+            # No -v here, a verbose master would keep the pty of scp open
+            command = "scp -r" if directory else "scp"
+            command += (
+                " %s -o UserKnownHostsFile=/dev/null "
+                "-o StrictHostKeyChecking=no "
+                "-o PreferredAuthentications=password %s -P %s"
+                % (options, "-l %s" % limit if limit else "", port)
+            )
+            remote_path = r"%s@\[%s\]:" % (username, address)
+        elif client == "rsync":
+            command = "rsync -r" if directory else "rsync"
+            command += (
+                " -avz -e 'ssh -p %s %s -o UserKnownHostsFile=/dev/null "
+                "-o StrictHostKeyChecking=no' %s"
+                % (port, options, "--bwlimit=%s" % limit if limit else "")
+            )
+            remote_path = "%s@%s:" % (username, address)
+        else:
+            raise TransferBadClientError(client)
+        if upload:
+            command += " %s %s%s" % (
+                quote_path(source),
+                remote_path,
+                shlex.quote(destination),
+            )
+        else:
+            command += " %s%s %s" % (
+                remote_path,
+                quote_path(source),
+                shlex.quote(destination),
+            )
+        # A shared connection skips the password prompt, so the whole
+        # transfer may run under the login timeout
+        remote_copy(
+            command,
+            [password],
+            log_filename,
+            log_function,
+            transfer_timeout=timeout,
+            login_timeout=timeout,
+        )
+
+    @staticmethod
+    def _log_transfer(msg, elapsed_time, filesize=None):
+        # Same report as the aexpect transfers
+        if filesize is not None:
+            LOG.info(
+                "%s, estimated throughput: %.2f MB/s", msg, filesize / elapsed_time
+            )
+        else:
+            LOG.info("%s, elapsed time: %s", msg, elapsed_time)
+
+    def copy_files_to(
+        self,
+        address,
+        client,
+        username,
+        password,
+        port,
+        local_path,
+        remote_path,
+        directory=True,
+        limit="",
+        log_filename=None,
+        log_function=None,
+        verbose=False,
+        timeout=600,
+        interface=None,
+        filesize=None,
+    ):
+        """
+        Copy files to a remote host through the shared connection.
+
+        Same parameters as :func:`aexpect.remote.copy_files_to`, only the
+        scp and rsync clients are supported (verbose is RSS only).
+        """
+        start_time = time.monotonic()
+        self._copy(
+            client,
+            address,
+            port,
+            username,
+            password,
+            local_path,
+            remote_path,
+            True,
+            directory,
+            limit,
+            log_filename,
+            log_function,
+            timeout,
+            interface,
+        )
+        self._log_transfer(
+            "Copy file from %s to %s:%s" % (local_path, address, remote_path),
+            time.monotonic() - start_time,
+            filesize,
+        )
+
+    def copy_files_from(
+        self,
+        address,
+        client,
+        username,
+        password,
+        port,
+        remote_path,
+        local_path,
+        directory=True,
+        limit="",
+        log_filename=None,
+        log_function=None,
+        verbose=False,
+        timeout=600,
+        interface=None,
+        filesize=None,
+    ):
+        """
+        Copy files from a remote host through the shared connection.
+
+        Same parameters as :func:`aexpect.remote.copy_files_from`, only the
+        scp and rsync clients are supported (verbose is RSS only).
+        """
+        start_time = time.monotonic()
+        self._copy(
+            client,
+            address,
+            port,
+            username,
+            password,
+            remote_path,
+            local_path,
+            False,
+            directory,
+            limit,
+            log_filename,
+            log_function,
+            timeout,
+            interface,
+        )
+        self._log_transfer(
+            "Copy file from %s:%s to %s" % (address, remote_path, local_path),
+            time.monotonic() - start_time,
+            filesize,
+        )
+
+    def close(self, host=None, port=None, username=None, keep_sessions=True):
+        """
+        Stop the master connections and remove their control sockets.
+
+        By default the masters only stop accepting new clients, the sessions
+        already multiplexed on them are left running (eg. across a
+        migration) and the masters go away with the last of them.
+
+        :param host: Only stop the master of this login (all when None).
+        :param port: Port of the login.
+        :param username: Username of the login.
+        :param keep_sessions: Whether the open sessions are kept, when False
+                              the masters exit and close them.
+        :return: Number of sockets removed.
+        """
+        if host is not None:
+            path = self.control_path(host, port, username)
+            paths = [path] if path and os.path.exists(path) else []
+        else:
+            paths = glob.glob(os.path.join(self.control_dir, self._prefix() + "*"))
+        operation = "stop" if keep_sessions else "exit"
+        for path in paths:
+            process.run(
+                "ssh -o ControlPath=%s -O %s master" % (path, operation),
+                ignore_status=True,
+                verbose=False,
+                timeout=10,
+            )
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        if paths:
+            LOG.debug("Closed %d ssh master connection(s) of %s", len(paths), self.tag)
+        return len(paths)
+
+
 class Remote_Package(object):
     def __init__(self, address, client, username, password, port, remote_path):
         """
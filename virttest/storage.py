@@ -10,6 +10,7 @@ from __future__ import division
 
 import collections
 import errno
+import fcntl
 import functools
 import json
 import logging
@@ -891,6 +892,38 @@ class OptionMissing(Exception):
         return "%s is missing. Please check your parameters" % self.option
 
 
+# From linux/fs.h
+FICLONE = 0x40049409
+
+# errno values meaning the filesystem can't reflink the files
+_REFLINK_UNSUPPORTED = (
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+)
+
+
+def reflink_file(src, dst):
+    """
+    Clone src into dst sharing the data blocks (FICLONE), like `cp --reflink`.
+
+    :param src: Source file name.
+    :param dst: Destination file name, overwritten if it exists.
+    :raise OSError: If the filesystem doesn't support reflinks between them.
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dst):
+            os.unlink(dst)
+        raise
+    shutil.copymode(src, dst)
+
+
 class QemuImg(object):
     """
     A basic class for handling operations of disk/block images.
@@ -1045,12 +1078,23 @@ class QemuImg(object):
         if not os.path.isabs(backup_dir):
             backup_dir = os.path.join(root_dir, backup_dir)
         backup_set = get_backup_set(self.image_filename, backup_dir, action, good)
+        backup_mode = self.get_backup_mode(params)
         if self.is_remote_image():
             backup_func = self.copy_data_remote
         elif params.get("image_raw_device") == "yes":
             backup_func = self.copy_data_raw
+        elif backup_mode == "reflink":
+            backup_func = self.reflink_data_file
         else:
             backup_func = self.copy_data_file
+        if backup_mode == "overlay":
+            # Restoring just drops the overlay, a good backup turns the image
+            # into an overlay of it. Bad images are still plain copies, see
+            # rebase_bad_overlay().
+            if action == "restore":
+                backup_func = functools.partial(self.restore_overlay, params)
+            elif good:
+                backup_func = functools.partial(self.backup_to_overlay, params)
 
         if action == "backup":
             backup_size = 0
@@ -1098,6 +1142,10 @@ class QemuImg(object):
                 continue
             backup_func(src, dst)
 
+        if backup_mode == "overlay" and action == "backup" and not good:
+            (_, dst_bad), (src_good, dst_good) = backup_set
+            self.rebase_bad_overlay(params, dst_bad, src_good, dst_good)
+
     def rm_backup_image(self):
         """
         Remove backup image
@@ -1112,6 +1160,14 @@ class QemuImg(object):
         image_name = os.path.join(
             backup_dir, "%s.backup" % os.path.basename(self.image_filename)
         )
+        if self.get_backup_mode(self.params) == "overlay" and self.is_overlay_of(
+            self.params, self.image_filename, image_name
+        ):
+            # The image still needs the backup, fold it back into the image
+            LOG.debug("Merging overlay %s into %s", self.image_filename, image_name)
+            self._run_qemu_img(self.params, "commit -f qcow2 %s" % self.image_filename)
+            os.rename(image_name, self.image_filename)
+            return
         LOG.debug("Removing image file %s as requested", image_name)
         if os.path.exists(image_name):
             os.unlink(image_name)
@@ -1184,15 +1240,152 @@ class QemuImg(object):
 
     @staticmethod
     def copy_data_file(src, dst):
-        """Copy for files."""
+        """Copy for files, cloning them when the filesystem supports it."""
         if os.path.isfile(src):
-            LOG.debug("Copying %s -> %s", src, dst)
             _dst = dst + ".part"
-            shutil.copy(src, _dst)
+            try:
+                reflink_file(src, _dst)
+                LOG.debug("Cloned %s -> %s", src, dst)
+            except (IOError, OSError) as e:
+                if e.errno not in _REFLINK_UNSUPPORTED:
+                    raise
+                LOG.debug("Copying %s -> %s", src, dst)
+                shutil.copy(src, _dst)
             os.rename(_dst, dst)
         else:
             LOG.info("No source file %s, skipping copy...", src)
 
+    @staticmethod
+    def reflink_data_file(src, dst):
+        """Clone for files, fail if the filesystem can't reflink them."""
+        if os.path.isfile(src):
+            LOG.debug("Cloning %s -> %s", src, dst)
+            _dst = dst + ".part"
+            reflink_file(src, _dst)
+            os.rename(_dst, dst)
+        else:
+            LOG.info("No source file %s, skipping clone...", src)
+
+    def get_backup_mode(self, params):
+        """
+        Get how the image is backed up and restored.
+
+        :param params: Dictionary containing the test parameters.
+        :return: "copy", "reflink" or "overlay", the image_backup_mode param
+                 if the image supports it, otherwise "copy".
+        """
+        backup_mode = params.get("image_backup_mode", "copy")
+        if backup_mode not in ("copy", "reflink", "overlay"):
+            raise ValueError("Unknown image_backup_mode '%s'" % backup_mode)
+        if backup_mode == "copy":
+            return backup_mode
+        if self.is_remote_image() or params.get("image_raw_device") == "yes":
+            LOG.warning(
+                "image_backup_mode %s is not supported by image %s, copying it",
+                backup_mode,
+                self.image_filename,
+            )
+            return "copy"
+        if backup_mode == "overlay" and (
+            self.image_format != "qcow2"
+            or self.data_file
+            or self.encryption_config.key_secret
+        ):
+            LOG.warning(
+                "Overlays are only supported by plain qcow2 images, copying %s",
+                self.image_filename,
+            )
+            return "copy"
+        return backup_mode
+
+    def _run_qemu_img(self, params, args):
+        cmd = "%s %s" % (utils_misc.get_qemu_img_binary(params), args)
+        return process.run(cmd, shell=True, verbose=False)
+
+    def is_overlay_of(self, params, filename, backing_filename):
+        """
+        Check whether the filename image is backed by backing_filename.
+
+        :param params: Dictionary containing the test parameters.
+        :param filename: Image file name.
+        :param backing_filename: Backing image file name.
+        """
+        if not (os.path.isfile(filename) and os.path.isfile(backing_filename)):
+            return False
+        output = self._run_qemu_img(
+            params, "info -f qcow2 --output=json %s" % filename
+        ).stdout_text
+        backing = json.loads(output).get("full-backing-filename")
+        return bool(backing) and os.path.realpath(backing) == os.path.realpath(
+            backing_filename
+        )
+
+    def restore_overlay(self, params, backup, image):
+        """
+        Replace image with an empty qcow2 overlay of backup.
+
+        :param params: Dictionary containing the test parameters.
+        :param backup: Backup image file name, used as the overlay base.
+        :param image: Image file name.
+        """
+        if not os.path.isfile(backup):
+            LOG.info("No source file %s, skipping restore...", backup)
+            return
+        LOG.debug("Restoring %s as an overlay of %s", image, backup)
+        if os.path.exists(image):
+            os.unlink(image)
+        self._run_qemu_img(
+            params,
+            "create -f qcow2 -F qcow2 -b %s %s" % (os.path.abspath(backup), image),
+        )
+
+    def backup_to_overlay(self, params, image, backup):
+        """
+        Make backup the base of image, turning image into an overlay of it.
+
+        :param params: Dictionary containing the test parameters.
+        :param image: Image file name.
+        :param backup: Backup image file name.
+        """
+        if not os.path.isfile(image):
+            LOG.info("No source file %s, skipping backup...", image)
+            return
+        if self.is_overlay_of(params, image, backup):
+            LOG.debug("Committing overlay %s into %s", image, backup)
+            self._run_qemu_img(params, "commit -f qcow2 %s" % image)
+            return
+        LOG.debug("Moving %s -> %s", image, backup)
+        try:
+            os.rename(image, backup)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            self.copy_data_file(image, backup)
+        self.restore_overlay(params, backup, image)
+
+    def rebase_bad_overlay(self, params, bad_image, backup, good_image):
+        """
+        Point the saved copy of a bad overlay at the saved copy of its base.
+
+        The copy of an overlay is still backed by the live backup, which the
+        next good backup commits into, changing the saved bad image.
+
+        :param params: Dictionary containing the test parameters.
+        :param bad_image: Saved copy of the bad image.
+        :param backup: Backup image the bad image was an overlay of.
+        :param good_image: Saved copy of backup.
+        """
+        if not (
+            os.path.isfile(good_image) and self.is_overlay_of(params, bad_image, backup)
+        ):
+            return
+        LOG.debug("Rebasing %s onto %s", bad_image, good_image)
+        self._run_qemu_img(
+            params,
+            "rebase -u -f qcow2 -F qcow2 -b %s %s"
+            % (os.path.abspath(good_image), bad_image),
+        )
+
     @staticmethod
     def clone_image(params, vm_name, image_name, root_dir):
         """
@@ -1,6 +1,9 @@
 import functools
+import hashlib
 import logging
 import os
+import stat
+import tempfile
 import threading
 
 try:
@@ -68,14 +71,18 @@ class Env(IterableUserDict):
         empty = {"version": version}
         self._filename = filename
         self._sniffer = None
+        # (filename, digest) of the last pickle written to or read from disk
+        self._saved = None
         self.save_lock = threading.RLock()
         if filename:
             try:
                 if os.path.isfile(filename):
                     with open(filename, "rb") as f:
-                        env = cPickle.load(f)
+                        pickled = f.read()
+                    env = cPickle.loads(pickled)
                     if env.get("version", 0) >= version:
                         self.data = env
+                        self._saved = (filename, hashlib.sha1(pickled).digest())
                     else:
                         LOG.warning("Incompatible env file found. Not using it.")
                         self.data = empty
@@ -104,8 +111,34 @@ class Env(IterableUserDict):
         filename = filename or self._filename
         if filename is None:
             raise EnvSaveError("No filename specified for this env file")
-        with self.save_lock, open(filename, "wb") as f:
-            cPickle.dump(self.data, f, protocol=0)
+        with self.save_lock:
+            # Entries share objects (e.g. the address cache of the VMs), so
+            # the whole dict is pickled at once to keep those references
+            pickled = cPickle.dumps(self.data, protocol=cPickle.HIGHEST_PROTOCOL)
+            saved = (filename, hashlib.sha1(pickled).digest())
+            if saved == self._saved and os.path.isfile(filename):
+                return
+            try:
+                mode = stat.S_IMODE(os.stat(filename).st_mode)
+            except OSError:
+                mode = 0o644
+            # Write a temporary file and rename it over the env file, so a
+            # crash in the middle of a save never leaves a truncated env
+            fd, tmp_filename = tempfile.mkstemp(
+                prefix=".%s." % os.path.basename(filename),
+                dir=os.path.dirname(os.path.abspath(filename)),
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(pickled)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_filename, mode)
+                os.rename(tmp_filename, filename)
+            except Exception:
+                os.unlink(tmp_filename)
+                raise
+            self._saved = saved
 
     def get_all_vms(self):
         """
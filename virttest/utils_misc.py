@@ -554,6 +554,75 @@ def format_str_for_message(msg):
         return "\n" + msg
 
 
+# Waits by call site: [calls, polls, seconds, timeouts]
+_wait_stats = {}
+_wait_stats_lock = threading.Lock()
+
+
+def _record_wait(frame, polls, duration, timed_out):
+    """
+    Account a wait to the statistics of its call site.
+
+    :param frame: Frame of the caller of the waiting function.
+    :param polls: Number of times the condition was checked.
+    :param duration: Seconds spent waiting.
+    :param timed_out: Whether the wait timed out.
+    """
+    site = "%s:%d (%s)" % (
+        os.path.basename(frame.f_code.co_filename),
+        frame.f_lineno,
+        frame.f_code.co_name,
+    )
+    with _wait_stats_lock:
+        stats = _wait_stats.setdefault(site, [0, 0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += polls
+        stats[2] += duration
+        stats[3] += int(timed_out)
+
+
+def get_wait_stats(reset=False):
+    """
+    Return the statistics of wait_for() and wait_until() by call site.
+
+    :param reset: Start over with empty statistics.
+    :return: Dict of "file:line (function)" to dicts with the number of
+             calls, polls and timeouts and the seconds spent waiting.
+    """
+    with _wait_stats_lock:
+        stats = dict(
+            (site, {"calls": c, "polls": p, "seconds": round(t, 3), "timeouts": o})
+            for site, (c, p, t, o) in _wait_stats.items()
+        )
+        if reset:
+            _wait_stats.clear()
+    return stats
+
+
+def log_wait_stats(top=10, reset=True):
+    """
+    Log the call sites that spent the most time waiting.
+
+    :param top: Number of call sites to log.
+    :param reset: Start over with empty statistics.
+    :return: The statistics, as returned by get_wait_stats().
+    """
+    stats = get_wait_stats(reset)
+    sites = sorted(stats, key=lambda site: stats[site]["seconds"], reverse=True)
+    if sites:
+        LOG.debug("Longest waits (calls, polls, seconds, timeouts):")
+    for site in sites[:top]:
+        LOG.debug(
+            "    %s: %d, %d, %.1f, %d",
+            site,
+            stats[site]["calls"],
+            stats[site]["polls"],
+            stats[site]["seconds"],
+            stats[site]["timeouts"],
+        )
+    return stats
+
+
 def wait_for(func, timeout, first=0.0, step=1.0, text=None, ignore_errors=False):
     """
     Wait until func() evaluates to True.
@@ -567,29 +636,133 @@ def wait_for(func, timeout, first=0.0, step=1.0, text=None, ignore_errors=False)
     :param text: Text to print while waiting, for debug purposes
     :param ignore_errors: If True, log any error and retry
     """
-    start_time = time.time()
-    end_time = time.time() + float(timeout)
+    start_time = time.monotonic()
+    end_time = start_time + float(timeout)
+    polls = 0
+    timed_out = False
 
     time.sleep(first)
 
-    while time.time() < end_time:
-        if text:
-            LOG.debug("%s (%f secs)", text, (time.time() - start_time))
+    try:
+        while time.monotonic() < end_time:
+            if text:
+                LOG.debug("%s (%f secs)", text, (time.monotonic() - start_time))
 
-        try:
-            output = func()
-        except:  # pylint: disable=W0702
-            if not ignore_errors:
-                raise
-            else:
+            polls += 1
+            try:
+                output = func()
+            except:  # pylint: disable=W0702
+                if not ignore_errors:
+                    raise
+                else:
+                    LOG.debug("Ignoring error '%s'", sys.exc_info())
+                    output = None
+            if output:
+                return output
+
+            time.sleep(step)
+
+        timed_out = True
+        return None
+    finally:
+        _record_wait(sys._getframe(1), polls, time.monotonic() - start_time, timed_out)
+
+
+def _wait_for_wakeup(wakeup, delay):
+    """
+    Sleep for delay seconds, or until wakeup fires.
+
+    :param wakeup: threading.Event, file descriptor or object with a fileno()
+                   method, or None.
+    :param delay: Maximum time to sleep.
+    :return: True if woken up before delay.
+    """
+    if wakeup is None:
+        time.sleep(delay)
+        return False
+    if isinstance(wakeup, threading.Event):
+        # An event that is set already would never let us sleep
+        if wakeup.is_set():
+            time.sleep(delay)
+            return False
+        return wakeup.wait(delay)
+    return bool(select.select([wakeup], [], [], delay)[0])
+
+
+def wait_until(
+    func,
+    timeout,
+    first=0.0,
+    step=0.1,
+    max_step=2.0,
+    factor=2.0,
+    jitter=0.1,
+    wakeup=None,
+    text=None,
+    ignore_errors=False,
+):
+    """
+    Wait until func() evaluates to True, checking it often at first and
+    less and less often as time goes by.
+
+    The time between two checks starts at step and is multiplied by factor
+    after each check, up to max_step, with a random jitter so concurrent
+    waiters don't check in lockstep. The deadline follows the monotonic
+    clock, so it is not moved by changes of the system time.
+
+    :param func: Function to call.
+    :param timeout: Timeout in seconds.
+    :param first: Time to sleep before the first check.
+    :param step: Time to sleep after the first check.
+    :param max_step: Maximum time to sleep between two checks.
+    :param factor: Growth factor of the time between two checks.
+    :param jitter: Maximum fraction of the sleep time added or removed at
+                   random.
+    :param wakeup: threading.Event set, or file descriptor (or object with a
+                   fileno() method) readable, when func() may have changed, to
+                   check it right away instead of sleeping on. After a
+                   wakeup, the next sleep ignores wakeup, so a source that
+                   stays ready doesn't make the wait busy.
+    :param text: Text to print while waiting, for debug purposes.
+    :param ignore_errors: If True, log any error and retry.
+    :return: The value of func(), or None if it didn't evaluate to True
+             before timeout.
+    """
+    start_time = time.monotonic()
+    end_time = start_time + float(timeout)
+    polls = 0
+    timed_out = False
+    delay = step
+    woken = False
+
+    time.sleep(first)
+
+    try:
+        while True:
+            if text:
+                LOG.debug("%s (%f secs)", text, (time.monotonic() - start_time))
+
+            polls += 1
+            try:
+                output = func()
+            except:  # pylint: disable=W0702
+                if not ignore_errors:
+                    raise
                 LOG.debug("Ignoring error '%s'", sys.exc_info())
                 output = None
-        if output:
-            return output
-
-        time.sleep(step)
+            if output:
+                return output
 
-    return None
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                return None
+            sleep = delay * (1 + random.uniform(-jitter, jitter))
+            sleep = max(0, min(sleep, remaining))
+            woken = _wait_for_wakeup(None if woken else wakeup, sleep)
+            delay = min(delay * factor, max_step)
+    finally:
+        _record_wait(sys._getframe(1), polls, time.monotonic() - start_time, timed_out)
 
 
 def get_hash_from_file(hash_path, dvd_basename):
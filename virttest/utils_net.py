@@ -13,6 +13,7 @@ import shelve
 import shutil
 import signal
 import socket
+import sqlite3
 import struct
 import sys
 import time
@@ -3155,11 +3156,27 @@ class DbNet(VMNet):
             VMNet.__init__(self, self.container_class, entry)
         # Assume self.update_db() called elsewhere
 
+    # Suffixes the dbm backends behind shelve may append to db_filename
+    DB_FILE_SUFFIXES = ("", ".db", ".dat", ".dir", ".pag")
+
     def lock_db(self):
         if not hasattr(self, "lock"):
             self.lock = utils_misc.lock_file(self.db_lockfile)
             if not hasattr(self, "db"):
-                self.db = shelve.open(self.db_filename)
+                try:
+                    self.db = shelve.open(self.db_filename)
+                    self.open_index()
+                except Exception:
+                    # Don't leave the db locked for the next allocations
+                    if hasattr(self, "index_db"):
+                        self.index_db.close()
+                        del self.index_db
+                    if hasattr(self, "db"):
+                        self.db.close()
+                        del self.db
+                    utils_misc.unlock_file(self.lock)
+                    del self.lock
+                    raise
             else:
                 raise DbNoLockError
         else:
@@ -3169,6 +3186,7 @@ class DbNet(VMNet):
         if hasattr(self, "db"):
             self.db.close()
             del self.db
+            self.close_index()
             if hasattr(self, "lock"):
                 utils_misc.unlock_file(self.lock)
                 del self.lock
@@ -3219,12 +3237,14 @@ class DbNet(VMNet):
                 self.db[self.db_key] = data
             except AttributeError:
                 raise DbNoLockError
+            self.index_entry(self.db_key, [nic.get("mac") for nic in self])
         else:
             try:
                 # make sure old db entry is removed
                 del self.db[db_key]
             except KeyError:
                 pass
+            self.index_entry(db_key, [])
 
     def update_db(self):
         self.lock_db()
@@ -3244,9 +3264,124 @@ class DbNet(VMNet):
         except AttributeError:
             raise DbNoLockError
 
+    def db_signature(self):
+        """
+        Return a string identifying the current on-disk state of the database
+        """
+        signature = []
+        for suffix in self.DB_FILE_SUFFIXES:
+            try:
+                stat = os.stat(self.db_filename + suffix)
+            except OSError:
+                continue
+            signature.append(
+                "%s:%d:%d:%d" % (suffix, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            )
+        return ",".join(signature)
+
+    def open_index(self):
+        """
+        Open the MAC -> db_key index of the locked database.
+
+        The index is rebuilt from the database entries whenever the database
+        was changed without updating it, e.g. a pool written by an older
+        version or a database file replaced behind our back.
+
+        The index is only a mirror of the database, so it is written without
+        syncing it to disk, and recreated if it got corrupted.
+        """
+        index_filename = self.db_filename + ".index"
+        try:
+            row = self._connect_index(index_filename)
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError as details:
+            LOG.warning("Recreating mac address index %s: %s", index_filename, details)
+            self.index_db.close()
+            os.unlink(index_filename)
+            row = self._connect_index(index_filename)
+        self.index_dirty = False
+        if row is None or row[0] != self.db_signature():
+            LOG.debug("Rebuilding mac address index of %s", self.db_filename)
+            self.index_db.execute("DELETE FROM macs")
+            for db_key in list(self.db.keys()):
+                try:
+                    entry = self.db_entry(db_key)
+                except ValueError:
+                    continue
+                self.index_entry(db_key, [nic.get("mac") for nic in entry])
+            self.index_dirty = True
+
+    def _connect_index(self, index_filename):
+        """
+        Connect to the index, creating its tables when missing.
+
+        :return: Row holding the database signature the index matches.
+        """
+        self.index_db = sqlite3.connect(index_filename)
+        self.index_db.execute("PRAGMA synchronous = OFF")
+        self.index_db.execute("PRAGMA journal_mode = MEMORY")
+        self.index_db.execute(
+            "CREATE TABLE IF NOT EXISTS macs "
+            "(mac TEXT, db_key TEXT, PRIMARY KEY (mac, db_key))"
+        )
+        self.index_db.execute("CREATE INDEX IF NOT EXISTS macs_db_key ON macs (db_key)")
+        self.index_db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        return self.index_db.execute(
+            "SELECT value FROM meta WHERE name = 'signature'"
+        ).fetchone()
+
+    def close_index(self):
+        """
+        Record the database state the index matches and close it
+        """
+        if not hasattr(self, "index_db"):
+            return
+        if self.index_dirty:
+            self.index_db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('signature', ?)",
+                (self.db_signature(),),
+            )
+        self.index_db.commit()
+        self.index_db.close()
+        del self.index_db
+
+    def index_entry(self, db_key, macs):
+        """
+        Replace the indexed mac addresses owned by db_key with macs
+        """
+        try:
+            self.index_db.execute("DELETE FROM macs WHERE db_key = ?", (db_key,))
+        except AttributeError:
+            raise DbNoLockError
+        self.index_db.executemany(
+            "INSERT OR REPLACE INTO macs VALUES (?, ?)",
+            [(mac.lower(), db_key) for mac in macs if mac],
+        )
+        self.index_dirty = True
+
+    def mac_owner(self, mac):
+        """
+        Return the db_key owning mac in the locked database, or None
+
+        :param mac: MAC address string
+        """
+        try:
+            row = self.index_db.execute(
+                "SELECT db_key FROM macs WHERE mac = ?", (mac.lower(),)
+            ).fetchone()
+        except AttributeError:
+            raise DbNoLockError
+        if row is None:
+            return None
+        return row[0]
+
 
 ADDRESS_POOL_FILENAME = os.path.join(data_dir.get_tmp_dir(), "address_pool")
 ADDRESS_POOL_LOCK_FILENAME = ADDRESS_POOL_FILENAME + ".lock"
+ADDRESS_POOL_INDEX_FILENAME = ADDRESS_POOL_FILENAME + ".index"
 
 
 def clean_tmp_files():
@@ -3255,6 +3390,8 @@ def clean_tmp_files():
     """
     if os.path.isfile(ADDRESS_POOL_LOCK_FILENAME):
         os.unlink(ADDRESS_POOL_LOCK_FILENAME)
+    if os.path.isfile(ADDRESS_POOL_INDEX_FILENAME):
+        os.unlink(ADDRESS_POOL_INDEX_FILENAME)
     if os.path.isfile(ADDRESS_POOL_FILENAME):
         os.unlink(ADDRESS_POOL_FILENAME)
 
@@ -3346,18 +3483,19 @@ class VirtNet(DbNet, ParamsNet):
                 % (nic.mac, str(nic_index_or_name))
             )
         self.free_mac_address(nic_index_or_name)
-        attempts_remaining = attempts
-        while attempts_remaining > 0:
-            mac_attempt = nic.complete_mac_address(self.mac_prefix)
-            self.lock_db()
-            if mac_attempt not in self.mac_index():
-                nic.mac = mac_attempt.lower()
-                self.unlock_db()
-                self.update_db()
-                return self[nic_index_or_name].mac
-            else:
-                attempts_remaining -= 1
-                self.unlock_db()
+        params_macs = set(mac.lower() for mac in ParamsNet.mac_index(self))
+        self.lock_db()
+        try:
+            for _ in xrange(attempts):
+                mac_attempt = nic.complete_mac_address(self.mac_prefix).lower()
+                if mac_attempt in params_macs:
+                    continue
+                if self.mac_owner(mac_attempt) is None:
+                    nic.mac = mac_attempt
+                    self.save_to_db()
+                    return self[nic_index_or_name].mac
+        finally:
+            self.unlock_db()
         raise NetError(
             "%s/%s MAC generation failed with prefix %s after %d "
             "attempts for NIC %s on VM %s (%s)"
@@ -3468,6 +3606,133 @@ def parse_arp(session=None, timeout=60.0, **dargs):
     return ret
 
 
+def _netlink_request(msgtype, flags, data, timeout=5.0):
+    """
+    Send a single rtnetlink request and collect the kernel replies
+
+    :param msgtype: Message type, e.g. RTM_GETNEIGH
+    :param flags: Flag bits in addition to NLM_F_REQUEST
+    :param data: Payload following the netlink message header
+    :param timeout: Socket timeout in seconds
+    :return: list of (msgtype, payload) replies
+    :raise OSError: if the request fails or the kernel reports an error
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, arch.NETLINK_ROUTE)
+    sock.settimeout(timeout)
+    seq = random.randint(1, 0x7FFFFFFF)
+    replies = []
+    try:
+        sock.bind((0, 0))
+        header = struct.pack(
+            "IHHII", 16 + len(data), msgtype, arch.NLM_F_REQUEST | flags, seq, 0
+        )
+        sock.send(header + data)
+        while True:
+            buf = sock.recv(65536)
+            while len(buf) >= 16:
+                length, rtype, _, rseq, _ = struct.unpack("IHHII", buf[:16])
+                if length < 16 or length > len(buf):
+                    raise OSError(errno.EBADMSG, "Truncated netlink message")
+                payload = buf[16:length]
+                # Netlink messages are aligned to 4 bytes
+                buf = buf[(length + 3) & ~3 :]
+                if rseq != seq:
+                    continue
+                if rtype == arch.NLMSG_DONE:
+                    return replies
+                if rtype == arch.NLMSG_ERROR:
+                    (err_no,) = struct.unpack("i", payload[:4])
+                    if err_no:
+                        raise OSError(-err_no, os.strerror(-err_no))
+                    return replies
+                replies.append((rtype, payload))
+            if not flags & arch.NLM_F_DUMP:
+                return replies
+    finally:
+        sock.close()
+
+
+def _netlink_attrs(data):
+    """
+    Parse the rtnetlink attributes in data
+
+    :param data: Attribute area of an rtnetlink message
+    :return: dict mapping attribute type to its raw value
+    """
+    attrs = {}
+    while len(data) >= 4:
+        length, attr_type = struct.unpack("HH", data[:4])
+        if length < 4:
+            break
+        attrs[attr_type] = data[4:length]
+        data = data[(length + 3) & ~3 :]
+    return attrs
+
+
+def netlink_route_devs(ip):
+    """
+    Get the names of the host interfaces routing to ip, like `ip route get`
+
+    :param ip: IPv4 or IPv6 address string
+    :return: set of interface names
+    :raise OSError: if the route lookup fails
+    """
+    addr = pyipaddr.ip_address(ip)
+    family = socket.AF_INET6 if addr.version == 6 else socket.AF_INET
+    rtmsg = struct.pack("BBBBBBBBI", family, addr.max_prefixlen, 0, 0, 0, 0, 0, 0, 0)
+    rtattr = struct.pack("HH", 4 + len(addr.packed), arch.RTA_DST) + addr.packed
+    devs = set()
+    for msgtype, payload in _netlink_request(arch.RTM_GETROUTE, 0, rtmsg + rtattr):
+        if msgtype != arch.RTM_NEWROUTE:
+            continue
+        oif = _netlink_attrs(payload[12:]).get(arch.RTA_OIF)
+        if oif:
+            devs.add(socket.if_indextoname(struct.unpack("i", oif[:4])[0]))
+    return devs
+
+
+def netlink_neigh_table(ip_ver=4, devs=None, states=None):
+    """
+    Dump the resolved entries of the host neighbour (ARP/NDP) table
+
+    :param ip_ver: IP version of the entries, 4 or 6
+    :param devs: Only report entries on these interface names if given
+    :param states: Only report entries in one of these NUD_* states (bit
+                   mask) if given
+    :return: dict mapping IP address string to lower case MAC address
+    :raise OSError: if the dump request fails
+    """
+    family = socket.AF_INET6 if int(ip_ver) == 6 else socket.AF_INET
+    ifindexes = None
+    if devs:
+        ifindexes = set()
+        for dev in devs:
+            try:
+                ifindexes.add(socket.if_nametoindex(dev))
+            except OSError:
+                continue
+    ndmsg = struct.pack("BBHiHBB", family, 0, 0, 0, 0, 0, 0)
+    table = {}
+    for msgtype, payload in _netlink_request(arch.RTM_GETNEIGH, arch.NLM_F_DUMP, ndmsg):
+        if msgtype != arch.RTM_NEWNEIGH:
+            continue
+        _, _, _, ifindex, state, _, _ = struct.unpack("BBHiHBB", payload[:12])
+        if ifindexes is not None and ifindex not in ifindexes:
+            continue
+        if not state or state & (arch.NUD_INCOMPLETE | arch.NUD_FAILED):
+            continue
+        if states is not None and not state & states:
+            continue
+        attrs = _netlink_attrs(payload[12:])
+        dst = attrs.get(arch.NDA_DST)
+        lladdr = attrs.get(arch.NDA_LLADDR)
+        if not dst or not lladdr or len(lladdr) != 6:
+            continue
+        ip = str(pyipaddr.ip_address(dst))
+        table[ip] = ":".join("%02x" % byte for byte in bytearray(lladdr))
+    return table
+
+
 def verify_ip_address_ownership(ip, macs, timeout=60.0, devs=None, session=None):
     """
     Make sure a given IP address belongs to one of the given
@@ -3529,6 +3794,23 @@ def verify_ip_address_ownership(ip, macs, timeout=60.0, devs=None, session=None)
 
     ip_ver = pyipaddr.ip_address(ip).version
 
+    if not session:
+        # Ask the kernel directly first, a confirmed neighbour entry is
+        # enough and saves spawning ip/arping for every address lookup. A
+        # stale entry may belong to a former owner of the address, those are
+        # verified the usual way
+        try:
+            if not devs:
+                devs = netlink_route_devs(ip)
+            neigh_mac = netlink_neigh_table(
+                ip_ver, devs, arch.NUD_REACHABLE | arch.NUD_PERMANENT
+            ).get(str(pyipaddr.ip_address(ip)))
+        except (OSError, ValueError) as details:
+            LOG.debug("Netlink neighbour lookup of %s failed: %s", ip, details)
+        else:
+            if neigh_mac and neigh_mac in [mac.lower() for mac in macs]:
+                return True
+
     func = process.getoutput
     dargs = dict()
     if session:
@@ -1,3 +1,6 @@
+import copy
+import hashlib
+from contextlib import contextmanager
 from threading import Lock
 
 try:
@@ -200,3 +203,106 @@ class Params(IterableUserDict):
         return Params(
             {key: value for key, value in self.items() if not key.startswith("_")}
         )
+
+
+class ParamsRecord(object):
+    """
+    The parameters read from a Params object, see :py:func:`record_access`.
+    """
+
+    def __init__(self):
+        # Keys read or looked up
+        self.keys = set()
+        # Objects whose params were derived with object_params()
+        self.objects = []
+        # Whether the keys were iterated
+        self.iterated = False
+        self.active = True
+        # Recording params and their original classes, while active
+        self._recording = []
+
+    def fingerprint(self, params):
+        """
+        Get a digest of the recorded parameters of a dict-like object.
+
+        Two params with the same fingerprint provide the same values to the
+        code that was recorded.
+
+        :param params: dict-like object
+        :return: hex digest of the recorded parameters
+        """
+        items = [(key, key in params, params.get(key)) for key in sorted(self.keys)]
+        for obj_name in self.objects:
+            suffix = "_" + obj_name
+            items.append([(k, v) for k, v in params.items() if k.endswith(suffix)])
+        if self.iterated:
+            items.append(sorted(params.keys()))
+        return hashlib.sha1(repr(items).encode("utf-8", "replace")).hexdigest()
+
+
+class _RecordingParams(Params):
+    """
+    Params storing the parameters read into a ParamsRecord.
+    """
+
+    def __getitem__(self, key):
+        if self._record.active:
+            self._record.keys.add(key)
+        return Params.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if self._record.active:
+            self._record.keys.add(key)
+        return Params.__contains__(self, key)
+
+    def __iter__(self):
+        if self._record.active:
+            self._record.iterated = True
+        return Params.__iter__(self)
+
+    def copy(self):
+        new_dict = copy.copy(self)
+        new_dict.data = self.data.copy()
+        # Copies and derived params record too, until the end of the context
+        recording = self._record._recording
+        recording.append((new_dict, recording[0][1]))
+        return new_dict
+
+    def object_params(self, obj_name):
+        # The derived params depend on all the keys with the object suffix
+        record = self._record
+        if record.active and obj_name not in record.objects:
+            record.objects.append(obj_name)
+        active, record.active = record.active, False
+        try:
+            return Params.object_params(self, obj_name)
+        finally:
+            record.active = active
+
+
+@contextmanager
+def record_access(params):
+    """
+    Record the parameters read from params, and from the params derived from
+    it, within the context.
+
+    :param params: Params object
+    :return: yields a ParamsRecord, or None when params is not a Params
+             object and can't be recorded
+    """
+    if not isinstance(params, Params):
+        yield None
+        return
+    record = ParamsRecord()
+    record._recording.append((params, params.__class__))
+    params.__class__ = _RecordingParams
+    params._record = record
+    try:
+        yield record
+    finally:
+        record.active = False
+        # Params copied or derived within the context are plain params again
+        for recording_params, params_class in record._recording:
+            recording_params.__class__ = params_class
+            del recording_params._record
+        del record._recording[:]
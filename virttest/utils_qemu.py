@@ -3,7 +3,13 @@ QEMU related utility functions.
 """
 
 import json
+import os
 import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
 
 from avocado.utils import process
 
@@ -31,6 +37,81 @@ def _get_info(bin_path, options, include_stderr=False):
     return output
 
 
+def execute_qmp_commands(bin_path, commands, options="", timeout=10):
+    """
+    Execute QMP commands in a single session of a paused qemu
+
+    The qemu is started with no devices, and the commands are sent over one
+    QMP socket once qemu is ready to answer them.
+
+    :param bin_path: Path to qemu binary
+    :param commands: List of (command, arguments) tuples, the arguments can
+                     be None
+    :param options: Additional qemu options
+    :param timeout: Timeout of the whole session
+    :return: List with the return of every command, None for the commands
+             that failed
+    """
+    results = [None] * len(commands)
+    tmp_dir = tempfile.mkdtemp(prefix="qmp-")
+    sock_path = os.path.join(tmp_dir, "qmp.sock")
+    qemu_cmd = "%s %s -nodefaults -display none -S -qmp unix:%s,server=on,wait=off" % (
+        bin_path,
+        options,
+        sock_path,
+    )
+    qemu = subprocess.Popen(
+        qemu_cmd,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + timeout
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        while True:
+            try:
+                sock.connect(sock_path)
+                break
+            except socket.error:
+                if qemu.poll() is not None or time.time() > deadline:
+                    return results
+                time.sleep(0.05)
+        sock.settimeout(max(deadline - time.time(), 0.1))
+        reader = sock.makefile("rb")
+
+        def execute(cmd_id, command, arguments=None):
+            request = {"execute": command, "id": cmd_id}
+            if arguments:
+                request["arguments"] = arguments
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            while True:
+                line = reader.readline()
+                if not line:
+                    raise EOFError("QMP socket closed by qemu")
+                response = json.loads(line.decode(errors="replace"))
+                # Skip the greeting and the events
+                if response.get("id") == cmd_id:
+                    return response.get("return")
+
+        execute("capabilities", "qmp_capabilities")
+        for index, (command, arguments) in enumerate(commands):
+            results[index] = execute(index, command, arguments)
+        execute("quit", "quit")
+    except (socket.error, EOFError, ValueError):
+        pass
+    finally:
+        sock.close()
+        try:
+            qemu.wait(max(deadline - time.time(), 1))
+        except subprocess.TimeoutExpired:
+            qemu.kill()
+            qemu.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
 def get_qemu_version(bin_path):
     """
     Return normalized qemu version and package version
@@ -145,19 +226,9 @@ def get_maxcpus_hard_limit(bin_path, machine_type):
     :raise ValueError: If unable to get that
     :return: Maximum value of vCPU
     """
-    # TODO: Extract the process of executing QMP as a separate method
-    output = process.run(
-        "echo -e '"
-        '{ "execute": "qmp_capabilities" }\n'
-        '{ "execute": "query-machines", "id": "TEMP-INST" }\n'
-        '{ "execute": "quit" }\''
-        "| %s -M none -nodefaults -nographic -S -qmp stdio "
-        "| grep return | grep TEMP-INST" % bin_path,
-        ignore_status=True,
-        shell=True,
-        verbose=False,
-    ).stdout_text
-    machines = json.loads(output)["return"]
+    machines = execute_qmp_commands(bin_path, [("query-machines", None)], "-M none")[0]
+    if machines is None:
+        raise ValueError("Could not get the machines supported by %s" % bin_path)
     try:
         machines_info = {machine.pop("name"): machine for machine in machines}
         return machines_info[machine_type]["cpu-max"]
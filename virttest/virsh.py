@@ -21,6 +21,7 @@ for non-existant keys.
 :copyright: 2012 Red Hat Inc.
 """
 
+import atexit
 import base64
 import inspect
 import locale
@@ -29,6 +30,7 @@ import os
 import re
 import select
 import signal
+import threading
 import time
 import weakref
 from functools import wraps
@@ -55,6 +57,9 @@ NOCLOSE = list(globals().keys()) + [
     "Virsh",
     "VirshPersistent",
     "VirshConnectBack",
+    "VirshSessionPool",
+    "VIRSH_SESSION_POOL",
+    "DomainStateCache",
     "VIRSH_COMMAND_GROUP_CACHE",
     "VIRSH_COMMAND_GROUP_CACHE_NO_DETAIL",
 ]
@@ -659,6 +664,171 @@ class VirshConnectBack(VirshPersistent):
         return True not in all_false
 
 
+class VirshSessionPool(object):
+    """
+    Long-lived virsh sessions shared by the module functions.
+
+    Sessions are kept per virsh executable and URI. A session runs the
+    commands of one caller at a time, at most ``size`` sessions are spawned
+    for a URI and further callers wait for one to be released. A session
+    that stops responding or loses its connection (e.g. libvirtd restarted)
+    is thrown away, the command runs in a new virsh process instead and the
+    next call spawns a new session.
+
+    The results differ from the ones of a virsh process: virsh only reports
+    errors through its output in a session, so the exit status is guessed
+    from the "error:" lines and stdout holds stderr as well. Hence the pool
+    is disabled unless ``virsh_session_pool = yes``.
+    """
+
+    #: virsh commands run in the pool: read-only queries, polled by the wait
+    #: loops, whose callers don't need stdout and stderr apart
+    COMMANDS = ("list", "domstate", "domid", "domuuid", "domname", "dominfo", "dumpxml")
+    #: Errors reported by a session whose connection is lost
+    DISCONNECTED_REGEX = (
+        r"^error: (Disconnected from|failed to connect to the hypervisor|"
+        r"End of file while reading data|internal error: client socket is closed)"
+    )
+    #: Seconds to wait before spawning a session again after a failure
+    SPAWN_RETRY_DELAY = 30
+    #: Timeout of the pooled commands called without one, a command timing
+    #: out is not run again
+    DEFAULT_TIMEOUT = 60
+
+    def __init__(self, size=2):
+        """
+        :param size: Maximum number of sessions per virsh executable and URI.
+        """
+        self.size = size
+        self.enabled = False
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        # Sessions of the parent process are not ours to use or close
+        self._pid = os.getpid()
+        self._idle = {}
+        self._spawned = {}
+        self._spawn_failed = {}
+
+    def can_run(self, cmd, uri=None):
+        """
+        Tell whether a command is run in the pool.
+
+        :param cmd: virsh command line, without the virsh executable.
+        :param uri: libvirt URI of the command.
+        """
+        if not self.enabled:
+            return False
+        args = cmd.split()
+        if not args or args[0] not in self.COMMANDS:
+            return False
+        # Local URIs only, the sessions can't answer authentication prompts
+        if uri and not uri.partition("://")[2].startswith("/"):
+            return False
+        # The shell interpreting the command line is gone
+        return not re.search(r"[|&;<>`$]", cmd)
+
+    def _get(self, key):
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            while not self._idle.get(key):
+                if self._spawned.get(key, 0) < self.size:
+                    failed = self._spawn_failed.get(key, 0)
+                    if time.time() - failed < self.SPAWN_RETRY_DELAY:
+                        return None
+                    self._spawned[key] = self._spawned.get(key, 0) + 1
+                    break
+                self._cond.wait()
+            else:
+                return self._idle[key].pop()
+        virsh_exec, uri = key
+        try:
+            session = VirshSession(virsh_exec, uri, auto_close=True)
+            # Only trust the errors virsh itself reports
+            session.ERROR_REGEX_LIST = [r"^error:\s*.+$"]
+            return session
+        except (aexpect.ShellError, aexpect.ExpectError, OSError) as details:
+            LOG.debug("Can't start a virsh session for %s: %s", uri, details)
+            with self._cond:
+                self._spawned[key] -= 1
+                self._spawn_failed[key] = time.time()
+                self._cond.notify()
+            return None
+
+    def _put(self, key, session, broken=False):
+        with self._cond:
+            if self._pid == os.getpid():
+                if broken:
+                    self._spawned[key] -= 1
+                else:
+                    self._idle.setdefault(key, []).append(session)
+                self._cond.notify()
+        if broken:
+            session.close()
+
+    def run(self, cmd, uri=None, virsh_exec=VIRSH_EXEC, timeout=60):
+        """
+        Run a virsh command in a session of the pool.
+
+        :param cmd: virsh command line, without the virsh executable.
+        :param uri: libvirt URI to connect to.
+        :param virsh_exec: Path of the virsh executable.
+        :param timeout: Time to wait for the command to finish.
+        :return: CmdResult of the command, whose stderr holds the output of a
+                 failed command, or None if the command has to be run in a
+                 new virsh process.
+        """
+        key = (virsh_exec, uri)
+        session = self._get(key)
+        if session is None:
+            return None
+        try:
+            status, output = session.cmd_status_output(cmd, timeout=timeout)
+        except aexpect.ShellTimeoutError as details:
+            # The command did run, don't run it again
+            LOG.debug("Virsh command '%s' timed out after %ss", cmd, timeout)
+            self._put(key, session, broken=True)
+            result = process.CmdResult(cmd, "", details.output, -signal.SIGKILL)
+            result.interrupted = "timeout after %ss" % timeout
+            return result
+        except (aexpect.ShellError, aexpect.ExpectError) as details:
+            LOG.debug("Virsh session for %s stopped responding: %s", uri, details)
+            self._put(key, session, broken=True)
+            return None
+        if re.search(self.DISCONNECTED_REGEX, output, re.MULTILINE):
+            LOG.debug("Virsh session for %s lost its connection", uri)
+            self._put(key, session, broken=True)
+            return None
+        self._put(key, session)
+        if status:
+            return process.CmdResult(cmd, "", output, status)
+        return process.CmdResult(cmd, output, "", status)
+
+    def close(self):
+        """
+        Close the idle sessions.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+                return
+            sessions = []
+            for key, idle in self._idle.items():
+                self._spawned[key] -= len(idle)
+                sessions.extend(idle)
+                del idle[:]
+        for session in sessions:
+            session.close()
+
+
+# Sessions used by the module functions once enabled, VirshSessionPool.COMMANDS
+# run there unless they are called with use_pool=False
+VIRSH_SESSION_POOL = VirshSessionPool()
+atexit.register(VIRSH_SESSION_POOL.close)
+
+
 class EventNotFoundError(Exception):
     """
     Error when certain event cannot be found.
@@ -782,6 +952,246 @@ class EventTracker(object):
         return wrapper
 
 
+class DomainStateCache(object):
+    """
+    States of the domains of a local libvirt URI, read with virsh domstate
+    and kept until a 'virsh event --all --loop' consumer reports a lifecycle
+    event of the domain.
+
+    Waiters block until such an event arrives instead of polling. While the
+    consumer isn't running, states aren't kept and waiters poll.
+    """
+
+    #: Lifecycle events of the consumer, giving the domain name
+    EVENT_REGEX = r"event 'lifecycle' for domain '?(.+?)'?: \w+"
+    #: States of a dead domain, "" for a domain that doesn't exist
+    DEAD_STATES = ("shut off", "crashed", "no state", "")
+    #: Seconds the consumer runs before its events are trusted to be seen
+    READY_DELAY = 2
+    #: Seconds a state is kept without event, in case an event was missed
+    MAX_AGE = 60
+    #: Seconds to wait before starting the consumer again after it exited
+    RESTART_DELAY = 30
+    #: virsh commands changing domain states, the states they may have
+    #: changed are dropped without waiting for their events
+    STATE_COMMANDS = (
+        "create",
+        "destroy",
+        "dompmsuspend",
+        "dompmwakeup",
+        "managedsave",
+        "migrate",
+        "reboot",
+        "reset",
+        "restore",
+        "resume",
+        "save",
+        "shutdown",
+        "snapshot-revert",
+        "start",
+        "suspend",
+        "undefine",
+    )
+
+    _caches = {}
+    _caches_pid = None
+    _caches_lock = threading.Lock()
+
+    def __init__(self, uri=None):
+        """
+        :param uri: libvirt URI of the domains.
+        """
+        self.uri = uri
+        self._cond = threading.Condition()
+        self._states = {}
+        self._seq = 0
+        self._tail = None
+        self._started = 0
+        self._exited = 0
+
+    @classmethod
+    def get(cls, uri=None):
+        """
+        Return the cache of a URI, with its consumer running.
+
+        :param uri: libvirt URI of the domains.
+        :return: The DomainStateCache of uri, None for a remote URI.
+        """
+        if uri and not uri.partition("://")[2].startswith("/"):
+            return None
+        with cls._caches_lock:
+            if cls._caches_pid != os.getpid():
+                # Consumers of the parent process don't feed this one
+                cls._caches = {}
+                cls._caches_pid = os.getpid()
+            cache = cls._caches.get(uri)
+            if cache is None:
+                cache = cls._caches[uri] = cls(uri)
+        cache.start()
+        return cache
+
+    @classmethod
+    def command_run(cls, cmd, uri=None):
+        """
+        Drop the states kept for a URI after a virsh command that may have
+        changed them.
+
+        :param cmd: virsh command line, without the virsh executable.
+        :param uri: libvirt URI the command ran on, None for the default URI,
+                    which drops the states of every URI.
+        """
+        words = cmd.split(None, 1)
+        if not words or words[0] not in cls.STATE_COMMANDS:
+            return
+        with cls._caches_lock:
+            if cls._caches_pid != os.getpid():
+                return
+            if uri is None:
+                # The caches are keyed by the URIs of the VMs, whatever
+                # LIBVIRT_DEFAULT_URI or the libvirt config resolve to
+                caches = list(cls._caches.values())
+            else:
+                caches = [cls._caches[uri]] if uri in cls._caches else []
+        for cache in caches:
+            cache.invalidate()
+
+    @classmethod
+    def close_all(cls):
+        """
+        Stop the consumers of the caches of this process.
+        """
+        with cls._caches_lock:
+            if cls._caches_pid == os.getpid():
+                for cache in cls._caches.values():
+                    cache.stop()
+
+    def start(self):
+        """
+        Start the event consumer, unless it runs or exited recently.
+        """
+        with self._cond:
+            if self._tail is not None and self._tail.is_alive():
+                return
+            if time.time() - self._exited < self.RESTART_DELAY:
+                return
+            virsh_exec = VIRSH_EXEC
+            if self.uri:
+                virsh_exec += " -c '%s'" % self.uri
+            self._states.clear()
+            self._started = time.time()
+            self._tail = aexpect.Tail(
+                "%s event --all --loop" % virsh_exec,
+                auto_close=True,
+                output_func=self._handle_output,
+                termination_func=self._handle_termination,
+            )
+
+    def stop(self):
+        """
+        Stop the event consumer.
+        """
+        with self._cond:
+            tail, self._tail = self._tail, None
+            self._states.clear()
+            self._cond.notify_all()
+        if tail is not None:
+            tail.close()
+
+    def invalidate(self):
+        """
+        Drop the kept states, a state read before is not kept either.
+        """
+        with self._cond:
+            self._states.clear()
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _handle_output(self, line):
+        match = re.search(self.EVENT_REGEX, line)
+        if match:
+            with self._cond:
+                self._states.pop(match.group(1), None)
+                self._seq += 1
+                self._cond.notify_all()
+
+    def _handle_termination(self, status):
+        LOG.debug("virsh event consumer for %s exited (%s)", self.uri, status)
+        with self._cond:
+            self._exited = time.time()
+            self._states.clear()
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _is_ready(self):
+        return (
+            self._tail is not None
+            and self._exited < self._started
+            and time.time() - self._started >= self.READY_DELAY
+        )
+
+    def get_state(self, name):
+        """
+        Return the state of a domain, as printed by virsh domstate.
+
+        :param name: Domain name.
+        :return: The domain state, "" if the domain doesn't exist.
+        """
+        with self._cond:
+            entry = self._states.get(name)
+            if entry is not None and time.time() - entry[1] < self.MAX_AGE:
+                return entry[0]
+            seq = self._seq
+            ready = self._is_ready()
+        result = domstate(name, uri=self.uri)
+        state = ""
+        if not result.exit_status:
+            state = result.stdout_text.strip()
+        with self._cond:
+            # Don't keep a state that an event may have changed meanwhile
+            if ready and self._seq == seq:
+                self._states[name] = (state, time.time())
+        return state
+
+    def is_dead(self, name):
+        """
+        Return True if the domain is undefined or not started/dead.
+
+        :param name: Domain name.
+        """
+        return self.get_state(name) in self.DEAD_STATES
+
+    def wait(self, func, timeout):
+        """
+        Wait until func() evaluates to True, evaluating it again after every
+        lifecycle event.
+
+        :param func: Function checking domain states, typically with
+                     get_state().
+        :param timeout: Timeout in seconds.
+        :return: The value of func(), or None if it doesn't evaluate to True
+                 in time.
+        """
+        end_time = time.time() + timeout
+        while True:
+            with self._cond:
+                seq = self._seq
+            output = func()
+            if output:
+                return output
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return None
+            with self._cond:
+                if self._seq == seq:
+                    # Poll without events to wait for
+                    if not self._is_ready():
+                        remaining = min(remaining, 1)
+                    self._cond.wait(min(remaining, self.MAX_AGE))
+
+
+atexit.register(DomainStateCache.close_all)
+
+
 # virsh module functions follow (See module docstring for API) #####
 
 
@@ -789,11 +1199,28 @@ def command(cmd, **dargs):
     """
     Interface to cmd function as 'cmd' symbol is polluted.
 
+    When VIRSH_SESSION_POOL is enabled, the commands of
+    VirshSessionPool.COMMANDS run in one of its long-lived sessions, with
+    VirshSessionPool.DEFAULT_TIMEOUT when no timeout is given, unless
+    use_pool=False is passed. The domain states
+    kept by the DomainStateCache of the URI are dropped after a command of
+    DomainStateCache.STATE_COMMANDS.
+
     :param cmd: Command line to append to virsh command
     :param dargs: standardized virsh function API keywords
     :return: CmdResult object
     :raise: CmdError if non-zero exit status and ignore_status=False
     """
+    try:
+        return _command(cmd, **dargs)
+    finally:
+        DomainStateCache.command_run(cmd, dargs.get("uri", None))
+
+
+def _command(cmd, **dargs):
+    """
+    Run a virsh command, see :func:`command`.
+    """
 
     virsh_exec = dargs.get("virsh_exec", VIRSH_EXEC)
     uri = dargs.get("uri", None)
@@ -824,6 +1251,7 @@ def command(cmd, **dargs):
             LOG.error("Ignore the invalid timeout value: %s", timeout)
             timeout = None
 
+    ret = None
     if session:
         # Utilize persistent virsh session, not suit for readonly mode
         if readonly:
@@ -835,7 +1263,25 @@ def command(cmd, **dargs):
         )
         # Mark return value with session it came from
         ret.from_session_id = session_id
-    else:
+    elif (
+        dargs.get("use_pool", True)
+        and not (readonly or quiet or virsh_opt or unprivileged_user)
+        and VIRSH_SESSION_POOL.can_run(cmd, uri)
+    ):
+        # Reuse a long-lived virsh session of the pool
+        ret = VIRSH_SESSION_POOL.run(
+            cmd, uri, virsh_exec, timeout or VIRSH_SESSION_POOL.DEFAULT_TIMEOUT
+        )
+        if ret is not None:
+            ret.from_session_id = None
+            ret.stdout = ret.stdout_text
+            ret.stderr = ret.stderr_text
+            if not ignore_status and ret.exit_status:
+                raise process.CmdError(
+                    cmd, ret, "Virsh Command returned non-zero exit status"
+                )
+
+    if ret is None:
         # Normal call to run virsh command
         # Readonly mode
         if readonly:
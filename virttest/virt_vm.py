@@ -18,6 +18,7 @@ from six.moves import xrange
 from virttest import data_dir, error_context, ppm_utils
 from virttest import remote as remote_old
 from virttest import utils_logfile, utils_misc, utils_net, vt_console
+from virttest.utils_params import record_access
 
 LOG = logging.getLogger("avocado." + __name__)
 
@@ -675,13 +676,32 @@ class BaseVM(object):
         if not self.is_alive():
             return True
 
-        try:
-            need_restart = self.make_create_command() != self.make_create_command(
-                name, params, basedir
-            )
-        except Exception:
-            LOG.error(traceback.format_exc())
-            need_restart = True
+        # The fingerprint of the params the running command line depends on
+        # is enough to tell they match, without building any command line
+        params_record = getattr(self, "params_record", None)
+        if (
+            params_record is not None
+            and name == self.name
+            and basedir == getattr(self, "root_dir", None)
+            and params_record.fingerprint(params) == self.params_fingerprint
+        ):
+            LOG.debug("VM params fingerprint matches the requested one.")
+            need_restart = False
+        else:
+            try:
+                params_snapshot = params.copy()
+                current_command = self.make_create_command()
+                with record_access(params) as params_record:
+                    need_restart = current_command != self.make_create_command(
+                        name, params, basedir
+                    )
+                # Check the requested params by fingerprint from now on
+                if not need_restart and params_record is not None:
+                    self.params_record = params_record
+                    self.params_fingerprint = params_record.fingerprint(params_snapshot)
+            except Exception:
+                LOG.error(traceback.format_exc())
+                need_restart = True
         if need_restart:
             LOG.debug("VM params in env don't match requested, restarting.")
             return True
@@ -846,10 +866,17 @@ class BaseVM(object):
         if not ip_addr:
             raise VMIPAddressMissingError(mac, ip_version)
 
+        # Ownership verified on this host moments ago still holds
+        if not session and self.address_cache.is_verified(mac_pattern % mac, ip_addr):
+            return ip_addr
+
         devs = set([nic.netdst]) if "netdst" in nic else set()
-        if not utils_net.verify_ip_address_ownership(
+        if utils_net.verify_ip_address_ownership(
             ip_addr, [mac], devs=devs, session=session, timeout=timeout
         ):
+            if not session:
+                self.address_cache.mark_verified(mac_pattern % mac, ip_addr)
+        else:
             nic_params = self.params.object_params(nic.nic_name)
             pci_assignable = nic_params.get("pci_assignable") != "no"
 
@@ -1047,7 +1074,15 @@ class BaseVM(object):
             expected_dmesg=expected_guest_dmesg,
         )
 
-    def verify_bsod(self, scrdump_file):
+    def verify_bsod(self, scrdump_file, scrdump_hash=None):
+        """
+        Check whether a screendump of a windows guest shows a BSOD.
+
+        :param scrdump_file: Path of the screendump.
+        :param scrdump_hash: Average hash of the screendump, computed from
+                             it when not given.
+        :raise VMDeadKernelCrashError: If the screendump shows a BSOD.
+        """
         # For windows guest
         if (
             os.path.exists(scrdump_file)
@@ -1059,7 +1094,9 @@ class BaseVM(object):
                 data_dir.get_root_dir(), "shared", "deps", "bsod_img"
             )
             ref_img = utils_misc.get_path(bsod_base_dir, ref_img_path)
-            if ppm_utils.have_similar_img(scrdump_file, ref_img):
+            if ppm_utils.have_similar_img(
+                scrdump_file, ref_img, base_img_hash=scrdump_hash
+            ):
                 err_msg = "Windows Guest appears to have suffered a BSOD,"
                 err_msg += " please check %s against %s." % (scrdump_file, ref_img)
                 raise VMDeadKernelCrashError(err_msg)
@@ -1093,6 +1130,30 @@ class BaseVM(object):
         """
         return os.path.join(data_dir.get_tmp_dir(), "testlog-%s" % self.instance)
 
+    def _get_ssh_multiplexer(self):
+        """
+        Return the SSHMultiplexer sharing the ssh connections to the guest,
+        None if it isn't used.
+        """
+        if self.params.get("ssh_multiplexing", "no") != "yes":
+            return None
+        return remote_old.SSHMultiplexer(
+            data_dir.get_tmp_dir(),
+            self.instance,
+            int(self.params.get("ssh_control_persist", 600)),
+        )
+
+    def close_ssh_multiplexer(self):
+        """
+        Stop the shared ssh connections to the guest.
+
+        The masters only refuse new clients, the sessions opened through
+        them keep running until they are closed.
+        """
+        multiplexer = self._get_ssh_multiplexer()
+        if multiplexer is not None:
+            multiplexer.close()
+
     @error_context.context_aware
     def login(self, nic_index=0, timeout=LOGIN_TIMEOUT, username=None, password=None):
         """
@@ -1129,6 +1190,12 @@ class BaseVM(object):
         )
         log_filename = utils_logfile.get_log_filename(log_filename)
         log_function = utils_logfile.log_line
+        multiplexer = None
+        extra_cmdline = ""
+        if client == "ssh":
+            multiplexer = self._get_ssh_multiplexer()
+        if multiplexer is not None:
+            extra_cmdline = multiplexer.ssh_options(address, port, username)
         try:
             session = remote.remote_login(
                 client,
@@ -1142,8 +1209,12 @@ class BaseVM(object):
                 log_function,
                 timeout,
                 neigh_attach_if,
+                extra_cmdline=extra_cmdline,
             )
         except Exception:
+            # Don't let the next attempt reuse a broken master connection
+            if multiplexer is not None:
+                multiplexer.close(address, port, username)
             utils_logfile.close_log_file(log_filename)
             if os.path.exists(log_filename):
                 os.unlink(log_filename)
@@ -1347,22 +1418,47 @@ class BaseVM(object):
             utils_misc.generate_random_string(4),
         )
         log_function = utils_logfile.log_line
-        remote.copy_files_to(
-            address,
-            client,
-            username,
-            password,
-            port,
-            host_path,
-            guest_path,
-            limit=limit,
-            log_filename=log_filename,
-            log_function=log_function,
-            verbose=verbose,
-            timeout=timeout,
-            interface=neigh_attach_if,
-            filesize=filesize,
-        )
+        multiplexer = None
+        if client in ("scp", "rsync"):
+            multiplexer = self._get_ssh_multiplexer()
+        if multiplexer is None:
+            remote.copy_files_to(
+                address,
+                client,
+                username,
+                password,
+                port,
+                host_path,
+                guest_path,
+                limit=limit,
+                log_filename=log_filename,
+                log_function=log_function,
+                verbose=verbose,
+                timeout=timeout,
+                interface=neigh_attach_if,
+                filesize=filesize,
+            )
+        else:
+            try:
+                multiplexer.copy_files_to(
+                    address,
+                    client,
+                    username,
+                    password,
+                    port,
+                    host_path,
+                    guest_path,
+                    limit=limit,
+                    log_filename=log_filename,
+                    log_function=log_function,
+                    verbose=verbose,
+                    timeout=timeout,
+                    interface=neigh_attach_if,
+                    filesize=filesize,
+                )
+            except Exception:
+                multiplexer.close(address, port, username)
+                raise
         utils_logfile.close_log_file(log_filename)
 
     @error_context.context_aware
@@ -1407,22 +1503,47 @@ class BaseVM(object):
             utils_misc.generate_random_string(4),
         )
         log_function = utils_logfile.log_line
-        remote.copy_files_from(
-            address,
-            client,
-            username,
-            password,
-            port,
-            guest_path,
-            host_path,
-            limit=limit,
-            log_filename=log_filename,
-            log_function=log_function,
-            verbose=verbose,
-            timeout=timeout,
-            interface=neigh_attach_if,
-            filesize=filesize,
-        )
+        multiplexer = None
+        if client in ("scp", "rsync"):
+            multiplexer = self._get_ssh_multiplexer()
+        if multiplexer is None:
+            remote.copy_files_from(
+                address,
+                client,
+                username,
+                password,
+                port,
+                guest_path,
+                host_path,
+                limit=limit,
+                log_filename=log_filename,
+                log_function=log_function,
+                verbose=verbose,
+                timeout=timeout,
+                interface=neigh_attach_if,
+                filesize=filesize,
+            )
+        else:
+            try:
+                multiplexer.copy_files_from(
+                    address,
+                    client,
+                    username,
+                    password,
+                    port,
+                    guest_path,
+                    host_path,
+                    limit=limit,
+                    log_filename=log_filename,
+                    log_function=log_function,
+                    verbose=verbose,
+                    timeout=timeout,
+                    interface=neigh_attach_if,
+                    filesize=filesize,
+                )
+            except Exception:
+                multiplexer.close(address, port, username)
+                raise
         utils_logfile.close_log_file(log_filename)
 
     def _create_serial_console(self):